@@ -0,0 +1,106 @@
+from __future__ import unicode_literals
+import codecs
+import io
+import os
+import tarfile
+import time
+from converters.cache import write_json_file
+
+resources_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'tests', 'resources')
+obs_source_dir = os.path.join(resources_dir, 'master', 'obs')
+
+# the obs/status.txt file that OBSConverter reads from uwadmin
+obs_status = '''publish_date: 2016-10-03
+contributors: Door43 World Missions Community
+checking_level: 3
+comments: Benchmark
+version: 4
+checking_entity: Wycliffe Associates
+source_text: en
+source_text_version: 4
+'''
+
+
+def load_obs_corpus():
+    """
+    Returns the DokuWiki text of every page in the OBS test corpus, sorted by path.
+    :return: list of (path, text) tuples, the path is relative to the obs directory
+    """
+    pages = []
+    for root, dirs, files in os.walk(obs_source_dir):
+        for file_name in files:
+            if file_name.endswith('.txt'):
+                file_path = os.path.join(root, file_name)
+                with codecs.open(file_path, 'r', 'utf-8') as in_file:
+                    pages.append((os.path.relpath(file_path, obs_source_dir).replace(os.sep, '/'), in_file.read()))
+
+    return sorted(pages)
+
+
+def scale_corpus(texts, scale, unique=False):
+    """
+    Yields the pages of <texts> <scale> times over, so a large corpus is never held in memory.
+    :param list texts:
+    :param int scale:
+    :param bool unique: Add the copy number to each page, so no two pages are the same
+    """
+    for copy in range(scale):
+        for text in texts:
+            if unique and copy:
+                yield '{0}\n\n~~ copy {1} ~~'.format(text, copy)
+            else:
+                yield text
+
+
+def get_tq_path(index):
+    # every 10th page is an OBS question, the rest are Bible questions, 30 chapters to a book
+    if index % 10 == 0:
+        return 'obs/notes/questions/{0:06d}.txt'.format(index)
+
+    return 'bible/questions/comprehension/b{0:05d}/{1:02d}.txt'.format(index // 30, index % 30 + 1)
+
+
+def get_tw_path(index):
+    return 'obe/{0}/{1:06d}.txt'.format('kt' if index % 2 else 'other', index)
+
+
+def write_archive(file_name, texts, get_path):
+    """
+    Writes a tar.gz archive laid out like a source repository.
+    :param str|unicode file_name:
+    :param texts: The pages to put in the archive
+    :param get_path: A function that returns the path in the repository of the page with an index
+    :return: int The number of pages written
+    """
+    count = 0
+    with tarfile.open(file_name, 'w:gz') as tar:
+        for text in texts:
+            path = get_path(count)
+            count += 1
+            data = text.encode('utf-8')
+            info = tarfile.TarInfo('d43-en-master/' + path)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+    return count
+
+
+def write_obs_status(uwadmin_dir, lang_code='en'):
+    """
+    Writes the status file that OBSConverter reads, so it does not have to be downloaded.
+    :param str|unicode uwadmin_dir:
+    :param str|unicode lang_code:
+    """
+    status_dir = os.path.join(uwadmin_dir, lang_code, 'obs')
+    os.makedirs(status_dir)
+    with codecs.open(os.path.join(status_dir, 'status.txt'), 'w', 'utf-8') as out_file:
+        out_file.write(obs_status)
+
+
+def seed_language_cache(cache_dir):
+    """
+    Puts a fresh language catalog in <cache_dir>, so the converters do not download it.
+    :param str|unicode cache_dir:
+    """
+    write_json_file(os.path.join(cache_dir, 'langnames.json'), [{'lc': 'en', 'ang': 'English', 'ld': 'ltr'}])
+    write_json_file(os.path.join(cache_dir, 'langnames.json.meta'), {'time': time.time()})
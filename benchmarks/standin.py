@@ -0,0 +1,487 @@
+from __future__ import unicode_literals
+import gzip
+import hashlib
+import io
+import json
+import math
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+from benchmarks.corpus import obs_status
+from converters.batch import make_jobs, run_batch
+from converters.languages import configure_language_catalog
+from converters.obs_converter import OBSConverter
+from converters.page_index import PageIndex
+from converters.pool import DEFAULT_MAX_WORKERS
+from converters.state import git_blob_sha
+from converters.tw_converter import TWConverter
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    # noinspection PyUnresolvedReferences
+    from SocketServer import ThreadingMixIn
+    # noinspection PyUnresolvedReferences
+    from urlparse import parse_qs
+
+DEFAULT_PORT = 8766
+
+# the number of entries GitHub returns of a recursive tree, and of a directory listing
+GITHUB_TREE_LIMIT = 100000
+GITHUB_CONTENTS_LIMIT = 1000
+
+# the names the language catalog gives the languages, the others are named after their code
+language_names = {'en': 'English', 'fr': 'French', 'es': 'Spanish', 'pt-br': 'Brazilian Portuguese'}
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StandInServer(object):
+    """
+    A local stand-in for GitHub, door43 and the language catalog, to load-test the converters end to end on one
+    machine. Each directory in <repos_dir> is served as the git repository of the same name, so a corpus written by
+    CorpusGenerator to <repos_dir>/d43-en is converted from <url>/github.com/Door43/d43-en, see get_repo_url. The
+    repositories are served under /github.com/ so the converters take them for GitHub repositories.
+
+    * GET /repos/github.com/<owner>/<repo>/git/trees/<branch>, the recursive git tree, truncated past <tree_limit>
+      entries like GitHub does
+    * GET /repos/github.com/<owner>/<repo>/contents/<path>, the first <contents_limit> entries of a directory
+    * GET /github.com/<owner>/<repo>/raw/<branch>/<path> and /raw.githubusercontent.com/<owner>/<repo>/<branch>/<path>,
+      a file
+    * GET /github.com/<owner>/<repo>/archive/<branch>.tar.gz, the whole repository
+    * GET /exports/langnames.json, the language catalog, with a language for each repository named d43-<lang>
+    * GET /uwadmin/<lang>/obs/status.txt, the OBS status of a language
+    * POST /lib/exe/ajax.php, a door43pages query, answered from the pages of the repository of the language
+
+    The owner and the branch are ignored. The responses are gzipped when the client accepts it. Every response is
+    delayed by <latency> seconds, and with a <rate_limit> only that many requests are answered in each <rate_window>
+    seconds, the others get 429 with a Retry-After header.
+    """
+
+    tree_re = re.compile(r'^/repos/github\.com/[^/]+/([^/]+)/git/trees/[^/]+$')
+    contents_re = re.compile(r'^/repos/github\.com/([^/]+)/([^/]+)/contents(?:/(.*?))?/?$')
+    raw_re = re.compile(r'^/(?:github\.com/[^/]+/([^/]+)/raw|raw\.githubusercontent\.com/[^/]+/([^/]+))/[^/]+/(.+)$')
+    archive_re = re.compile(r'^/github\.com/[^/]+/([^/]+)/archive/([^/]+)\.tar\.gz$')
+    status_re = re.compile(r'^/uwadmin/([^/]+)/obs/status\.txt$')
+
+    def __init__(self, repos_dir, host='127.0.0.1', port=DEFAULT_PORT, latency=0, rate_limit=None, rate_window=60,
+                 tree_limit=GITHUB_TREE_LIMIT, contents_limit=GITHUB_CONTENTS_LIMIT):
+        """
+        :param str|unicode repos_dir: A directory with a checkout of each repository, ex. d43-en
+        :param str|unicode host: The address to listen on
+        :param int port: The port to listen on, 0 to pick a free one
+        :param int|float latency: The number of seconds to wait before each response
+        :param int rate_limit: The number of requests answered in each <rate_window>, None for no limit
+        :param int|float rate_window: Seconds
+        :param int tree_limit: The number of entries of a git tree returned before it is truncated
+        :param int contents_limit: The number of entries of a directory listing returned
+        """
+        self.repos_dir = repos_dir
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.tree_limit = tree_limit
+        self.contents_limit = contents_limit
+
+        # the git trees, archives and page indexes are built the first time they are requested
+        self.trees = {}
+        self.archives = {}
+        self.page_indexes = {}
+        self.build_lock = threading.Lock()
+
+        # the number of requests of each kind, see get_counts
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.window_start = time.time()
+        self.window_requests = 0
+
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+        self.server_thread = None
+
+    @property
+    def url(self):
+        return 'http://{0}:{1}'.format(*self.server.server_address[:2])
+
+    def get_repo_url(self, repo, owner='Door43'):
+        """
+        Returns the URL to give the converters for repository <repo>.
+        :param str|unicode repo: ex. d43-en
+        :param str|unicode owner:
+        :return: str|unicode
+        """
+        return '{0}/github.com/{1}/{2}'.format(self.url, owner, repo)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    # noinspection PyUnusedLocal
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        """
+        Serves on another thread.
+        """
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+
+    def serve_forever(self):
+        """
+        Serves on the calling thread until it is interrupted.
+        """
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+
+    def stop(self):
+        if self.server_thread is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server_thread = None
+
+    def count(self, kind):
+        with self.lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def get_counts(self):
+        """
+        Returns the number of requests of each kind, ex. {'raw': 1200, 'tree': 2, 'rate_limited': 15}.
+        :return: dict
+        """
+        with self.lock:
+            return dict(self.counts)
+
+    def check_rate_limit(self):
+        """
+        Counts a request against the rate limit.
+        :return: tuple (allowed, headers) The rate limit headers to send, like the GitHub API sends them
+        """
+        if not self.rate_limit:
+            return True, {}
+
+        with self.lock:
+            now = time.time()
+            if now - self.window_start >= self.rate_window:
+                self.window_start = now
+                self.window_requests = 0
+
+            self.window_requests += 1
+            reset = self.window_start + self.rate_window
+            allowed = self.window_requests <= self.rate_limit
+            headers = {'X-RateLimit-Limit': str(self.rate_limit),
+                       'X-RateLimit-Remaining': str(max(self.rate_limit - self.window_requests, 0)),
+                       'X-RateLimit-Reset': str(int(math.ceil(reset)))}
+
+        if not allowed:
+            headers['Retry-After'] = str(int(math.ceil(reset - now)))
+            self.count('rate_limited')
+
+        return allowed, headers
+
+    def get_repo_dir(self, repo):
+        repo_dir = os.path.join(self.repos_dir, repo)
+        if repo.startswith('.') or not os.path.isdir(repo_dir):
+            return None
+        return repo_dir
+
+    def get_tree(self, repo, repo_dir):
+        """
+        Returns the recursive git tree of a repository, as the GitHub API returns it.
+        :return: dict
+        """
+        with self.build_lock:
+            if repo not in self.trees:
+                entries = []
+                for path, file_name in iter_repo_files(repo_dir, include_dirs=True):
+                    if file_name is None:
+                        entries.append({'path': path, 'mode': '040000', 'type': 'tree',
+                                        'sha': hashlib.sha1(path.encode('utf-8')).hexdigest()})
+                    else:
+                        with io.open(file_name, 'rb') as in_file:
+                            data = in_file.read()
+                        entries.append({'path': path, 'mode': '100644', 'type': 'blob', 'sha': git_blob_sha(data),
+                                        'size': len(data)})
+
+                self.trees[repo] = {'sha': hashlib.sha1(repo.encode('utf-8')).hexdigest(),
+                                    'tree': entries[:self.tree_limit],
+                                    'truncated': len(entries) > self.tree_limit}
+
+            return self.trees[repo]
+
+    def get_contents(self, base_url, owner, repo, repo_dir, path):
+        """
+        Returns the listing of directory <path>, as the GitHub contents API returns it.
+        :return: list|None
+        """
+        directory = os.path.join(repo_dir, *path.split('/')) if path else repo_dir
+        if not os.path.isdir(directory):
+            return None
+
+        listing = []
+        for name in sorted(os.listdir(directory))[:self.contents_limit]:
+            if name.startswith('.'):
+                continue
+
+            item_path = '{0}/{1}'.format(path, name) if path else name
+            item = {'name': name, 'path': item_path,
+                    'url': '{0}/repos/github.com/{1}/{2}/contents/{3}'.format(base_url, owner, repo, item_path)}
+            file_name = os.path.join(directory, name)
+
+            if os.path.isdir(file_name):
+                item.update({'type': 'dir', 'sha': hashlib.sha1(item_path.encode('utf-8')).hexdigest(),
+                             'download_url': None})
+            else:
+                with io.open(file_name, 'rb') as in_file:
+                    data = in_file.read()
+                item.update({'type': 'file', 'sha': git_blob_sha(data), 'size': len(data),
+                             'download_url': '{0}/github.com/{1}/{2}/raw/master/{3}'.format(base_url, owner, repo,
+                                                                                          item_path)})
+            listing.append(item)
+
+        return listing
+
+    def get_archive(self, repo, repo_dir, branch):
+        """
+        Returns a tar.gz archive of a repository, with everything in a top-level directory like GitHub builds it.
+        :return: bytes
+        """
+        with self.build_lock:
+            if (repo, branch) not in self.archives:
+                buf = io.BytesIO()
+                with tarfile.open(fileobj=buf, mode='w:gz') as tar:
+                    for path, file_name in iter_repo_files(repo_dir):
+                        tar.add(file_name, '{0}-{1}/{2}'.format(repo, branch, path))
+                self.archives[(repo, branch)] = buf.getvalue()
+
+            return self.archives[(repo, branch)]
+
+    def get_languages(self):
+        """
+        Returns the language catalog, with a language for each repository named d43-<lang>.
+        :return: list
+        """
+        lang_codes = sorted(n[4:] for n in os.listdir(self.repos_dir) if n.startswith('d43-'))
+        return [{'lc': lc, 'ang': language_names.get(lc, lc), 'ld': 'ltr'} for lc in lang_codes]
+
+    def query_pages(self, namespace, query):
+        """
+        Answers a door43pages query from the pages of the repository of the language of <namespace>.
+        :return: list|None The [url, title] pairs, None if there is no repository for the language
+        """
+        lang_code = namespace.strip(':').split(':')[0]
+        repo_dir = self.get_repo_dir('d43-' + lang_code)
+        if repo_dir is None:
+            return None
+
+        with self.build_lock:
+            if lang_code not in self.page_indexes:
+                index = PageIndex([lang_code])
+                for path, file_name in iter_repo_files(repo_dir):
+                    if path.endswith('.txt'):
+                        with io.open(file_name, 'r', encoding='utf-8') as in_file:
+                            index.add('{0}:{1}'.format(lang_code, path[:-4].replace('/', ':')),
+                                      PageIndex.read_page(in_file.read()))
+                self.page_indexes[lang_code] = index
+
+            index = self.page_indexes[lang_code]
+
+        return index.query(namespace, query)
+
+    def route_get(self, path, headers):
+        """
+        Answers a GET request.
+        :param str|unicode path: The path, without the query string
+        :param headers: The request headers
+        :return: tuple (kind, status, headers, body)
+        """
+        base_url = 'http://{0}'.format(headers.get('Host') or self.url[7:])
+
+        match = self.tree_re.match(path)
+        if match:
+            repo_dir = self.get_repo_dir(match.group(1))
+            if repo_dir:
+                return 'tree', 200, {'Content-Type': 'application/json'}, \
+                    json.dumps(self.get_tree(match.group(1), repo_dir))
+
+        match = self.contents_re.match(path)
+        if match:
+            owner, repo, dir_path = match.groups()
+            repo_dir = self.get_repo_dir(repo)
+            listing = self.get_contents(base_url, owner, repo, repo_dir, dir_path or '') if repo_dir else None
+            if listing is not None:
+                return 'contents', 200, {'Content-Type': 'application/json'}, json.dumps(listing)
+
+        match = self.raw_re.match(path)
+        if match:
+            repo_dir = self.get_repo_dir(match.group(1) or match.group(2))
+            file_name = os.path.join(repo_dir, *match.group(3).split('/')) if repo_dir else None
+            if file_name and '..' not in match.group(3).split('/') and os.path.isfile(file_name):
+                with io.open(file_name, 'rb') as in_file:
+                    return 'raw', 200, {'Content-Type': 'text/plain; charset=utf-8'}, in_file.read()
+
+        match = self.archive_re.match(path)
+        if match:
+            repo_dir = self.get_repo_dir(match.group(1))
+            if repo_dir:
+                return 'archive', 200, {'Content-Type': 'application/x-gzip'}, \
+                    self.get_archive(match.group(1), repo_dir, match.group(2))
+
+        if path == '/exports/langnames.json':
+            body = json.dumps(self.get_languages())
+            etag = '"{0}"'.format(hashlib.sha1(body.encode('utf-8')).hexdigest())
+            if headers.get('If-None-Match') == etag:
+                return 'catalog', 304, {'ETag': etag}, b''
+            return 'catalog', 200, {'Content-Type': 'application/json', 'ETag': etag}, body
+
+        match = self.status_re.match(path)
+        if match and self.get_repo_dir('d43-' + match.group(1)):
+            return 'status', 200, {'Content-Type': 'text/plain; charset=utf-8'}, obs_status
+
+        return 'not_found', 404, {}, 'Not Found'
+
+    def route_post(self, path, body):
+        """
+        Answers a POST request.
+        :return: tuple (kind, status, headers, body)
+        """
+        if path == '/lib/exe/ajax.php':
+            form = parse_qs(body.decode('utf-8'))
+            namespace = form.get('data[requested_namespaces][]', [''])[0]
+            query = form.get('data[query][]', [''])[0]
+            results = self.query_pages(namespace, query) if form.get('call') == ['get_door43pagequery2'] else None
+            if results is not None:
+                return 'ajax', 200, {'Content-Type': 'application/json'}, json.dumps(results)
+
+        return 'not_found', 404, {}, 'Not Found'
+
+    def make_handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self.respond(lambda path: standin.route_get(path, self.headers))
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self.respond(lambda path: standin.route_post(path, body))
+
+            def respond(self, route):
+                if standin.latency:
+                    time.sleep(standin.latency)
+
+                allowed, headers = standin.check_rate_limit()
+                if allowed:
+                    kind, status, route_headers, body = route(self.path.split('?', 1)[0])
+                    standin.count(kind)
+                    headers.update(route_headers)
+                else:
+                    status, body = 429, 'API rate limit exceeded.'
+
+                if not isinstance(body, bytes):
+                    body = body.encode('utf-8')
+
+                if status == 200 and 'gzip' in self.headers.get('Accept-Encoding', '') and \
+                        headers.get('Content-Type') != 'application/x-gzip':
+                    buf = io.BytesIO()
+                    with gzip.GzipFile(fileobj=buf, mode='wb') as gz:
+                        gz.write(body)
+                    body = buf.getvalue()
+                    headers['Content-Encoding'] = 'gzip'
+
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            # noinspection PyShadowingBuiltins
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def iter_repo_files(repo_dir, include_dirs=False):
+    """
+    Yields the files of a repository checkout in the order of their paths, skipping the hidden ones such as .git.
+    :param str|unicode repo_dir:
+    :param bool include_dirs: Also yield the directories, with None for the file name
+    :return: Yields (path, file name) tuples
+    """
+    for root, dirs, files in os.walk(repo_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        rel_dir = os.path.relpath(root, repo_dir).replace(os.sep, '/')
+        prefix = '' if rel_dir == '.' else rel_dir + '/'
+
+        if include_dirs:
+            for name in dirs:
+                yield prefix + name, None
+
+        for name in sorted(f for f in files if not f.startswith('.')):
+            yield prefix + name, os.path.join(root, name)
+
+
+def use_standin(url):
+    """
+    Points the language catalog, the door43pages queries and the OBS status of the converters in this process, and
+    the processes it forks, at a StandInServer. The repositories are given to the converters, see get_repo_url.
+    :param str|unicode url: The URL of the server
+    """
+    configure_language_catalog(url + '/exports/langnames.json')
+    TWConverter.door43_url = url
+    OBSConverter.uwadmin_dir = url + '/uwadmin'
+
+
+def run_load_test(repos_dir, lang_codes, resources, out_dir, processes=1, max_workers=DEFAULT_MAX_WORKERS,
+                  source_archive=None, cache_dir=None, on_result=None, **server_settings):
+    """
+    Converts the repositories in <repos_dir> with a batch of converters that download everything from a
+    StandInServer, as they would from GitHub and door43.
+    :param str|unicode repos_dir: See StandInServer
+    :param list lang_codes: The languages to convert, each one from the repository d43-<lang>
+    :param list resources: obs, tq and/or tw
+    :param str|unicode out_dir:
+    :param int processes: The number of conversions to run at the same time
+    :param int max_workers: The number of files each conversion downloads at the same time
+    :param bool source_archive: True to download the archive of each repository instead of each file
+    :param str|unicode cache_dir: Where the converters keep data between runs, defaults to a new directory, so
+                                  nothing is reused from an earlier run
+    :param on_result: A function called with each BatchResult, see run_batch
+    :param server_settings: Other StandInServer arguments, ex. latency and rate_limit
+    :return: tuple (results, counts, seconds) The BatchResult of each job, the requests the server got, see
+             StandInServer.get_counts, and how long the batch took
+    """
+    temp_dir = None
+    if cache_dir is None:
+        cache_dir = temp_dir = tempfile.mkdtemp(prefix='standin_cache_')
+
+    server_settings.setdefault('port', 0)
+
+    try:
+        with StandInServer(repos_dir, **server_settings) as server:
+            use_standin(server.url)
+            jobs = make_jobs(lang_codes, resources, out_dir, server.get_repo_url('d43-{lang}'), source_archive,
+                             max_workers=max_workers, cache_dir=cache_dir)
+
+            start = time.time()
+            results = run_batch(jobs, processes, on_result)
+            return results, server.get_counts(), time.time() - start
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
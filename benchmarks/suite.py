@@ -0,0 +1,218 @@
+from __future__ import print_function, unicode_literals
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+from converters.common import dokuwiki_to_markdown, dokuwiki_to_markdown_cascade, quiet_print
+from converters.obs_converter import OBSConverter
+from converters.tq_converter import TQConverter
+from converters.tw_converter import TWConverter
+from benchmarks.corpus import load_obs_corpus, scale_corpus, write_archive, get_tq_path, get_tw_path, \
+    write_obs_status, seed_language_cache, resources_dir
+
+DEFAULT_TEXT_SCALES = (1, 10, 100, 1000)
+DEFAULT_RUN_SCALES = (1, 10)
+
+
+class BenchmarkSuite(object):
+    """
+    Times dokuwiki_to_markdown, the post-processing of each converter and complete converter runs on the OBS test
+    corpus and on copies of it scaled up to many times its size. Everything is read from local files, nothing is
+    downloaded.
+    """
+
+    def __init__(self, text_scales=DEFAULT_TEXT_SCALES, run_scales=DEFAULT_RUN_SCALES, repeat=3, quiet=False):
+        """
+        :param list text_scales: The corpus sizes, in copies of the OBS corpus, to convert text at
+        :param list run_scales: The corpus sizes to run the tQ and tW converters at
+        :param int repeat: Each benchmark is run this many times and the fastest time is kept
+        :param bool quiet:
+        """
+        self.text_scales = text_scales
+        self.run_scales = run_scales
+        self.repeat = repeat
+        self.quiet = quiet
+        self.results = []
+        self.temp_dir = None
+        self.cache_dir = None
+        self.texts = [text for path, text in load_obs_corpus()]
+        self.text_bytes = sum(len(text.encode('utf-8')) for text in self.texts)
+
+    def __enter__(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='benchmark_')
+        self.cache_dir = os.path.join(self.temp_dir, 'cache')
+        seed_language_cache(self.cache_dir)
+        return self
+
+    # noinspection PyUnusedLocal
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def run(self):
+        """
+        Runs all the benchmarks.
+        :return: dict The report, see make_report
+        """
+        markdown = [dokuwiki_to_markdown(text) for text in self.texts]
+        tq = self.make_converter(TQConverter, 'chains')
+        tw = self.make_converter(TWConverter, 'chains')
+
+        self.time_text('dokuwiki_to_markdown_cascade', dokuwiki_to_markdown_cascade, self.texts, [1])
+        self.time_text('dokuwiki_to_markdown', dokuwiki_to_markdown, self.texts, self.text_scales)
+        self.time_text('tq_bible_post_processing', tq.fix_bible_markdown, markdown, self.text_scales)
+        self.time_text('tq_obs_post_processing', tq.fix_obs_markdown, markdown, self.text_scales)
+        self.time_text('tw_post_processing', tw.fix_markdown, markdown, self.text_scales)
+
+        self.time_obs_run()
+        for scale in self.run_scales:
+            self.time_archive_run('tq_run', TQConverter, get_tq_path, scale)
+            self.time_archive_run('tw_run', TWConverter, get_tw_path, scale)
+            self.time_archive_run('tw_run_zip', TWConverter, get_tw_path, scale, output_format='zip')
+            self.time_archive_run('tw_run_processes', TWConverter, get_tw_path, scale, processes=2)
+            self.time_archive_run('tw_run_unchanged', TWConverter, get_tw_path, scale, rerun=True)
+            self.time_archive_run('tw_run_cached', TWConverter, get_tw_path, scale, warm_cache=True)
+
+        return make_report(self.results)
+
+    def make_converter(self, converter_class, name, source_archive=None, conversion_cache=False, **kwargs):
+        """
+        Returns a tQ or tW converter that writes to a new directory in the temp directory. The conversion cache is
+        not used unless it is asked for, so the repeated runs convert every file.
+        """
+        out_dir = os.path.join(self.temp_dir, name)
+        if converter_class is TQConverter:
+            return TQConverter('en', 'https://github.com/Door43/d43-en', os.path.join(out_dir, 'en_tq'),
+                               os.path.join(out_dir, 'en_obs-tq'), True, cache_dir=self.cache_dir,
+                               source_archive=source_archive or 'unused.tar.gz', conversion_cache=conversion_cache,
+                               **kwargs)
+
+        return TWConverter('en', 'https://github.com/Door43/d43-en', os.path.join(out_dir, 'en_tw'), True,
+                           cache_dir=self.cache_dir, source_archive=source_archive or 'unused.tar.gz',
+                           conversion_cache=conversion_cache, **kwargs)
+
+    def time_text(self, name, func, texts, scales):
+        """
+        Times calling <func> on each page of <texts>, at each of <scales>.
+        """
+        for scale in scales:
+            quiet_print(self.quiet, 'Timing {0} at {1}x...'.format(name, scale), end=' ')
+
+            def convert():
+                for text in scale_corpus(texts, scale):
+                    func(text)
+
+            seconds = min(self.time(convert) for _ in range(self.repeat))
+            self.add_result(name, scale, len(texts) * scale, self.text_bytes * scale, seconds)
+
+    def time_obs_run(self):
+        """
+        Times OBSConverter.run reading the OBS test corpus from file:// URLs.
+        """
+        quiet_print(self.quiet, 'Timing obs_run at 1x...', end=' ')
+        uwadmin_dir = os.path.join(self.temp_dir, 'uwadmin')
+        write_obs_status(uwadmin_dir)
+
+        def run():
+            out_dir = tempfile.mkdtemp(prefix='obs_', dir=self.temp_dir)
+            with OBSConverter('en', 'file://' + resources_dir + '/', out_dir, True, cache_dir=self.cache_dir,
+                              conversion_cache=False) as obs:
+                obs.uwadmin_dir = 'file://' + uwadmin_dir
+                obs.run()
+
+        seconds = min(self.time(run) for _ in range(self.repeat))
+
+        # the converter reads the 50 stories and the front and back matter
+        pages = ['{0:02d}.txt'.format(i) for i in range(1, 51)] + ['front-matter.txt', 'back-matter.txt']
+        size = sum(os.path.getsize(os.path.join(resources_dir, 'master', 'obs', p)) for p in pages)
+        self.add_result('obs_run', 1, len(pages), size, seconds)
+
+    def time_archive_run(self, name, converter_class, get_path, scale, rerun=False, warm_cache=False, **kwargs):
+        """
+        Times the run method of a tQ or tW converter reading a source archive built from the corpus.
+        :param bool rerun: Time running the converter again on its own output, when nothing has changed
+        :param bool warm_cache: Time converting to a new directory with the conversion cache filled by an earlier run
+        """
+        quiet_print(self.quiet, 'Timing {0} at {1}x...'.format(name, scale), end=' ')
+        archive = os.path.join(self.temp_dir, '{0}_{1}.tar.gz'.format(name, scale))
+        pages = write_archive(archive, scale_corpus(self.texts, scale, True), get_path)
+        runs = []
+
+        if warm_cache:
+            self.make_converter(converter_class, '{0}_{1}_warm'.format(name, scale), archive, True, **kwargs).run()
+
+        for index in range(self.repeat):
+            converter = self.make_converter(converter_class, '{0}_{1}_{2}'.format(name, scale, index), archive,
+                                            warm_cache, **kwargs)
+            if rerun:
+                converter.run()
+            runs.append(self.time(converter.run))
+
+        os.remove(archive)
+        self.add_result(name, scale, pages, self.text_bytes * scale, min(runs))
+
+    @staticmethod
+    def time(func):
+        start = timeit.default_timer()
+        func()
+        return timeit.default_timer() - start
+
+    def add_result(self, name, scale, pages, size, seconds):
+        result = {'name': name,
+                  'scale': scale,
+                  'pages': pages,
+                  'bytes': size,
+                  'seconds': seconds,
+                  'pages_per_second': pages / seconds if seconds else 0,
+                  'mb_per_second': size / seconds / 1000000 if seconds else 0}
+        self.results.append(result)
+        quiet_print(self.quiet, '{0:.0f} pages/s.'.format(result['pages_per_second']))
+
+
+def make_report(results):
+    """
+    Returns the benchmark results with a description of the machine they were measured on.
+    :param list results:
+    :return: dict
+    """
+    return {'created': datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'results': results}
+
+
+def compare_reports(baseline, current, threshold=0.1):
+    """
+    Returns the benchmarks that are more than <threshold> slower in <current> than in <baseline>.
+    :param dict baseline: A report from an earlier run
+    :param dict current:
+    :param float threshold: The fraction of the baseline throughput that may be lost
+    :return: list of (name, scale, baseline pages/s, current pages/s) tuples
+    """
+    before = dict(((r['name'], r['scale']), r['pages_per_second']) for r in baseline['results'])
+    regressions = []
+
+    for result in current['results']:
+        key = (result['name'], result['scale'])
+        if key in before and result['pages_per_second'] < before[key] * (1 - threshold):
+            regressions.append((result['name'], result['scale'], before[key], result['pages_per_second']))
+
+    return regressions
+
+
+def format_report(report):
+    """
+    Returns a table of the results in <report>.
+    :param dict report:
+    :return: str|unicode
+    """
+    lines = ['{0:<30} {1:>6} {2:>9} {3:>10} {4:>12} {5:>8}'.format('Benchmark', 'Scale', 'Pages', 'Seconds',
+                                                                    'Pages/s', 'MB/s')]
+    for r in report['results']:
+        lines.append('{0:<30} {1:>5}x {2:>9} {3:>10.3f} {4:>12.0f} {5:>8.2f}'.format(
+            r['name'], r['scale'], r['pages'], r['seconds'], r['pages_per_second'], r['mb_per_second']))
+
+    return '\n'.join(lines)
@@ -0,0 +1,227 @@
+from __future__ import unicode_literals
+import codecs
+import os
+import random
+
+# the words the pages are made of
+words = ['god', 'grace', 'faith', 'love', 'sin', 'law', 'covenant', 'temple', 'priest', 'prophet', 'king', 'kingdom',
+         'spirit', 'angel', 'altar', 'sacrifice', 'blood', 'lamb', 'shepherd', 'sheep', 'bread', 'wine', 'vine', 'fig',
+         'tree', 'water', 'river', 'sea', 'desert', 'mountain', 'city', 'gate', 'wall', 'house', 'tent', 'field',
+         'seed', 'harvest', 'servant', 'master', 'brother', 'sister', 'father', 'mother', 'son', 'daughter', 'people',
+         'nation', 'tribe', 'elder', 'judge', 'apostle', 'disciple', 'church', 'gospel', 'word', 'truth', 'light',
+         'darkness', 'life', 'death', 'heaven', 'earth', 'glory', 'holy', 'righteous', 'mercy', 'peace', 'hope',
+         'joy', 'fear', 'prayer', 'praise', 'worship', 'promise', 'blessing', 'curse', 'judgment', 'wisdom', 'power',
+         'name', 'voice', 'hand', 'heart', 'soul', 'flesh', 'bone', 'dust', 'fire', 'cloud', 'star', 'sun', 'moon',
+         'gold', 'silver', 'bronze', 'stone', 'sword', 'shield', 'crown', 'throne', 'scroll', 'oil', 'incense']
+
+books = ['gen', 'exo', 'lev', 'num', 'deu', 'jos', 'jdg', 'rut', '1sa', '2sa', '1ki', '2ki', '1ch', '2ch', 'ezr', 'neh',
+         'est', 'job', 'psa', 'pro', 'ecc', 'sng', 'isa', 'jer', 'lam', 'ezk', 'dan', 'hos', 'jol', 'amo', 'oba', 'jon',
+         'mic', 'nam', 'hab', 'zep', 'hag', 'zec', 'mal', 'mat', 'mrk', 'luk', 'jhn', 'act', 'rom', '1co', '2co', 'gal',
+         'eph', 'php', 'col', '1th', '2th', '1ti', '2ti', 'tit', 'phm', 'heb', 'jas', '1pe', '2pe', '1jn', '2jn', '3jn',
+         'jud', 'rev']
+
+# the number of chapters each book gets in the corpus, before the names of the books are reused
+chapters_per_book = 150
+
+# one in this many articles has a page query for a namespace the page index of TWConverter does not cover
+page_query_interval = 200
+
+
+def get_article_name(index):
+    """
+    Returns the name of tW article <index>, so the articles can link to each other before they are generated.
+    :param int index:
+    :return: str|unicode ex. grace7
+    """
+    return '{0}{1}'.format(words[index * 7 % len(words)], index)
+
+
+def get_article_dir(index):
+    # a third of the articles are key terms
+    return 'kt' if index % 3 == 0 else 'other'
+
+
+def get_chapter_path(index):
+    """
+    Returns the path of tQ Bible chapter <index>.
+    :param int index:
+    :return: str|unicode ex. bible/questions/comprehension/gen/01.txt
+    """
+    book_index, chapter = divmod(index, chapters_per_book)
+    cycle, book_index = divmod(book_index, len(books))
+    book = books[book_index] + (str(cycle) if cycle else '')
+    return 'bible/questions/comprehension/{0}/{1:02d}.txt'.format(book, chapter + 1)
+
+
+class CorpusGenerator(object):
+    """
+    Generates a DokuWiki corpus laid out like the source repository of a language: the 50 OBS stories with their
+    front and back matter, the OBS and Bible questions of tQ, and the kt and other articles of tW. The pages have
+    headings, lists, bold and italic text, links to each other, tags and door43pages blocks, like the real ones.
+
+    The same <seed> always generates the same corpus.
+    """
+
+    def __init__(self, lang_code='en', seed=0):
+        """
+        :param str|unicode lang_code: The language namespace the links point to
+        :param int seed:
+        """
+        self.lang_code = lang_code
+        self.seed = seed
+        self.random = None
+
+    def iter_pages(self, pages):
+        """
+        Yields the pages of a corpus with <pages> tW articles and tQ chapters, a third of them articles, in addition
+        to the 50 OBS stories, their front and back matter and their questions, and the home page of each tW
+        directory.
+        :param int pages:
+        :return: Yields (path, text) tuples, the path is relative to the root of the repository
+        """
+        self.random = random.Random(self.seed)
+        article_count = (pages + 2) // 3
+
+        for story in range(1, 51):
+            yield 'obs/{0:02d}.txt'.format(story), self.make_story(story)
+            yield 'obs/notes/questions/{0:02d}.txt'.format(story), self.make_story_questions(story)
+
+        yield 'obs/front-matter.txt', self.make_matter('Open Bible Stories')
+        yield 'obs/back-matter.txt', self.make_matter('About')
+
+        for dir_name in ('kt', 'other'):
+            yield 'obe/{0}/home.txt'.format(dir_name), self.make_home(dir_name)
+
+        for index in range(article_count):
+            path = 'obe/{0}/{1}.txt'.format(get_article_dir(index), get_article_name(index))
+            yield path, self.make_article(index, article_count)
+
+        for index in range(pages - article_count):
+            yield get_chapter_path(index), self.make_chapter(index)
+
+    def write(self, directory, pages):
+        """
+        Writes a corpus, see iter_pages, to <directory> laid out like a git checkout of the source repository.
+        :param str|unicode directory:
+        :param int pages:
+        :return: int The number of files written
+        """
+        count = 0
+        for path, text in self.iter_pages(pages):
+            file_name = os.path.join(directory, *path.split('/'))
+            if not os.path.isdir(os.path.dirname(file_name)):
+                os.makedirs(os.path.dirname(file_name))
+            with codecs.open(file_name, 'w', 'utf-8') as out_file:
+                out_file.write(text)
+            count += 1
+
+        return count
+
+    def make_sentence(self, min_words=6, max_words=18):
+        sentence = [self.random.choice(words) for _ in range(self.random.randint(min_words, max_words))]
+
+        # some of the words are bold or italic
+        position = self.random.randrange(len(sentence))
+        style = self.random.random()
+        if style < 0.1:
+            sentence[position] = '**{0}**'.format(sentence[position])
+        elif style < 0.2:
+            sentence[position] = '//{0}//'.format(sentence[position])
+
+        return ' '.join(sentence).capitalize() + '.'
+
+    def make_paragraph(self, sentences=4):
+        return ' '.join(self.make_sentence() for _ in range(self.random.randint(1, sentences)))
+
+    def make_title(self, count=2):
+        return ', '.join(self.random.choice(words) for _ in range(count))
+
+    def make_link(self, article_count):
+        index = self.random.randrange(article_count)
+        name = get_article_name(index)
+        return '[[:{0}:obe:{1}:{2}|{3}]]'.format(self.lang_code, get_article_dir(index), name,
+                                                 name.rstrip('0123456789'))
+
+    def make_story(self, story):
+        lines = ['====== {0}. {1} ======'.format(story, self.make_title().title()), '']
+
+        for frame in range(1, self.random.randint(8, 16)):
+            lines.append('{{{{https://api.unfoldingword.org/obs/jpg/1/en/360px/obs-en-{0:02d}-{1:02d}.jpg}}}}'
+                         .format(story, frame))
+            lines.extend(['', self.make_paragraph(), '', ''])
+
+        lines.append('//A Bible story from: {0} {1}//'.format(self.random.choice(books).title(),
+                                                             self.random.randint(1, 50)))
+        return '\n'.join(lines) + '\n'
+
+    def make_story_questions(self, story):
+        lines = ['====== Story #{0}: {1} ======'.format(story, self.make_title().title()), '',
+                 '===== Comprehension Questions and Answers =====', '']
+
+        for _ in range(self.random.randint(5, 15)):
+            lines.append('  - **{0}?**'.format(self.make_sentence()[:-1]))
+            lines.append('      * //{0} [{1:02d}-{2:02d}]//'.format(self.make_sentence(3, 10), story,
+                                                                    self.random.randint(1, 16)))
+
+        lines.extend(['', '**[[:{0}:obs:notes:questions:{1:02d}|<<]] | [[:{0}:obs:notes:questions:{2:02d}|>>]]**'
+                      .format(self.lang_code, max(story - 1, 1), min(story + 1, 50)), ''])
+        return '\n'.join(lines)
+
+    def make_matter(self, title):
+        return '====== {0} ======\n\n{1}\n\n{2}\n'.format(title, self.make_paragraph(), self.make_paragraph())
+
+    def make_home(self, dir_name):
+        return '====== {0} ======\n\n{{{{door43pages @:{1}:obe:{0} -q="tag:{0}" -title}}}}\n'.format(
+            dir_name, self.lang_code)
+
+    def make_article(self, index, article_count):
+        dir_name = get_article_dir(index)
+        name = get_article_name(index)
+        lines = ['====== {0}, {1} ======'.format(name.rstrip('0123456789'), self.make_title()), '',
+                 '===== Definition: =====', '', self.make_paragraph(), '']
+
+        for _ in range(self.random.randint(1, 4)):
+            lines.append('  * {0} See {1}.'.format(self.make_sentence(), self.make_link(article_count)))
+
+        lines.extend(['', '===== Translation Suggestions: =====', ''])
+        for _ in range(self.random.randint(1, 4)):
+            lines.append('  - {0}'.format(self.make_sentence()))
+
+        lines.extend(['', '(See also: {0}, {1})'.format(self.make_link(article_count), self.make_link(article_count)),
+                      '', '===== Bible References: =====', ''])
+        for _ in range(self.random.randint(1, 5)):
+            book = self.random.choice(books)
+            chapter = self.random.randint(1, 50)
+            verse = self.random.randint(1, 30)
+            lines.append('  * [[{0}:bible:notes:{1}:{2:02d}:{3:02d}|{4} {2}:{3}]]'.format(
+                self.lang_code, book, chapter, verse, book.title()))
+
+        lines.extend(['', '===== Examples from the Bible stories: =====', ''])
+        for _ in range(self.random.randint(0, 3)):
+            frame = '{0:02d}-{1:02d}'.format(self.random.randint(1, 50), self.random.randint(1, 16))
+            lines.append('  * **[[{0}:obs:notes:frames:{1}|[{1}]]]** {2}'.format(self.lang_code, frame,
+                                                                                 self.make_sentence()))
+
+        if index % page_query_interval == page_query_interval - 1:
+            lines.extend(['', '===== Related: =====', '',
+                          '{{{{door43pages @:{0}:obe -q="tag:{1}" -title}}}}'.format(self.lang_code,
+                                                                                     self.random.choice(words))])
+
+        lines.extend(['', '{{{{tag>{0} {1} {2}}}}}'.format(dir_name, self.random.choice(words),
+                                                           self.random.choice(words)), ''])
+        return '\n'.join(lines)
+
+    def make_chapter(self, index):
+        path = get_chapter_path(index)
+        book, chapter = path[:-4].rsplit('/', 2)[1:]
+        lines = ['====== {0} Chapter {1} Comprehension Questions ======'.format(book.title(), int(chapter)), '',
+                 '**[[:{0}:bible:questions:comprehension:{1}:home|Back to {2} Chapter List]]**'.format(
+                     self.lang_code, book, book.title()), '']
+
+        for _ in range(self.random.randint(3, 12)):
+            lines.append('  - **{0}?**'.format(self.make_sentence()[:-1]))
+            lines.append('      * //{0} [{1}:{2}]//'.format(self.make_sentence(3, 10), int(chapter),
+                                                            self.random.randint(1, 30)))
+
+        lines.extend(['', '{{tag>draft}}', ''])
+        return '\n'.join(lines)
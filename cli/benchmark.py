@@ -0,0 +1,52 @@
+from __future__ import print_function, unicode_literals
+import argparse
+import sys
+from general_tools.print_utils import print_ok, print_error
+from benchmarks.suite import BenchmarkSuite, compare_reports, format_report, DEFAULT_TEXT_SCALES, \
+    DEFAULT_RUN_SCALES
+from converters.cache import read_json_file, write_json_file
+
+if __name__ == '__main__':
+    print()
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-s', '--scales', dest='scales', nargs='+', type=int, default=list(DEFAULT_TEXT_SCALES),
+                        required=False, help='The corpus sizes, in copies of the OBS corpus, to time the text '
+                                             'conversion at.')
+    parser.add_argument('-u', '--runscales', dest='run_scales', nargs='+', type=int, default=list(DEFAULT_RUN_SCALES),
+                        required=False, help='The corpus sizes to time the tQ and tW converters at.')
+    parser.add_argument('-n', '--repeat', dest='repeat', default=3, type=int,
+                        required=False, help='The number of times to run each benchmark, the fastest is kept.')
+    parser.add_argument('-o', '--output', dest='output', default=None,
+                        required=False, help='Write the results to this JSON file.')
+    parser.add_argument('-c', '--compare', dest='compare', default=None,
+                        required=False, help='A JSON file from an earlier run to compare the results with.')
+    parser.add_argument('-t', '--threshold', dest='threshold', default=0.1, type=float,
+                        required=False, help='The fraction of throughput that may be lost before a benchmark is '
+                                             'reported as a regression.')
+
+    args = parser.parse_args(sys.argv[1:])
+
+    with BenchmarkSuite(args.scales, args.run_scales, args.repeat) as suite:
+        report = suite.run()
+
+    print()
+    print(format_report(report))
+
+    if args.output:
+        write_json_file(args.output, report)
+
+    if args.compare:
+        baseline = read_json_file(args.compare)
+        if baseline is None:
+            print_error('Could not read {0}.'.format(args.compare))
+            sys.exit(1)
+
+        regressions = compare_reports(baseline, report, args.threshold)
+        for name, scale, before, after in regressions:
+            print_error('{0} at {1}x: {2:.0f} pages/s, was {3:.0f} pages/s.'.format(name, scale, after, before))
+
+        if regressions:
+            sys.exit(1)
+
+        print_ok('OK: ', 'No regressions since {0}.'.format(baseline['created']))
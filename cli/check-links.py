@@ -0,0 +1,29 @@
+from __future__ import print_function, unicode_literals
+import argparse
+import sys
+from general_tools.print_utils import print_ok, print_error
+from converters.links import check_links, format_broken_link
+
+if __name__ == '__main__':
+    print()
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+',
+                        help='The output directories, or zip archives, of the converted resources to check.')
+
+    args = parser.parse_args(sys.argv[1:])
+
+    failed = False
+    for path in args.paths:
+        broken_links = check_links(path)
+        if not broken_links:
+            print_ok('OK: ', 'No broken links in {0}.'.format(path))
+            continue
+
+        failed = True
+        print_error('{0} broken links in {1}:'.format(len(broken_links), path))
+        for broken_link in broken_links:
+            print('   ' + format_broken_link(broken_link))
+
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,74 @@
+from __future__ import print_function, unicode_literals
+import argparse
+import sys
+from general_tools.print_utils import print_ok, print_error
+from converters.batch import make_jobs, run_batch, format_summary, RESOURCES, DEFAULT_GIT_REPO
+from converters.common import configure_recording
+from converters.pool import DEFAULT_MAX_WORKERS
+
+if __name__ == '__main__':
+    print()
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-l', '--lang', dest='langs', nargs='+',
+                        required=True, help='Language codes of the resources.')
+    parser.add_argument('-t', '--type', dest='resources', nargs='+', choices=RESOURCES, default=list(RESOURCES),
+                        required=False, help='The resources to convert for each language.')
+    parser.add_argument('-r', '--gitrepo', dest='gitrepo', default=DEFAULT_GIT_REPO,
+                        required=False, help='Git repository where the source can be found, {lang} is replaced with '
+                                             'the language code.')
+    parser.add_argument('-o', '--outdir', dest='outdir', default=False,
+                        required=True, help='The output directory, each resource is written to <lang>_<resource>.')
+    parser.add_argument('-p', '--processes', dest='processes', default=None, type=int,
+                        required=False, help='The number of conversions to run at the same time, defaults to the '
+                                             'number of cores.')
+    parser.add_argument('-w', '--workers', dest='workers', default=DEFAULT_MAX_WORKERS, type=int,
+                        required=False, help='The number of files each conversion downloads at the same time.')
+    parser.add_argument('-a', '--archive', dest='archive', default=None, nargs='?', const=True,
+                        required=False, help='Read the source from a tar or zip archive of the repository, or from a '
+                                             'git checkout or DokuWiki data directory. Give a file name, URL or '
+                                             'directory, {lang} is replaced with the language code, or leave empty '
+                                             'to download the GitHub archive of each repository.')
+    parser.add_argument('-z', '--zip', dest='zip', default=False, action='store_true',
+                        required=False, help='Write the output to a zip archive for each resource instead '
+                                             'of to separate files.')
+    parser.add_argument('--parallel-compression', dest='parallel_compression', default=False, action='store_true',
+                        required=False, help='With --zip, compress the files on separate threads.')
+
+    parser.add_argument('--no-http-cache', dest='http_cache', default=True, action='store_false',
+                        required=False, help='Download every file again, instead of asking the server whether the copy '
+                                             'an earlier run kept has changed. The caches are kept in the '
+                                             'DOKUWIKI_TO_RC_CACHE directory, ~/.cache/dokuwiki-to-rc by default.')
+    recording = parser.add_mutually_exclusive_group()
+    recording.add_argument('--record', dest='record', default=None,
+                           required=False, help='Save every HTTP response to this SQLite file, to replay the run '
+                                                'later.')
+    recording.add_argument('--replay', dest='replay', default=None,
+                           required=False, help='Answer every HTTP request from a file saved with --record instead '
+                                                'of using the network.')
+
+    args = parser.parse_args(sys.argv[1:])
+
+    recording = None
+    if args.record or args.replay:
+        recording = (args.replay or args.record, 'replay' if args.replay else 'record')
+        configure_recording(*recording)
+
+    jobs = make_jobs(args.langs, args.resources, args.outdir, args.gitrepo, args.archive, max_workers=args.workers,
+                     output_format='zip' if args.zip else 'dir', parallel_compression=args.parallel_compression,
+                     recording=recording, http_cache=args.http_cache)
+
+    def report(result):
+        if result.succeeded:
+            print_ok('FINISHED: ', '{0} {1} in {2:.1f} seconds.'.format(result.lang_code, result.resource,
+                                                                        result.seconds))
+        else:
+            print_error('{0} {1} failed: {2}'.format(result.lang_code, result.resource, result.error))
+
+    results = run_batch(jobs, args.processes, report)
+
+    print()
+    print(format_summary(results))
+
+    if not all(r.succeeded for r in results):
+        sys.exit(1)
@@ -2,6 +2,8 @@ from __future__ import print_function, unicode_literals
 import argparse
 import sys
 from general_tools.print_utils import print_ok
+from converters.common import configure_recording
+from converters.pool import DEFAULT_MAX_WORKERS
 from converters.obs_converter import OBSConverter
 
 if __name__ == '__main__':
@@ -14,11 +16,54 @@ if __name__ == '__main__':
                         required=True, help='Git repository where the source can be found.')
     parser.add_argument('-o', '--outdir', dest='outdir', default=False,
                         required=True, help='The output directory for markdown files.')
+    parser.add_argument('-w', '--workers', dest='workers', default=DEFAULT_MAX_WORKERS, type=int,
+                        required=False, help='The number of files to download at the same time.')
+    parser.add_argument('-a', '--archive', dest='archive', default=None, nargs='?', const=True,
+                        required=False, help='Read the source from a tar or zip archive of the repository, or from a '
+                                             'git checkout or DokuWiki data directory, instead of downloading each '
+                                             'file. Give a file name, URL or directory, or leave empty to download '
+                                             'the GitHub archive of the repository.')
+    parser.add_argument('-z', '--zip', dest='zip', default=False, action='store_true',
+                        required=False, help='Write the output to a zip archive next to the output directory instead '
+                                             'of to separate files.')
+    parser.add_argument('--parallel-compression', dest='parallel_compression', default=False, action='store_true',
+                        required=False, help='With --zip, compress the files on separate threads.')
+    parser.add_argument('-p', '--processes', dest='processes', default=0, type=int,
+                        required=False, help='The number of processes that convert the files while others are being '
+                                             'downloaded. By default they are converted on the download threads.')
+    parser.add_argument('--metrics', dest='metrics', default=None,
+                        required=False, help='Write the time spent in each stage and counters such as bytes and '
+                                             'cache hits to this JSON file.')
+    parser.add_argument('--trace', dest='trace', default=None,
+                        required=False, help='Write a trace of the stages to this file, to open in chrome://tracing '
+                                             'or Perfetto.')
+    parser.add_argument('--no-conversion-cache', dest='conversion_cache', default=True, action='store_false',
+                        required=False, help='Convert every file, instead of looking up the files converted before.')
+    parser.add_argument('--no-http-cache', dest='http_cache', default=True, action='store_false',
+                        required=False, help='Download every file again, instead of asking the server whether the copy '
+                                             'an earlier run kept has changed. The caches are kept in the '
+                                             'DOKUWIKI_TO_RC_CACHE directory, ~/.cache/dokuwiki-to-rc by default.')
+    recording = parser.add_mutually_exclusive_group()
+    recording.add_argument('--record', dest='record', default=None,
+                           required=False, help='Save every HTTP response to this SQLite file, to replay the run '
+                                                'later.')
+    recording.add_argument('--replay', dest='replay', default=None,
+                           required=False, help='Answer every HTTP request from a file saved with --record instead '
+                                                'of using the network.')
 
     args = parser.parse_args(sys.argv[1:])
 
+    if args.record or args.replay:
+        configure_recording(args.replay or args.record, 'replay' if args.replay else 'record')
+
     # do the import
-    with OBSConverter(args.lang, args.gitrepo, args.outdir, False) as importer:
+    with OBSConverter(args.lang, args.gitrepo, args.outdir, False, args.workers,
+                      output_format='zip' if args.zip else 'dir',
+                      parallel_compression=args.parallel_compression,
+                      metrics_file=args.metrics, trace_file=args.trace,
+                      processes=args.processes, conversion_cache=args.conversion_cache,
+                      http_cache=args.http_cache,
+                      source_archive=args.archive) as importer:
         importer.run()
 
     print_ok('ALL FINISHED: ', 'Please check the output directory.')
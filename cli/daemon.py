@@ -0,0 +1,44 @@
+from __future__ import print_function, unicode_literals
+import argparse
+import sys
+from general_tools.print_utils import print_ok
+from converters.common import configure_recording
+from converters.daemon import ConversionDaemon, DEFAULT_PORT
+from converters.pool import DEFAULT_MAX_WORKERS
+
+if __name__ == '__main__':
+    print()
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', dest='host', default='127.0.0.1',
+                        required=False, help='The address to listen on.')
+    parser.add_argument('--port', dest='port', default=DEFAULT_PORT, type=int,
+                        required=False, help='The port to listen on.')
+    parser.add_argument('-j', '--jobs', dest='jobs', default=2, type=int,
+                        required=False, help='The number of conversions to run at the same time.')
+    parser.add_argument('-w', '--workers', dest='workers', default=DEFAULT_MAX_WORKERS, type=int,
+                        required=False, help='The number of files each conversion downloads at the same time.')
+    parser.add_argument('--cache-dir', dest='cache_dir', default=None,
+                        required=False, help='Where to keep data between runs.')
+    parser.add_argument('--out-root', dest='out_root', default=None,
+                        required=False, help='Only let the jobs write to this directory.')
+    recording = parser.add_mutually_exclusive_group()
+    recording.add_argument('--record', dest='record', default=None,
+                           required=False, help='Save every HTTP response to this SQLite file, to replay the run '
+                                                'later.')
+    recording.add_argument('--replay', dest='replay', default=None,
+                           required=False, help='Answer every HTTP request from a file saved with --record instead '
+                                                'of using the network.')
+
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.record or args.replay:
+        configure_recording(args.replay or args.record, 'replay' if args.replay else 'record')
+
+    daemon = ConversionDaemon(args.host, args.port, args.jobs, args.workers, args.cache_dir, args.out_root)
+    print_ok('LISTENING: ', '{0}/jobs'.format(daemon.url))
+
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
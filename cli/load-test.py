@@ -0,0 +1,92 @@
+from __future__ import print_function, unicode_literals
+import argparse
+import os
+import sys
+from general_tools.print_utils import print_ok, print_error
+from benchmarks.standin import StandInServer, run_load_test, use_standin, DEFAULT_PORT
+from benchmarks.synthetic import CorpusGenerator
+from converters.batch import RESOURCES, format_summary
+from converters.pool import DEFAULT_MAX_WORKERS
+
+if __name__ == '__main__':
+    print()
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-d', '--repos', dest='repos', required=True,
+                        help='The directory with a checkout of each repository, d43-<lang>, to serve.')
+    parser.add_argument('-g', '--generate', dest='generate', default=None, type=int,
+                        required=False, help='First generate a corpus with this many tW articles and tQ chapters for '
+                                             'each language.')
+    parser.add_argument('-s', '--seed', dest='seed', default=0, type=int,
+                        required=False, help='The seed of the generated corpus.')
+    parser.add_argument('-l', '--langs', dest='langs', nargs='+', default=['en'],
+                        required=False, help='The languages to generate and convert.')
+    parser.add_argument('-r', '--resources', dest='resources', nargs='+', default=list(RESOURCES),
+                        choices=RESOURCES, required=False, help='The resources to convert.')
+    parser.add_argument('-o', '--outdir', dest='outdir', default=None,
+                        required=False, help='Convert the corpus to this directory, each resource is written to '
+                                             '<lang>_<resource>.')
+    parser.add_argument('--serve', dest='serve', default=False, action='store_true',
+                        required=False, help='Only serve the corpus, until interrupted.')
+    parser.add_argument('--port', dest='port', default=None, type=int,
+                        required=False, help='The port to serve on, by default {0} with --serve and any free port '
+                                             'otherwise.'.format(DEFAULT_PORT))
+    parser.add_argument('--latency', dest='latency', default=0, type=float,
+                        required=False, help='The number of seconds to wait before each response.')
+    parser.add_argument('--rate-limit', dest='rate_limit', default=None, type=int,
+                        required=False, help='The number of requests to answer in each rate limit window, the others '
+                                             'get 429 Too Many Requests.')
+    parser.add_argument('--rate-window', dest='rate_window', default=60, type=float,
+                        required=False, help='The length of the rate limit window in seconds.')
+    parser.add_argument('-p', '--processes', dest='processes', default=1, type=int,
+                        required=False, help='The number of conversions to run at the same time.')
+    parser.add_argument('-w', '--workers', dest='workers', default=DEFAULT_MAX_WORKERS, type=int,
+                        required=False, help='The number of files each conversion downloads at the same time.')
+    parser.add_argument('-a', '--archive', dest='archive', default=False, action='store_true',
+                        required=False, help='Download the archive of each repository instead of each file.')
+
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.generate is not None:
+        for lang_code in args.langs:
+            repo_dir = os.path.join(args.repos, 'd43-' + lang_code)
+            count = CorpusGenerator(lang_code, args.seed).write(repo_dir, args.generate)
+            print_ok('GENERATED: ', '{0} files in {1}.'.format(count, repo_dir))
+
+    server_settings = {'latency': args.latency, 'rate_limit': args.rate_limit, 'rate_window': args.rate_window}
+
+    if args.serve:
+        server = StandInServer(args.repos, port=DEFAULT_PORT if args.port is None else args.port, **server_settings)
+        use_standin(server.url)
+        print_ok('LISTENING: ', server.get_repo_url('d43-<lang>'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    if not args.outdir:
+        if args.generate is None:
+            parser.error('Give the output directory with -o, or --serve.')
+        sys.exit(0)
+
+    def report(result):
+        if result.succeeded:
+            print_ok('FINISHED: ', '{0} {1} in {2:.1f} seconds.'.format(result.lang_code, result.resource,
+                                                                        result.seconds))
+        else:
+            print_error('{0} {1} failed: {2}'.format(result.lang_code, result.resource, result.error))
+
+    results, counts, seconds = run_load_test(args.repos, args.langs, args.resources, args.outdir, args.processes,
+                                             args.workers, args.archive or None, on_result=report,
+                                             port=args.port or 0, **server_settings)
+
+    print()
+    print(format_summary(results))
+    print()
+    print('{0} requests in {1:.1f} seconds:'.format(sum(counts.values()), seconds))
+    for kind in sorted(counts):
+        print('{0:<14} {1:>9}'.format(kind, counts[kind]))
+
+    if not all(r.succeeded for r in results):
+        sys.exit(1)
@@ -0,0 +1,203 @@
+from __future__ import print_function, unicode_literals
+import multiprocessing
+import os
+import time
+from converters.cache import get_cache_dir
+from converters.common import configure_recording
+from converters.languages import get_language_index
+from converters.pool import DEFAULT_MAX_WORKERS
+
+RESOURCES = ('obs', 'tq', 'tw')
+DEFAULT_GIT_REPO = 'https://github.com/Door43/d43-{lang}'
+
+
+class BatchJob(object):
+    """
+    The conversion of one resource of one language, run by run_batch.
+    """
+
+    def __init__(self, lang_code, resource, git_repo, out_dir, max_workers=DEFAULT_MAX_WORKERS, cache_dir=None,
+                 source_archive=None, output_format='dir', parallel_compression=False, recording=None,
+                 http_cache=True):
+        """
+        :param str|unicode lang_code:
+        :param str|unicode resource: obs, tq or tw
+        :param str|unicode git_repo:
+        :param str|unicode out_dir: The resource containers are written to <out_dir>/<lang_code>_<slug>
+        :param int max_workers: The number of files to download and convert at the same time
+        :param str|unicode cache_dir: Where to keep data between runs, defaults to get_cache_dir()
+        :param str|unicode|bool source_archive: Passed to the converters
+        :param str|unicode output_format: 'dir' or 'zip', see open_output
+        :param bool parallel_compression: In zip format, compress the files on separate threads, see ZipOutput
+        :param tuple recording: The file name and mode to pass to configure_recording in the process running the job
+        :param bool http_cache: Revalidate the files downloaded by earlier runs instead of downloading them again
+        """
+        if resource not in RESOURCES:
+            raise ValueError('Unknown resource "{0}", expected one of {1}.'.format(resource, ', '.join(RESOURCES)))
+
+        self.lang_code = lang_code
+        self.resource = resource
+        self.git_repo = git_repo
+        self.out_dir = out_dir
+        self.max_workers = max_workers
+        self.cache_dir = cache_dir
+        self.source_archive = source_archive
+        self.output_format = output_format
+        self.parallel_compression = parallel_compression
+        self.recording = recording
+        self.http_cache = http_cache
+
+    def get_out_dir(self, slug):
+        return os.path.join(self.out_dir, '{0}_{1}'.format(self.lang_code, slug))
+
+    def run(self):
+        if self.recording:
+            configure_recording(*self.recording)
+
+        with self.make_converter() as converter:
+            converter.run()
+
+    def make_converter(self):
+        """
+        Returns the converter for this job, ready to run.
+        :return: OBSConverter|TQConverter|TWConverter
+        """
+        # imported here so the converter modules are only loaded by the processes that use them
+        if self.resource == 'obs':
+            from converters.obs_converter import OBSConverter
+            return OBSConverter(self.lang_code, self.git_repo, self.get_out_dir('obs'), True, self.max_workers,
+                                self.cache_dir, self.output_format, self.parallel_compression,
+                                source_archive=self.source_archive, http_cache=self.http_cache)
+
+        if self.resource == 'tq':
+            from converters.tq_converter import TQConverter
+            return TQConverter(self.lang_code, self.git_repo, self.get_out_dir('tq'), self.get_out_dir('obs-tq'), True,
+                               self.max_workers, self.cache_dir, self.source_archive, self.output_format,
+                               self.parallel_compression, http_cache=self.http_cache)
+
+        from converters.tw_converter import TWConverter
+        return TWConverter(self.lang_code, self.git_repo, self.get_out_dir('tw'), True, self.max_workers,
+                           self.cache_dir, self.source_archive, self.output_format, self.parallel_compression,
+                           http_cache=self.http_cache)
+
+
+class BatchResult(object):
+    """
+    The outcome of a BatchJob.
+    """
+
+    def __init__(self, lang_code, resource, seconds, error=None):
+        """
+        :param str|unicode lang_code:
+        :param str|unicode resource:
+        :param float seconds: How long the conversion took
+        :param str|unicode error: The error message if the conversion failed
+        """
+        self.lang_code = lang_code
+        self.resource = resource
+        self.seconds = seconds
+        self.error = error
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+
+def make_jobs(lang_codes, resources, out_dir, git_repo=DEFAULT_GIT_REPO, source_archive=None, **kwargs):
+    """
+    Returns a job for each resource of each language.
+    :param list lang_codes:
+    :param list resources: obs, tq and/or tw
+    :param str|unicode out_dir:
+    :param str|unicode git_repo: The repository of each language, {lang} is replaced with the language code
+    :param str|unicode|bool source_archive: The archive of each language, {lang} is replaced with the language code
+    :param kwargs: Other BatchJob arguments
+    :return: list
+    """
+    jobs = []
+    for lang_code in lang_codes:
+        archive = source_archive.format(lang=lang_code) if source_archive and source_archive is not True \
+            else source_archive
+        for resource in resources:
+            jobs.append(BatchJob(lang_code, resource, git_repo.format(lang=lang_code), out_dir,
+                                 source_archive=archive, **kwargs))
+
+    return jobs
+
+
+def run_job(job):
+    """
+    Runs <job> and returns a BatchResult. Errors are caught so one language does not stop the others.
+    :param BatchJob job:
+    :return: BatchResult
+    """
+    start = time.time()
+
+    # noinspection PyBroadException
+    try:
+        job.run()
+        error = None
+    except Exception as e:
+        error = '{0}: {1}'.format(type(e).__name__, e)
+
+    return BatchResult(job.lang_code, job.resource, time.time() - start, error)
+
+
+def run_batch(jobs, processes=None, on_result=None):
+    """
+    Runs <jobs> in a pool of processes. The language catalog is downloaded to the cache once before the processes
+    start, so they all read it from the disk. The processes also share the page query cache.
+    :param list jobs: BatchJob objects
+    :param int processes: The number of jobs to run at the same time, defaults to the number of cores
+    :param on_result: A function called with each BatchResult as soon as it is available
+    :return: list The BatchResult of each job, in the order of <jobs>
+    """
+    for cache_dir in set(j.cache_dir or get_cache_dir() for j in jobs):
+        get_language_index(cache_dir)
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    processes = max(1, min(processes, len(jobs)))
+    results = []
+
+    if processes == 1:
+        for job in jobs:
+            results.append(run_job(job))
+            if on_result:
+                on_result(results[-1])
+
+        return results
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap(run_job, jobs):
+            results.append(result)
+            if on_result:
+                on_result(result)
+    finally:
+        pool.close()
+        pool.join()
+
+    return results
+
+
+def format_summary(results):
+    """
+    Returns a table with the outcome and time of each job, and the totals.
+    :param list results: BatchResult objects
+    :return: str|unicode
+    """
+    lines = ['{0:<10} {1:<8} {2:<8} {3:>9}'.format('Language', 'Resource', 'Result', 'Seconds')]
+
+    for result in results:
+        line = '{0:<10} {1:<8} {2:<8} {3:>9.1f}'.format(result.lang_code, result.resource,
+                                                         'OK' if result.succeeded else 'FAILED', result.seconds)
+        if not result.succeeded:
+            line += '  ' + result.error
+        lines.append(line)
+
+    failed = len([r for r in results if not r.succeeded])
+    lines.append('{0} succeeded, {1} failed.'.format(len(results) - failed, failed))
+
+    return '\n'.join(lines)
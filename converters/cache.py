@@ -0,0 +1,266 @@
+from __future__ import unicode_literals
+import codecs
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from general_tools.file_utils import make_dir
+
+# the HTTP cache is pruned down to this size, and of responses that were not used for this many seconds
+DEFAULT_HTTP_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_HTTP_MAX_AGE = 30 * 24 * 60 * 60
+
+
+def get_cache_dir():
+    """
+    Returns the directory where cached data is kept between runs. Set the DOKUWIKI_TO_RC_CACHE environment variable
+    to use a different directory.
+    :return: str|unicode
+    """
+    return os.environ.get('DOKUWIKI_TO_RC_CACHE',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'dokuwiki-to-rc'))
+
+
+class JsonCache(object):
+    """
+    A dictionary that is saved to a JSON file so it can be used again by the next run. Entries older than <ttl>
+    seconds are treated as missing.
+    """
+
+    def __init__(self, file_name, ttl):
+        """
+        :param str|unicode file_name: The JSON file that holds the cached entries
+        :param int|float ttl: The number of seconds an entry stays valid
+        """
+        self.file_name = file_name
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.changed = False
+
+        # a damaged cache file is not an error, the entries will be downloaded again
+        self.entries = read_json_file(file_name) or {}
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None):
+        """
+        :param str|unicode key:
+        :param default: The value to return if <key> is not cached or has expired
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+
+        if entry is None or time.time() - entry['time'] > self.ttl:
+            return default
+
+        return entry['value']
+
+    def set(self, key, value):
+        """
+        :param str|unicode key:
+        :param value: Any value that can be serialized to JSON
+        """
+        with self.lock:
+            self.entries[key] = {'time': time.time(), 'value': value}
+            self.changed = True
+
+    def save(self):
+        """
+        Writes the entries that have not expired to the cache file, if anything was added since it was loaded.
+        Entries saved to the file by another process in the meantime are kept, unless this cache has a newer one.
+        """
+        with self.lock:
+            if not self.changed:
+                return
+
+            entries = read_json_file(self.file_name) or {}
+            for key, entry in self.entries.items():
+                if key not in entries or entries[key]['time'] < entry['time']:
+                    entries[key] = entry
+
+            now = time.time()
+            entries = dict((k, v) for k, v in entries.items() if now - v['time'] <= self.ttl)
+            self.changed = False
+
+        write_json_file(self.file_name, entries)
+
+
+class HttpCache(object):
+    """
+    Keeps the body of each HTTP response that has an ETag or a Last-Modified date, so the next request for the same
+    URL can ask the server to only send it if it changed. A 304 response does not count against the GitHub API rate
+    limit. Each URL is kept in its own file, named after the hash of the URL.
+
+    The modification time of a file is the last time its response was used. Responses that were not used for
+    <max_age> seconds are downloaded again, and when the files add up to more than <max_bytes>, the least recently
+    used ones are removed.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_HTTP_MAX_BYTES, max_age=DEFAULT_HTTP_MAX_AGE):
+        """
+        :param str|unicode cache_dir: The directory that holds the cached responses
+        :param int max_bytes: The size the cached responses are limited to
+        :param int|float max_age: The number of seconds an unused response is kept
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+
+        # the size of the files, counted by the first prune and kept up to date by this process
+        self.size = None
+
+    def get_file_name(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, url):
+        """
+        Returns the cached response for <url>, or None.
+        :param str|unicode url:
+        :return: dict|None With the etag, last_modified and body of the response
+        """
+        file_name = self.get_file_name(url)
+        try:
+            if time.time() - os.path.getmtime(file_name) > self.max_age:
+                return None
+
+            # marks the response as used
+            os.utime(file_name, None)
+        except OSError:
+            # not cached, or removed by another process
+            return None
+
+        entry = read_json_file(file_name)
+        return entry if isinstance(entry, dict) and 'body' in entry else None
+
+    @staticmethod
+    def get_headers(entry):
+        """
+        Returns the headers that make the request for cached response <entry> conditional.
+        :param dict|None entry:
+        :return: dict
+        """
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        return headers
+
+    def set(self, url, headers, body):
+        """
+        Caches <body>, if the response has an ETag or a Last-Modified date.
+        :param str|unicode url:
+        :param headers: The headers of the response
+        :param str|unicode body:
+        """
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+
+        file_name = self.get_file_name(url)
+        write_json_file(file_name, {'etag': etag, 'last_modified': last_modified, 'body': body})
+
+        with self.lock:
+            # other processes may have added or removed responses, so the size is counted again before pruning
+            if self.size is not None:
+                self.size += os.path.getsize(file_name)
+            if self.size is None or self.size > self.max_bytes:
+                self.prune()
+
+    def prune(self):
+        """
+        Removes the responses that were not used for <max_age> seconds, then the least recently used ones until the
+        rest fit in 90% of <max_bytes>, so the next few responses do not prune again.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            # the temporary files of write_json_file belong to the writes in progress
+            if not name.endswith('.json'):
+                continue
+            file_name = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(file_name)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, file_name))
+
+        now = time.time()
+        target = self.max_bytes * 0.9
+        self.size = sum(size for mtime, size, file_name in entries)
+
+        for mtime, size, file_name in sorted(entries):
+            if now - mtime <= self.max_age and self.size <= target:
+                break
+            try:
+                os.remove(file_name)
+            except OSError:
+                pass
+            self.size -= size
+
+
+def read_json_file(file_name):
+    """
+    Returns the deserialized contents of <file_name>, or None if the file does not exist or is not valid JSON.
+    :param str|unicode file_name:
+    """
+    if not os.path.isfile(file_name):
+        return None
+
+    # noinspection PyBroadException
+    try:
+        with codecs.open(file_name, 'r', 'utf-8') as in_file:
+            return json.load(in_file)
+    except Exception:
+        return None
+
+
+def write_json_file(file_name, data):
+    """
+    Serializes <data> to <file_name>. The data is written to a temporary file first and then renamed, so an
+    interrupted write does not leave a damaged file behind.
+    :param str|unicode file_name:
+    :param data:
+    """
+    make_dir(os.path.dirname(file_name))
+
+    temp_name = get_temp_name(file_name)
+    with codecs.open(temp_name, 'w', 'utf-8') as out_file:
+        json.dump(data, out_file)
+
+    replace_file(temp_name, file_name)
+
+
+def write_text_file(file_name, text):
+    """
+    Writes <text> to <file_name> in UTF-8, through a temporary file like write_json_file, so the file is either
+    complete or not there. The directory has to exist.
+    :param str|unicode file_name:
+    :param str|unicode text:
+    """
+    temp_name = get_temp_name(file_name)
+    with io.open(temp_name, 'w', encoding='utf-8', newline='') as out_file:
+        out_file.write(text)
+
+    replace_file(temp_name, file_name)
+
+
+def get_temp_name(file_name):
+    # unique to the process and the thread, so two writers of the same file do not share a temporary file
+    return '{0}.{1}.{2}.tmp'.format(file_name, os.getpid(), threading.current_thread().ident)
+
+
+def replace_file(temp_name, file_name):
+    """
+    Renames <temp_name> to <file_name>, replacing it if it exists.
+    """
+    # on Windows os.rename does not replace an existing file
+    if os.name == 'nt' and os.path.isfile(file_name):
+        os.remove(file_name)
+    os.rename(temp_name, file_name)
@@ -1,10 +1,21 @@
 from __future__ import print_function, unicode_literals
 import re
 import requests
+import threading
 from collections import OrderedDict
-from contextlib import closing
+from contextlib import contextmanager
 from datetime import datetime
 from json import JSONEncoder
+from general_tools import url_utils
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+from converters import metrics
+from converters.cache import HttpCache
+from converters.recording import RecordingAdapter, RecordingStore, DEFAULT_MAX_BYTES
+
+# the version of the output of dokuwiki_to_markdown, part of the key of the texts in the ConversionCache. Increase it
+# when a change to the function or to its expressions changes the markdown it returns.
+DOKUWIKI_TO_MARKDOWN_VERSION = '1'
 
 # regular expressions for replacing Dokuwiki formatting
 h1_re = re.compile(r'====== (.*?) ======', re.UNICODE)
@@ -21,16 +32,197 @@ li_space_re = re.compile(r'^(\*.*\n)\n(?=\*)', re.UNICODE | re.MULTILINE)
 ol_re = re.compile(r'^(  - )', re.MULTILINE | re.UNICODE)
 over_re = re.compile(r'^( ){6}\*', re.MULTILINE | re.UNICODE)
 
+# used when converting one line at a time: the start of a line stands in for the preceding new line character,
+# and a link with no colon after the scheme may run on to the next line, see _link_continues
+italic_line_re = re.compile(r'(^|[^:])//(.*?)//', re.UNICODE)
+open_link_re = re.compile(r'\[\[http[s]*:[^:]*$', re.UNICODE)
+header_rules = ((h1_re, r'# \1 #'), (h2_re, r'## \1 ##'), (h3_re, r'### \1 ###'), (h4_re, r'#### \1 ####'),
+                (h5_re, r'##### \1 #####'))
+
+# per-thread buffer used to collect the messages printed by quiet_print
+_output = threading.local()
+
+# the HTTP session shared by all the converters, see get_session
+_session = None
+_session_lock = threading.Lock()
+_http_cache = None
+session_settings = {'pool_connections': 10, 'pool_maxsize': 10, 'timeout': 60, 'retries': 3, 'recording': None}
+
 
 def quiet_print(quiet, message, end='\n'):
 
     if not quiet:
-        print(message, end=end)
+        buffer = getattr(_output, 'buffer', None)
+        if buffer is None:
+            print(message, end=end)
+        else:
+            buffer.append('{0}{1}'.format(message, end))
+
+
+@contextmanager
+def capture_output():
+    """
+    Collects the messages printed by quiet_print on the current thread instead of writing them to the console.
+    :return: list The collected messages
+    """
+    previous = getattr(_output, 'buffer', None)
+    _output.buffer = []
+    try:
+        yield _output.buffer
+    finally:
+        _output.buffer = previous
 
 
 def dokuwiki_to_markdown(text):
     """
     Cleans up text from possible DokuWiki and HTML tag pollution.
+
+    The text is converted line by line in a single scan, and only the rules whose trigger characters are present
+    in a line are applied to it. The output is the same as applying each rule to the whole text in turn, as done
+    by dokuwiki_to_markdown_cascade, which is still used for the rare link that does span more than one line.
+    :param str text:
+    :return: str
+    """
+    if '\r' in text:
+        text = text.replace('\r', '')
+
+    segments = text.split('\n')
+    last_index = len(segments) - 1
+    lines = []
+    blank_count = 0
+
+    # whether a link from the lines before scan_end can end in a later line, see _link_continues
+    scan_end = 0
+    continues = False
+
+    for index, segment in enumerate(segments):
+
+        # empty lines are held until the end of the run is known
+        if not segment and 0 < index < last_index:
+            blank_count += 1
+            continue
+
+        line = _render_line(segment, index == 0) if segment else segment
+        if line is None:
+            if index >= scan_end:
+                scan_end, continues = _link_continues(segments, index + 1)
+            if continues:
+                return dokuwiki_to_markdown_cascade(text)
+            line = _render_line(segment, index == 0, False)
+
+        if index > 0:
+            # the number of blank lines left after collapsing the run of new lines
+            if blank_count > 1:
+                blank_count = _collapse_new_lines(blank_count + 1) - 1
+
+            # remove a single blank line between list items
+            if blank_count == 1 and line[:1] == '*' and lines[-1][:1] == '*':
+                blank_count = 0
+
+            lines.extend([''] * blank_count)
+            blank_count = 0
+
+        lines.append(line)
+
+    return '\n'.join(lines)
+
+
+def dokuwiki_to_markdown_batch(texts, rules=None):
+    """
+    Converts each of <texts> with dokuwiki_to_markdown, then applies <rules> to all of them in one call, see
+    RuleSet.apply_batch. The result of each text is the same as converting it alone.
+    :param list texts:
+    :param RuleSet rules: The rules a converter applies to the markdown, or None
+    :return: list
+    """
+    md_texts = [dokuwiki_to_markdown(text) for text in texts]
+    return rules.apply_batch(md_texts) if rules is not None else md_texts
+
+
+def _collapse_new_lines(count):
+    """
+    Returns the length of a run of <count> new lines after the '\n\n\n\n\n', '\n\n\n\n' and '\n\n\n' replacements.
+    :param int count:
+    :return: int
+    """
+    for size in (5, 4, 3):
+        count = 2 * (count // size) + count % size
+
+    return count
+
+
+def _link_continues(segments, start):
+    """
+    Returns whether a link with no colon after its scheme up to the end of the line before <start> can end in a later
+    line. The link_re of the cascade matches across lines up to the first colon, so it can end in the first line with
+    a "|" before any colon and a "]]" after the "|". The lines are scanned until that line or one with a colon, and
+    the answer is the same for a link on any of the lines scanned.
+    :param list segments: The lines of the text
+    :param int start: The index of the line after the link
+    :return: tuple (index of the last line scanned, bool)
+    """
+    index = start
+    for index in range(start, len(segments)):
+        segment = segments[index]
+        colon = segment.find(':')
+        pipe = segment.find('|', 0, colon) if colon != -1 else segment.find('|')
+
+        if pipe != -1 and ']]' in segment[pipe:]:
+            return index, True
+        if colon != -1:
+            return index, False
+
+    return index, False
+
+
+def _render_line(line, first_line, check_open_links=True):
+    """
+    Converts one line of DokuWiki text to markdown.
+    :param str line:
+    :param bool first_line: True if this is the first line of the text
+    :param bool check_open_links: False if a link in the line is known not to continue on the next line
+    :return: str|None None if a link in the line may continue on the next line
+    """
+    if '== ' in line:
+        for header_re, replacement in header_rules:
+            line = header_re.sub(replacement, line)
+            if '== ' not in line:
+                break
+
+    if line[:1] == ' ':
+        if line[:4] == '  - ':
+            line = '1. ' + line[4:]
+        if line[:7] == '      *':
+            line = line[2:]
+
+    if '//' in line:
+        if first_line:
+            line = italic_re.sub(r'\1_\2_', line)
+        else:
+            line = italic_line_re.sub(r'\1_\2_', line)
+
+    if '**' in line:
+        line = bold_re.sub(r'__\1__', line)
+
+    if '{{' in line:
+        line = image_re.sub(r'![Image](\1)', line)
+
+    if '[[' in line:
+        if check_open_links and open_link_re.search(line):
+            return None
+        line = link_re.sub(r'[\2](\1)', line)
+
+    if line[:1] == ' ':
+        stripped = line.lstrip(' ')
+        if stripped[:1] == '*' and len(line) - len(stripped) < 4:
+            line = stripped
+
+    return line
+
+
+def dokuwiki_to_markdown_cascade(text):
+    """
+    Converts DokuWiki text to markdown by applying each replacement rule to the whole text in turn.
     :param str text:
     :return: str
     """
@@ -55,6 +247,137 @@ def dokuwiki_to_markdown(text):
     return text
 
 
+def get_session():
+    """
+    Returns the HTTP session shared by all the converters in this process. The session keeps connections alive
+    and pools them per host, so each request after the first to a host skips the TCP and TLS handshake.
+    :return: requests.Session
+    """
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            adapter_settings = {'pool_connections': session_settings['pool_connections'],
+                                'pool_maxsize': session_settings['pool_maxsize'],
+                                'max_retries': Retry(total=session_settings['retries'], backoff_factor=0.5,
+                                                     status_forcelist=(429, 500, 502, 503, 504))}
+            if session_settings['recording']:
+                file_name, mode, max_bytes = session_settings['recording']
+                adapter = RecordingAdapter(RecordingStore(file_name, max_bytes), mode, **adapter_settings)
+            else:
+                adapter = HTTPAdapter(**adapter_settings)
+            session = requests.Session()
+            session.headers.update({'User-Agent': 'dokuwiki-to-rc', 'Accept-Encoding': 'gzip, deflate'})
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+
+        return _session
+
+
+def configure_session(pool_maxsize=None, timeout=None, retries=None):
+    """
+    Changes the settings of the shared HTTP session. The session is recreated the next time it is used if the
+    settings changed. The connection pool is never made smaller than it already is.
+    :param int pool_maxsize: The number of connections to keep open to each host
+    :param int|float timeout: Seconds to wait for the server before giving up
+    :param int retries: The number of times to retry a failed connection, server error or rate limited request
+    """
+    global _session
+
+    with _session_lock:
+        new_settings = dict(session_settings)
+
+        if pool_maxsize is not None:
+            new_settings['pool_maxsize'] = max(pool_maxsize, session_settings['pool_maxsize'])
+        if timeout is not None:
+            new_settings['timeout'] = timeout
+        if retries is not None:
+            new_settings['retries'] = retries
+
+        if new_settings != session_settings:
+            session_settings.update(new_settings)
+            if _session is not None:
+                _session.close()
+                _session = None
+
+
+def configure_recording(file_name, mode='record', max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Records every response the shared session gets in SQLite database <file_name>, or answers every request with the
+    response recorded for it so a converter runs without the network, see RecordingAdapter.
+    :param str|unicode file_name: The database, None to use the network again
+    :param str|unicode mode: 'record' or 'replay'
+    :param int max_bytes: The size the recorded bodies are limited to, the least recently used ones are evicted
+    """
+    global _session
+
+    recording = (file_name, mode, max_bytes) if file_name else None
+
+    with _session_lock:
+        if session_settings['recording'] != recording:
+            session_settings['recording'] = recording
+            if _session is not None:
+                _session.close()
+                _session = None
+
+
+def configure_http_cache(cache_dir):
+    """
+    Keeps the responses fetched by get_url in <cache_dir>, and revalidates them the next time they are requested,
+    see HttpCache.
+    :param str|unicode cache_dir: The directory for the cached responses, None to stop caching them
+    """
+    global _http_cache
+
+    with _session_lock:
+        if cache_dir is None:
+            _http_cache = None
+        elif _http_cache is None or _http_cache.cache_dir != cache_dir:
+            _http_cache = HttpCache(cache_dir)
+
+
+def get_url(url, headers=None):
+    """
+    Returns the text found at <url>. HTTP URLs are fetched through the shared session, anything else, such as
+    file:// URLs, is opened with general_tools.url_utils.get_url.
+
+    If the HTTP cache is configured, a response cached by an earlier request is only downloaded again if the server
+    says it changed.
+    :param str|unicode url: URL to open
+    :param dict headers: Headers to send with an HTTP request, ex. the Authorization header of get_api_headers. A
+                         credential goes here rather than in <url>, which is written to the traces.
+    :return: str|unicode
+    """
+    with metrics.stage('fetch', url):
+        if not url.startswith('http://') and not url.startswith('https://'):
+            text = url_utils.get_url(url)
+            metrics.increment('file.bytes_in', len(text))
+            return text
+
+        http_cache = _http_cache
+        cached = http_cache.get(url) if http_cache else None
+
+        request_headers = HttpCache.get_headers(cached)
+        if headers:
+            request_headers.update(headers)
+
+        response = get_session().get(url, headers=request_headers, timeout=session_settings['timeout'])
+        metrics.record_http(response.status_code, len(response.content), metrics.get_retries(response))
+
+        if response.status_code == 304 and cached is not None:
+            metrics.increment('http_cache.not_modified')
+            return cached['body']
+
+        response.raise_for_status()
+        text = response.content.decode('utf-8')
+
+        if http_cache:
+            http_cache.set(url, response.headers, text)
+
+        return text
+
+
 def post_url(url, data):
     """
     :param str|unicode url: URL to open
@@ -66,8 +389,10 @@ def post_url(url, data):
                'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
                'X-Requested-With': 'XMLHttpRequest'}
 
-    with closing(requests.Session()) as session:
-        response = session.post(url, data=data, headers=headers).content
+    with metrics.stage('fetch', url):
+        response = get_session().post(url, data=data, headers=headers, timeout=session_settings['timeout'])
+        metrics.record_http(response.status_code, len(response.content), metrics.get_retries(response))
+        response = response.content
 
     # convert bytes to str (Python 3.5)
     if type(response) is bytes:
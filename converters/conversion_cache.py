@@ -0,0 +1,132 @@
+from __future__ import unicode_literals
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from general_tools.file_utils import make_dir
+from converters import metrics
+from converters.common import DOKUWIKI_TO_MARKDOWN_VERSION
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class ConversionCache(object):
+    """
+    The markdown converted from DokuWiki texts, keyed by a hash of the text, the function that converted it, the
+    version of the converter, the version of dokuwiki_to_markdown and the rules the converter applies after it. A
+    text that was converted before, by any run and in any language, is looked up instead of being converted again.
+
+    The entries are kept in a SQLite database that all the converters and processes share, with the markdown
+    compressed by zlib. When they add up to more than <max_bytes>, the least recently used ones are evicted.
+    """
+
+    def __init__(self, file_name, version, max_bytes=DEFAULT_MAX_BYTES, rule_sets=()):
+        """
+        :param str|unicode file_name: The database
+        :param str|unicode version: The converter and its version, ex. TWConverter-2, so the entries of an older
+                                    version are not used
+        :param int max_bytes: The size the compressed entries are limited to
+        :param rule_sets: The RuleSet objects the converter applies, so the entries converted before one of their
+                          rules changed are not used, even when the version of the converter is the same
+        """
+        self.file_name = file_name
+        self.version = version
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.connection = None
+        self.pid = None
+
+        # the size of the entries, counted once per connection and kept up to date by this process
+        self.size = 0
+
+        # a hash of the conversion itself, so a changed rule does not need a new converter version to take effect
+        logic = hashlib.sha1(DOKUWIKI_TO_MARKDOWN_VERSION.encode('utf-8'))
+        for rule_set in rule_sets:
+            logic.update(rule_set.get_fingerprint().encode('utf-8'))
+        self.logic = logic.hexdigest()
+
+    def connect(self):
+        # a connection cannot be used by a forked process, each process opens its own
+        if self.connection is None or self.pid != os.getpid():
+            make_dir(os.path.dirname(os.path.abspath(self.file_name)))
+            self.connection = sqlite3.connect(self.file_name, timeout=60, check_same_thread=False)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS conversions (key TEXT PRIMARY KEY, markdown BLOB, '
+                                    'size INTEGER, used REAL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS conversions_used ON conversions (used)')
+            self.connection.commit()
+            self.pid = os.getpid()
+            self.size = self.get_size()
+
+        return self.connection
+
+    def get_size(self):
+        return self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM conversions').fetchone()[0]
+
+    def get_key(self, convert, text):
+        """
+        Returns the key of converting <text> with <convert>.
+        :param convert: A function defined at the top level of a module
+        :param str|unicode text:
+        :return: str|unicode
+        """
+        key = hashlib.sha1('{0}\0{1}\0{2}.{3}\0'.format(self.version, self.logic, convert.__module__,
+                                                         convert.__name__).encode('utf-8'))
+        key.update(text.encode('utf-8'))
+        return key.hexdigest()
+
+    def get(self, key):
+        """
+        Returns the markdown cached for <key>, or None.
+        :param str|unicode key: See get_key
+        :return: str|unicode|None
+        """
+        with self.lock:
+            connection = self.connect()
+            row = connection.execute('SELECT markdown FROM conversions WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                connection.execute('UPDATE conversions SET used = ? WHERE key = ?', (time.time(), key))
+                connection.commit()
+
+        if row is None:
+            metrics.increment('conversion_cache.misses')
+            return None
+
+        metrics.increment('conversion_cache.hits')
+        return zlib.decompress(bytes(row[0])).decode('utf-8')
+
+    def set(self, key, md_text):
+        """
+        :param str|unicode key: See get_key
+        :param str|unicode md_text: The converted markdown
+        """
+        compressed = zlib.compress(md_text.encode('utf-8'))
+
+        with self.lock:
+            connection = self.connect()
+            connection.execute('INSERT OR REPLACE INTO conversions VALUES (?, ?, ?, ?)',
+                               (key, sqlite3.Binary(compressed), len(compressed), time.time()))
+            self.size += len(compressed)
+
+            # other processes may have added or evicted entries, so the size is counted again before evicting
+            if self.size > self.max_bytes:
+                self.size = self.get_size()
+                self.evict(connection)
+
+            connection.commit()
+
+    def evict(self, connection):
+        # down to 90% of the limit, so the next few entries do not evict again
+        target = self.max_bytes * 0.9
+        if self.size <= self.max_bytes:
+            return
+
+        for key, size in connection.execute('SELECT key, size FROM conversions ORDER BY used').fetchall():
+            if self.size <= target:
+                break
+            connection.execute('DELETE FROM conversions WHERE key = ?', (key,))
+            metrics.increment('conversion_cache.evicted')
+            self.size -= size
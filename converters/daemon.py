@@ -0,0 +1,298 @@
+from __future__ import print_function, unicode_literals
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from converters.batch import BatchJob, DEFAULT_GIT_REPO
+from converters.common import configure_session
+from converters.pool import DEFAULT_MAX_WORKERS
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from queue import Queue
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    # noinspection PyUnresolvedReferences
+    from SocketServer import ThreadingMixIn
+    # noinspection PyUnresolvedReferences
+    from Queue import Queue
+
+DEFAULT_PORT = 8765
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class DaemonJob(object):
+    """
+    A conversion submitted to a ConversionDaemon, and how far it got.
+    """
+
+    def __init__(self, job_id, batch_job):
+        """
+        :param int job_id:
+        :param BatchJob batch_job: What to convert
+        """
+        self.id = job_id
+        self.batch_job = batch_job
+        self.status = 'queued'
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+        # the Metrics of the converter, reported while the job is running
+        self.metrics = None
+
+    def to_dict(self):
+        """
+        Returns the job as the API reports it. The metrics are those of the converter, see Metrics.report.
+        :return: dict
+        """
+        return {'id': self.id,
+                'resource': self.batch_job.resource,
+                'lang': self.batch_job.lang_code,
+                'out_dir': self.batch_job.out_dir,
+                'status': self.status,
+                'error': self.error,
+                'queued_seconds': (self.started or time.time()) - self.submitted,
+                'seconds': (self.finished or time.time()) - self.started if self.started else None,
+                'metrics': self.metrics.report() if self.metrics else None}
+
+
+class ConversionDaemon(object):
+    """
+    A long-running process that converts resources on request. The HTTP session, the language catalog, the compiled
+    rules and the caches stay warm between the jobs, so each job only pays for its own downloads and conversion.
+    Up to <max_jobs> jobs run at the same time, each on its own thread with its own converter.
+
+    The API on <host>:<port> takes and returns JSON:
+
+    * POST /jobs queues a job, ex. {"resource": "tw", "lang": "en", "out_dir": "/tmp/out"}, and returns it. The job
+      may also give "git_repo", "source_archive", "output_format" and "parallel_compression", see BatchJob. The
+      request has to be sent with Content-Type: application/json, which a web page cannot send to another site
+      without the browser asking first, so a page the user visits cannot queue jobs. With <out_root> the out_dir
+      of the job has to be in that directory, a relative out_dir is relative to it.
+    * GET /jobs returns {"jobs": [...]}, the jobs in the order they were submitted
+    * GET /jobs/<id> returns a job, with its status (queued, running, succeeded or failed), timings and metrics
+    """
+
+    job_path_re = re.compile(r'^/jobs/(\d+)$')
+
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, max_jobs=2, max_workers=DEFAULT_MAX_WORKERS,
+                 cache_dir=None, out_root=None):
+        """
+        :param str|unicode host: The address to listen on
+        :param int port: The port to listen on, 0 to pick a free one
+        :param int max_jobs: The number of jobs to run at the same time
+        :param int max_workers: The number of files each job downloads and converts at the same time
+        :param str|unicode cache_dir: Where to keep data between runs, defaults to get_cache_dir()
+        :param str|unicode out_root: The directory the jobs write to, None to let them write anywhere
+        """
+        self.max_jobs = max_jobs
+        self.max_workers = max_workers
+        self.cache_dir = cache_dir
+        self.out_root = os.path.realpath(out_root) if out_root else None
+
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.queue = Queue()
+        self.runners = []
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+        self.server_thread = None
+
+        # sized for all the jobs up front, so a job starting does not replace the session the others are using
+        configure_session(pool_maxsize=max_jobs * max_workers)
+
+    @property
+    def url(self):
+        return 'http://{0}:{1}'.format(*self.server.server_address[:2])
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    # noinspection PyUnusedLocal
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        """
+        Starts the threads that run the jobs, and serves the API on another thread.
+        """
+        self.start_runners()
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+
+    def serve_forever(self):
+        """
+        Starts the threads that run the jobs, and serves the API on the calling thread until it is interrupted.
+        """
+        self.start_runners()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            self.stop_runners()
+
+    def stop(self):
+        """
+        Stops accepting jobs, and waits for the jobs that were queued to finish.
+        """
+        if self.server_thread is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server_thread = None
+        self.stop_runners()
+
+    def start_runners(self):
+        for _ in range(self.max_jobs):
+            runner = threading.Thread(target=self.run_jobs)
+            runner.daemon = True
+            runner.start()
+            self.runners.append(runner)
+
+    def stop_runners(self):
+        for _ in self.runners:
+            self.queue.put(None)
+        for runner in self.runners:
+            runner.join()
+        self.runners = []
+
+    def submit(self, params):
+        """
+        Queues a job.
+        :param dict params: See the API in the class description
+        :return: DaemonJob
+        """
+        for key in ('resource', 'lang', 'out_dir'):
+            if not params.get(key):
+                raise ValueError('The job has no "{0}".'.format(key))
+
+        lang_code = params['lang']
+        git_repo = params.get('git_repo') or DEFAULT_GIT_REPO.format(lang=lang_code)
+        out_dir = self.get_out_dir(params['out_dir'])
+        batch_job = BatchJob(lang_code, params['resource'], git_repo, out_dir, self.max_workers,
+                             self.cache_dir, params.get('source_archive'), params.get('output_format', 'dir'),
+                             bool(params.get('parallel_compression')))
+
+        with self.lock:
+            job = DaemonJob(len(self.jobs) + 1, batch_job)
+            self.jobs[job.id] = job
+
+        self.queue.put(job)
+        return job
+
+    def get_out_dir(self, out_dir):
+        """
+        Returns the directory a job writes to, which has to be in <out_root> when it is set.
+        :param str|unicode out_dir: The out_dir of the job
+        :return: str|unicode
+        """
+        if self.out_root is None:
+            return out_dir
+
+        path = os.path.realpath(os.path.join(self.out_root, out_dir))
+        if path != self.out_root and not path.startswith(os.path.join(self.out_root, '')):
+            raise ValueError('The out_dir has to be in {0}.'.format(self.out_root))
+
+        return path
+
+    def run_jobs(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            self.run_job(job)
+
+    @staticmethod
+    def run_job(job):
+        """
+        Runs <job>. Errors are kept in the job so one job does not stop the others.
+        :param DaemonJob job:
+        """
+        job.started = time.time()
+        job.status = 'running'
+
+        # noinspection PyBroadException
+        try:
+            converter = job.batch_job.make_converter()
+            job.metrics = converter.metrics
+            with converter:
+                converter.run()
+            error = None
+        except Exception as e:
+            error = '{0}: {1}'.format(type(e).__name__, e)
+
+        job.finished = time.time()
+        job.error = error
+        job.status = 'failed' if error else 'succeeded'
+
+    def get_jobs(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def get_job(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def make_handler(self):
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                if self.path == '/jobs':
+                    self.respond(200, {'jobs': [j.to_dict() for j in daemon.get_jobs()]})
+                    return
+
+                match = daemon.job_path_re.match(self.path)
+                job = daemon.get_job(int(match.group(1))) if match else None
+                if job is None:
+                    self.respond(404, {'error': 'Not found.'})
+                else:
+                    self.respond(200, job.to_dict())
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.path != '/jobs':
+                    self.respond(404, {'error': 'Not found.'})
+                    return
+
+                # a form or plain text can be posted from any web page, JSON cannot
+                content_type = self.headers.get('Content-Type', '').split(';', 1)[0].strip().lower()
+                if content_type != 'application/json':
+                    self.respond(415, {'error': 'The job has to be sent as application/json.'})
+                    return
+
+                try:
+                    params = json.loads(body.decode('utf-8'))
+                    if not isinstance(params, dict):
+                        raise ValueError('The job has to be a JSON object.')
+                    job = daemon.submit(params)
+                except ValueError as e:
+                    self.respond(400, {'error': str(e)})
+                    return
+
+                self.respond(202, job.to_dict())
+
+            def respond(self, status, data):
+                body = json.dumps(data, sort_keys=True).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            # noinspection PyShadowingBuiltins
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
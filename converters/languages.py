@@ -0,0 +1,110 @@
+from __future__ import unicode_literals
+import json
+import os
+import threading
+import time
+from converters.cache import get_cache_dir, read_json_file, write_json_file
+from converters.common import get_session, session_settings
+from converters import metrics
+
+LANGUAGES_URL = 'http://td.unfoldingword.org/exports/langnames.json'
+
+# the number of seconds to use the cached catalog before asking the server if it changed
+CATALOG_TTL = 24 * 60 * 60
+
+# where get_language_index downloads the catalog, see configure_language_catalog
+catalog_settings = {'url': LANGUAGES_URL}
+
+# the loaded catalogs, keyed by cache file name, each one is a tuple of the time it was loaded and a dictionary keyed
+# by language code
+_language_indexes = {}
+_lock = threading.Lock()
+
+
+def get_language_data(lang_code, cache_dir=None):
+    """
+    Returns the catalog entry for <lang_code>, or an empty string if there is none.
+    :param str|unicode lang_code:
+    :param str|unicode cache_dir: Where the catalog is cached, defaults to get_cache_dir()
+    :return: dict|str
+    """
+    return get_language_index(cache_dir).get(lang_code, '')
+
+
+def get_language_index(cache_dir=None):
+    """
+    Returns the language catalog as a dictionary keyed by language code. The catalog is loaded once per process, and
+    loaded again once it is older than CATALOG_TTL, so a long-running process sees the changes.
+    :param str|unicode cache_dir: Where the catalog is cached, defaults to get_cache_dir()
+    :return: dict
+    """
+    file_name = os.path.join(cache_dir or get_cache_dir(), 'langnames.json')
+
+    with _lock:
+        loaded = _language_indexes.get(file_name)
+        if loaded is None or time.time() - loaded[0] > CATALOG_TTL:
+            index = dict((l['lc'], l) for l in load_language_catalog(file_name, catalog_settings['url']))
+            loaded = _language_indexes[file_name] = (time.time(), index)
+
+        return loaded[1]
+
+
+def configure_language_catalog(url=LANGUAGES_URL):
+    """
+    Changes where the language catalog is downloaded from, ex. to a local stand-in for td.unfoldingword.org.
+    :param str|unicode url:
+    """
+    catalog_settings['url'] = url
+
+
+def load_language_catalog(file_name, url=LANGUAGES_URL, ttl=CATALOG_TTL):
+    """
+    Returns the list of languages from the catalog cached in <file_name>. The catalog is downloaded if it is not
+    cached. Once it is older than <ttl> seconds it is revalidated with its ETag and Last-Modified date, so it is only
+    downloaded again if it changed. If the server cannot be reached a stale copy is used.
+    :param str|unicode file_name: The cached catalog
+    :param str|unicode url: Where to download the catalog
+    :param int|float ttl: The number of seconds to trust the cached catalog
+    :return: list
+    """
+    meta_file = file_name + '.meta'
+    meta = read_json_file(meta_file) or {}
+    cached = read_json_file(file_name) if meta else None
+
+    if cached is not None and time.time() - meta.get('time', 0) <= ttl:
+        metrics.increment('language_catalog.cache_hits')
+        return cached
+
+    headers = {}
+    if cached is not None:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    # noinspection PyBroadException
+    try:
+        response = get_session().get(url, headers=headers, timeout=session_settings['timeout'])
+        metrics.record_http(response.status_code, len(response.content), metrics.get_retries(response))
+        if response.status_code != 304:
+            response.raise_for_status()
+    except Exception:
+        if cached is None:
+            raise
+        metrics.increment('language_catalog.stale')
+        return cached
+
+    if response.status_code == 304:
+        metrics.increment('language_catalog.revalidated')
+        langs = cached
+    else:
+        metrics.increment('language_catalog.downloads')
+        langs = json.loads(response.content.decode('utf-8'))
+        write_json_file(file_name, langs)
+
+    write_json_file(meta_file, {'time': time.time(),
+                                'etag': response.headers.get('ETag', meta.get('etag')),
+                                'last_modified': response.headers.get('Last-Modified', meta.get('last_modified'))})
+
+    return langs
+
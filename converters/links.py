@@ -0,0 +1,198 @@
+from __future__ import unicode_literals
+import io
+import os
+import posixpath
+import re
+import zipfile
+from converters import metrics
+
+try:
+    from os import scandir
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from scandir import scandir
+
+try:
+    from urllib.parse import unquote
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from urllib import unquote
+
+# the target of a markdown link or image, ex. [God](../kt/god.md "title"), the text is not needed
+link_re = re.compile(r'\]\(\s*<?([^)\s>]*)>?(?:\s+[^)]*)?\)', re.UNICODE)
+
+# the headings are written as # Title #, see dokuwiki_to_markdown
+heading_re = re.compile(r'^ {0,3}#{1,6}[ \t]+(.*?)(?:[ \t]+#+)?[ \t]*$', re.UNICODE | re.MULTILINE)
+anchor_strip_re = re.compile(r'[^\w\- ]', re.UNICODE)
+
+# a link with a scheme, ex. https:, mailto:, points outside the output
+scheme_re = re.compile(r'^[a-zA-Z][a-zA-Z0-9+.\-]*:')
+
+
+def get_anchor(heading):
+    """
+    Returns the anchor a markdown renderer gives <heading>, like GitHub and Gogs do: lower case, without punctuation,
+    and with a dash for each space.
+    :param str|unicode heading: ex. God, the Father
+    :return: str|unicode ex. god-the-father
+    """
+    return anchor_strip_re.sub('', heading.strip().lower()).replace(' ', '-')
+
+
+class LinkIndex(object):
+    """
+    The files of a converted resource, the anchors of the headings of its markdown files, and the relative links in
+    them. Each file is read once, by add, and find_broken then looks up each link in the index, so checking every
+    link of a language takes one pass over its files and a dict lookup per link.
+
+    The names of the files are relative to the root of the index, with / between the directories.
+    """
+
+    def __init__(self):
+        # the anchors of each file, None for the files that are not markdown
+        self.files = {}
+        self.dirs = {''}
+
+        # (name, line, target) of each relative link
+        self.links = []
+
+    def add(self, name, md_text=None):
+        """
+        Adds a file and, for a markdown file, its anchors and links.
+        :param str|unicode name: ex. content/kt/god.md
+        :param str|unicode md_text: The text of a markdown file, None for the other files
+        """
+        self.files[name] = None
+        dir_name = posixpath.dirname(name)
+        while dir_name not in self.dirs:
+            self.dirs.add(dir_name)
+            dir_name = posixpath.dirname(dir_name)
+
+        if md_text is None:
+            return
+
+        # a repeated heading gets a number, the same as on GitHub
+        anchors = set()
+        for match in heading_re.finditer(md_text):
+            anchor = get_anchor(match.group(1))
+            count = 1
+            unique = anchor
+            while unique in anchors:
+                unique = '{0}-{1}'.format(anchor, count)
+                count += 1
+            anchors.add(unique)
+        self.files[name] = anchors
+
+        line = 1
+        position = 0
+        for match in link_re.finditer(md_text):
+            target = match.group(1)
+            if not target or scheme_re.match(target) or target.startswith('/'):
+                continue
+
+            line += md_text.count('\n', position, match.start())
+            position = match.start()
+            self.links.append((name, line, target))
+
+        metrics.increment('links.files')
+
+    def resolve(self, name, target):
+        """
+        Returns the file or directory that link <target> in file <name> points to, and the anchor.
+        :return: tuple (path, anchor), the path is None if the link points outside the index
+        """
+        target = target.split('?', 1)[0]
+        path, _, anchor = target.partition('#')
+
+        if not path:
+            return name, unquote(anchor)
+
+        path = posixpath.normpath(posixpath.join(posixpath.dirname(name), unquote(path)))
+        if path == '.':
+            path = ''
+        elif path == '..' or path.startswith('../'):
+            path = None
+
+        return path, unquote(anchor)
+
+    def find_broken(self):
+        """
+        Returns the links to a file or directory that is not in the index, or to an anchor that is not in the file.
+        :return: list (name, line, target) tuples, in the order the files were added
+        """
+        broken = []
+
+        for name, line, target in self.links:
+            path, anchor = self.resolve(name, target)
+
+            if path in self.files:
+                anchors = self.files[path]
+                found = not anchor or anchors is None or anchor in anchors
+            else:
+                found = path is not None and not anchor and path in self.dirs
+
+            if not found:
+                broken.append((name, line, target))
+
+        metrics.increment('links.checked', len(self.links))
+        metrics.increment('links.broken', len(broken))
+        return broken
+
+
+def iter_output_files(path):
+    """
+    Reads the files of a converted resource, from its output directory or from the zip archive written by ZipOutput.
+    Hidden files, such as the conversion state, are skipped.
+    :param str|unicode path: The output directory or the zip archive
+    :return: Yields (name, md_text) tuples, md_text is None for the files that are not markdown
+    """
+    if os.path.isfile(path) and zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                name = info.filename
+                if name.endswith('/') or posixpath.basename(name).startswith('.'):
+                    continue
+                yield name, zf.read(name).decode('utf-8') if name.endswith('.md') else None
+        return
+
+    for name, file_name in _walk_files(path, ''):
+        if name.endswith('.md'):
+            with io.open(file_name, 'r', encoding='utf-8') as in_file:
+                yield name, in_file.read()
+        else:
+            yield name, None
+
+
+def _walk_files(dir_name, path):
+    for entry in scandir(dir_name):
+        if entry.name.startswith('.'):
+            continue
+
+        name = path + '/' + entry.name if path else entry.name
+        if entry.is_dir():
+            for item in _walk_files(entry.path, name):
+                yield item
+        elif entry.is_file():
+            yield name, entry.path
+
+
+def check_links(path):
+    """
+    Checks the relative links of a converted resource, see LinkIndex.
+    :param str|unicode path: The output directory or the zip archive written by ZipOutput
+    :return: list (name, line, target) tuples of the broken links, the name is relative to <path>, or is the name in
+                  the archive
+    """
+    index = LinkIndex()
+    for name, md_text in iter_output_files(path):
+        index.add(name, md_text)
+
+    return index.find_broken()
+
+
+def format_broken_link(broken_link):
+    """
+    :param tuple broken_link: (name, line, target), see LinkIndex.find_broken
+    :return: str|unicode ex. content/kt/god.md:12: ../other/bread.md
+    """
+    return '{0}:{1}: {2}'.format(*broken_link)
@@ -0,0 +1,193 @@
+from __future__ import unicode_literals
+import os
+import threading
+import timeit
+from contextlib import contextmanager
+from datetime import datetime
+from converters.cache import write_json_file
+
+# the Metrics that the stages and counters of the current thread are recorded in, see activate
+_local = threading.local()
+
+
+class Metrics(object):
+    """
+    Collects the time spent in each stage of a conversion, such as listing, downloading, converting and writing,
+    and counters such as bytes read and written, HTTP status codes, retries and cache hits.
+
+    The time of a stage is added up over all the threads that ran it, so with a worker pool it can be longer than
+    the run. Optionally every stage is also kept as an event for a trace file.
+    """
+
+    def __init__(self, trace=False):
+        """
+        :param bool trace: Keep an event for each stage, see save_trace
+        """
+        self.lock = threading.Lock()
+        self.started = datetime.now()
+        self.origin = timeit.default_timer()
+        self.stages = {}
+        self.counters = {}
+        self.events = [] if trace else None
+
+    @contextmanager
+    def stage(self, name, detail=None):
+        """
+        Times the code run in the with block as stage <name>.
+        :param str|unicode name:
+        :param str|unicode detail: Added to the trace event, ex. the URL being downloaded
+        """
+        start = timeit.default_timer()
+        try:
+            yield
+        finally:
+            self.add_stage(name, timeit.default_timer() - start, start, detail)
+
+    def add_stage(self, name, seconds, start=None, detail=None):
+        """
+        Adds a run of stage <name> that took <seconds>, ex. one that was timed in another process.
+        :param str|unicode name:
+        :param float seconds:
+        :param float start: The timeit.default_timer() value when the stage started, it is only added to the trace
+                            when this is given
+        :param str|unicode detail:
+        """
+        with self.lock:
+            stage = self.stages.setdefault(name, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            stage['count'] += 1
+            stage['seconds'] += seconds
+            stage['max_seconds'] = max(stage['max_seconds'], seconds)
+
+            if self.events is not None and start is not None:
+                event = {'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.current_thread().ident,
+                         'ts': int((start - self.origin) * 1000000), 'dur': int(seconds * 1000000)}
+                if detail:
+                    event['args'] = {'detail': detail}
+                self.events.append(event)
+
+    def increment(self, name, value=1):
+        """
+        Adds <value> to counter <name>.
+        :param str|unicode name:
+        :param int|float value:
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self):
+        """
+        Returns the collected stages and counters.
+        :return: dict
+        """
+        with self.lock:
+            return {'started': self.started.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'seconds': timeit.default_timer() - self.origin,
+                    'stages': dict((k, dict(v)) for k, v in self.stages.items()),
+                    'counters': dict(self.counters)}
+
+    def save(self, file_name):
+        """
+        Writes the report to JSON file <file_name>.
+        :param str|unicode file_name:
+        """
+        write_json_file(file_name, self.report())
+
+    def save_trace(self, file_name):
+        """
+        Writes the stage events to <file_name> in the Trace Event Format that chrome://tracing and Perfetto open.
+        :param str|unicode file_name:
+        """
+        with self.lock:
+            events = list(self.events or [])
+
+        write_json_file(file_name, {'traceEvents': events, 'displayTimeUnit': 'ms'})
+
+
+def current():
+    """
+    Returns the Metrics that the current thread records in, or None.
+    :return: Metrics|None
+    """
+    return getattr(_local, 'metrics', None)
+
+
+@contextmanager
+def activate(metrics):
+    """
+    Records the stages and counters of the current thread in <metrics> while the with block runs. WorkerPool passes
+    the Metrics on to the threads that run its tasks.
+    :param Metrics|None metrics:
+    """
+    previous = current()
+    _local.metrics = metrics
+    try:
+        yield metrics
+    finally:
+        _local.metrics = previous
+
+
+def stage(name, detail=None):
+    """
+    Times the code run in the with block as stage <name> of the current Metrics, if there is one.
+    :param str|unicode name:
+    :param str|unicode detail:
+    """
+    metrics = current()
+    if metrics is None:
+        return _no_stage()
+
+    return metrics.stage(name, detail)
+
+
+def add_stage(name, seconds, start=None):
+    """
+    Adds a run of stage <name> that took <seconds> to the current Metrics, if there is one.
+    :param str|unicode name:
+    :param float seconds:
+    :param float start: The timeit.default_timer() value when the stage started
+    """
+    metrics = current()
+    if metrics is not None:
+        metrics.add_stage(name, seconds, start)
+
+
+def increment(name, value=1):
+    """
+    Adds <value> to counter <name> of the current Metrics, if there is one.
+    :param str|unicode name:
+    :param int|float value:
+    """
+    metrics = current()
+    if metrics is not None:
+        metrics.increment(name, value)
+
+
+def record_http(status_code, bytes_in, retries=0):
+    """
+    Counts an HTTP response in the current Metrics.
+    :param int status_code:
+    :param int bytes_in: The size of the body
+    :param int retries: The number of times the request was retried
+    """
+    metrics = current()
+    if metrics is not None:
+        metrics.increment('http.requests')
+        metrics.increment('http.status.{0}'.format(status_code))
+        metrics.increment('http.bytes_in', bytes_in)
+        if retries:
+            metrics.increment('http.retries', retries)
+
+
+def get_retries(response):
+    """
+    Returns the number of times the connection pool retried the request of <response>.
+    :param requests.Response response:
+    :return: int
+    """
+    retries = getattr(getattr(response, 'raw', None), 'retries', None)
+    return len(getattr(retries, 'history', None) or ())
+
+
+@contextmanager
+def _no_stage():
+    yield
@@ -2,10 +2,19 @@ from __future__ import print_function, unicode_literals
 import json
 import os
 import re
-from general_tools.file_utils import write_file
-from general_tools.url_utils import get_languages, join_url_parts, get_url
+from general_tools.url_utils import join_url_parts
 from obs.obs_classes import OBS, OBSManifest, OBSSourceTranslation, OBSManifestEncoder
-from converters.common import quiet_print, dokuwiki_to_markdown
+from converters.common import quiet_print, dokuwiki_to_markdown, dokuwiki_to_markdown_batch, get_url, \
+    configure_session, configure_http_cache
+from converters import metrics
+from converters.cache import get_cache_dir
+from converters.conversion_cache import ConversionCache
+from converters.languages import get_language_data
+from converters.metrics import Metrics
+from converters.output import open_output
+from converters.pipeline import ConversionPipeline, register_batch
+from converters.pool import WorkerPool, DEFAULT_MAX_WORKERS
+from converters.sources import clean_repo_url, get_archive_url, iter_source_files
 
 
 class OBSConverter(object):
@@ -14,34 +23,90 @@ class OBSConverter(object):
     html_tag_re = re.compile(r'<.*?>', re.UNICODE)
     link_tag_re = re.compile(r'\[\[.*?\]\]', re.UNICODE)
 
-    def __init__(self, lang_code, git_repo, out_dir, quiet):
+    # the status of every language is kept in the English repository
+    uwadmin_dir = 'https://raw.githubusercontent.com/Door43/d43-en/master/uwadmin'
+
+    # change this when the conversion changes, so the stories converted by an older version are converted again
+    converter_version = '1'
+
+    def __init__(self, lang_code, git_repo, out_dir, quiet, max_workers=DEFAULT_MAX_WORKERS, cache_dir=None,
+                 output_format='dir', parallel_compression=False, metrics_file=None, trace_file=None,
+                 processes=0, conversion_cache=True, source_archive=None, http_cache=True):
         """
 
         :param unicode lang_code:
         :param unicode git_repo:
         :param unicode out_dir:
         :param bool quiet:
+        :param int max_workers: The number of files to download and convert at the same time
+        :param unicode cache_dir: Where to keep data between runs, defaults to get_cache_dir()
+        :param unicode output_format: 'dir' to write the files to <out_dir>, 'zip' to stream them into <out_dir>.zip
+        :param bool parallel_compression: In zip format, compress the files on separate threads, see ZipOutput
+        :param unicode metrics_file: Write the time spent in each stage of the run, and its counters, to this JSON file
+        :param unicode trace_file: Write an event for each stage to this file, in the Trace Event Format
+        :param int processes: The number of processes that convert the stories, 0 to convert them on the download
+                              threads
+        :param bool conversion_cache: Look up the texts converted before, by any run, see ConversionCache
+        :param unicode|bool source_archive: Read the stories from this tar or zip archive, file name or URL, or from
+                                            this directory, a git checkout or a DokuWiki data directory, instead of
+                                            downloading them one at a time. If True, the archive of the master branch
+                                            of <git_repo> is downloaded from GitHub.
+        :param bool http_cache: Keep the downloaded files with their ETag or Last-Modified date in the cache
+                                directory, and only download them again if they changed, see HttpCache
         """
-        self.git_repo = git_repo
+        # cleaned here rather than in run(), so nothing in run() changes the state of the converter
+        self.git_repo = clean_repo_url(git_repo)
         self.out_dir = out_dir
         self.quiet = quiet
+        self.output_format = output_format
+        self.parallel_compression = parallel_compression
+        self.processes = processes
+
+        # where the converted files are written while run() is working, see open_output
+        self.output = None
+
+        # the time spent in each stage of the run, see converters.metrics
+        self.metrics_file = metrics_file
+        self.trace_file = trace_file
+        self.metrics = Metrics(trace=bool(trace_file))
+
+        # the stories are downloaded by the pool and converted by the pipeline while run() is working
+        self.pool = WorkerPool(max_workers)
+        self.pipeline = None
+        configure_session(pool_maxsize=max_workers)
         # self.temp_dir = ''
 
-        if 'github' not in git_repo and 'file://' not in git_repo:
+        if 'github' not in git_repo and 'file://' not in git_repo and (not source_archive or source_archive is True):
             raise Exception('Currently only github repositories are supported.')
 
+        if source_archive is True:
+            source_archive = get_archive_url(self.git_repo)
+
+        self.source_archive = source_archive
+
+        # the text of each story, by file name, when they are read from <source_archive>
+        self.source_files = None
+
         # get the language data
         try:
-            quiet_print(self.quiet, 'Downloading language data...', end=' ')
-            langs = get_languages()
+            quiet_print(self.quiet, 'Loading language data...', end=' ')
+            with metrics.activate(self.metrics), metrics.stage('languages'):
+                self.lang_data = get_language_data(lang_code, cache_dir)
         finally:
             quiet_print(self.quiet, 'finished.')
 
-        self.lang_data = next((l for l in langs if l['lc'] == lang_code), '')
-
         if not self.lang_data:
             raise Exception('Information for language "{0}" was not found.'.format(lang_code))
 
+        # the caches are made once the arguments are known to be good
+        configure_http_cache(os.path.join(cache_dir or get_cache_dir(), 'http') if http_cache else None)
+
+        # the markdown converted from each text, shared with the other converters and runs
+        self.conversion_cache = None
+        if conversion_cache:
+            self.conversion_cache = ConversionCache(os.path.join(cache_dir or get_cache_dir(), 'conversions.sqlite'),
+                                                    '{0}-{1}'.format(type(self).__name__, self.converter_version))
+
     def __enter__(self):
         return self
 
@@ -50,89 +115,115 @@ class OBSConverter(object):
         # delete temp files
         # if os.path.isdir(self.temp_dir):
         #     shutil.rmtree(self.temp_dir, ignore_errors=True)
-        pass
-
-    def run(self):
-
-        lang_code = self.lang_data['lc']
-
-        # pre-flight checklist
-        if self.git_repo[-1:] == '/':
-            self.git_repo = self.git_repo[:-1]
-
-        # get the source files from the git repository
-        base_url = self.git_repo.replace('github.com', 'raw.githubusercontent.com')
-
-        # initialize
-        obs_obj = OBS()
-        obs_obj.direction = self.lang_data['ld']
-        obs_obj.language = lang_code
-
-        # download needed files from the repository
-        files_to_download = []
-        for i in range(1, 51):
-            files_to_download.append(str(i).zfill(2) + '.txt')
-
-        # download OBS story files
-        story_dir = os.path.join(self.out_dir, 'content')
-        for file_to_download in files_to_download:
-            self.download_obs_file(base_url, file_to_download, story_dir)
 
-        # download front and back matter
-        self.download_obs_file(base_url, 'front-matter.txt', os.path.join(self.out_dir, 'content', '_front'))
-        self.download_obs_file(base_url, 'back-matter.txt', os.path.join(self.out_dir, 'content', '_back'))
+        # the metrics are written even if the run failed
+        if self.metrics_file:
+            self.metrics.save(self.metrics_file)
+        if self.trace_file:
+            self.metrics.save_trace(self.trace_file)
 
-        # get the status
-        uwadmin_dir = 'https://raw.githubusercontent.com/Door43/d43-en/master/uwadmin'
-        status = self.get_json_dict(join_url_parts(uwadmin_dir, lang_code, 'obs/status.txt'))
-        manifest = OBSManifest()
-        manifest.package_version = 0.1
-        manifest.resource['status']['pub_date'] = status['publish_date']
-        manifest.resource['status']['contributors'] = re.split(r'\s*;\s*|\s*,\s*', status['contributors'])
-        manifest.resource['status']['checking_level'] = status['checking_level']
-        manifest.resource['status']['comments'] = status['comments']
-        manifest.resource['status']['version'] = status['version']
-        manifest.resource['status']['checking_entity'] = re.split(r'\s*;\s*|\s*,\s*', status['checking_entity'])
-
-        source_translation = OBSSourceTranslation()
-        source_translation.language_slug = status['source_text']
-        source_translation.resource_slug = 'obs'
-        source_translation.version = status['source_text_version']
+    def run(self):
 
-        manifest.resource['status']['source_translations'].append(source_translation)
+        with metrics.activate(self.metrics), \
+                ConversionPipeline(self.pool, self.processes, cache=self.conversion_cache) as self.pipeline, \
+                open_output(self.out_dir, self.output_format, self.parallel_compression) as self.output:
+            lang_code = self.lang_data['lc']
+
+            # get the source files from the git repository
+            base_url = self.git_repo.replace('github.com', 'raw.githubusercontent.com')
+
+            # initialize
+            obs_obj = OBS()
+            obs_obj.direction = self.lang_data['ld']
+            obs_obj.language = lang_code
+
+            # download needed files from the repository
+            story_dir = os.path.join(self.out_dir, 'content')
+            files_to_download = []
+            for i in range(1, 51):
+                files_to_download.append((str(i).zfill(2) + '.txt', story_dir))
+
+            # front and back matter
+            files_to_download.append(('front-matter.txt', os.path.join(self.out_dir, 'content', '_front')))
+            files_to_download.append(('back-matter.txt', os.path.join(self.out_dir, 'content', '_back')))
+
+            if self.source_archive:
+                with metrics.stage('read_source'):
+                    self.source_files = self.read_source_files()
+
+            # download OBS story files
+            self.pipeline.run(files_to_download, lambda f: self.download_obs_file(base_url, f[0]),
+                              lambda f, md_text: self.write_obs_file(f[0], f[1], md_text))
+
+            # get the status
+            with metrics.stage('status'):
+                status = self.get_json_dict(join_url_parts(self.uwadmin_dir, lang_code, 'obs/status.txt'))
+
+            with metrics.stage('manifest'):
+                manifest = OBSManifest()
+                manifest.package_version = 0.1
+                manifest.resource['status']['pub_date'] = status['publish_date']
+                manifest.resource['status']['contributors'] = re.split(r'\s*;\s*|\s*,\s*', status['contributors'])
+                manifest.resource['status']['checking_level'] = status['checking_level']
+                manifest.resource['status']['comments'] = status['comments']
+                manifest.resource['status']['version'] = status['version']
+                manifest.resource['status']['checking_entity'] = re.split(r'\s*;\s*|\s*,\s*', status['checking_entity'])
+
+                source_translation = OBSSourceTranslation()
+                source_translation.language_slug = status['source_text']
+                source_translation.resource_slug = 'obs'
+                source_translation.version = status['source_text_version']
+
+                manifest.resource['status']['source_translations'].append(source_translation)
+
+                manifest.language['slug'] = lang_code
+                manifest.language['name'] = self.lang_data['ang']
+                manifest.language['dir'] = self.lang_data['ld']
+
+                manifest_str = json.dumps(manifest, sort_keys=False, indent=2, cls=OBSManifestEncoder)
+                self.output.write_file(os.path.join(self.out_dir, 'package.json'), manifest_str)
+
+    def read_source_files(self):
+        """
+        Reads the stories from the source archive or directory.
+        :return: dict The DokuWiki text of each story, by file name
+        """
+        quiet_print(self.quiet, 'Reading {0}.'.format(self.source_archive))
 
-        manifest.language['slug'] = lang_code
-        manifest.language['name'] = self.lang_data['ang']
-        manifest.language['dir'] = self.lang_data['ld']
+        source_files = {}
+        for path, dw_text in iter_source_files(self.source_archive, ['obs'], self.lang_data['lc']):
+            dir_name, file_name = path.rsplit('/', 1)
+            if dir_name == 'obs':
+                source_files[file_name] = dw_text
 
-        manifest_str = json.dumps(manifest, sort_keys=False, indent=2, cls=OBSManifestEncoder)
-        write_file(os.path.join(self.out_dir, 'package.json'), manifest_str)
+        return source_files
 
-    def download_obs_file(self, base_url, file_to_download, out_dir):
+    def download_obs_file(self, base_url, file_to_download):
+        """
+        Downloads the DokuWiki text of a story, or looks it up in the files read from the source archive.
+        :return: tuple The function that converts the story and its text, see ConversionPipeline.run
+        """
+        if self.source_files is not None:
+            if file_to_download not in self.source_files:
+                raise Exception('{0} was not found in {1}.'.format(file_to_download, self.source_archive))
+            return convert_story_text, self.source_files[file_to_download]
 
         download_url = join_url_parts(base_url, 'master/obs', file_to_download)
 
         try:
             quiet_print(self.quiet, 'Downloading {0}...'.format(download_url), end=' ')
-            dw_text = get_url(download_url)  # .decode('utf-8')
+            with metrics.stage('download', download_url):
+                dw_text = get_url(download_url)  # .decode('utf-8')
 
         finally:
             quiet_print(self.quiet, 'finished.')
 
-        quiet_print(self.quiet, 'Converting {0} to markdown...'.format(file_to_download), end=' ')
-        md_text = dokuwiki_to_markdown(dw_text)
+        return convert_story_text, dw_text
 
-        old_url = 'https://api.unfoldingword.org/obs/jpg/1/en/'
-        cdn_url = 'https://cdn.door43.org/obs/jpg/'
-        md_text = md_text.replace(old_url, cdn_url)
-
-        quiet_print(self.quiet, 'finished.')
+    def write_obs_file(self, file_to_download, out_dir, md_text):
 
         save_as = os.path.join(out_dir, file_to_download.replace('.txt', '.md'))
-
-        quiet_print(self.quiet, 'Saving {0}...'.format(save_as), end=' ')
-        write_file(save_as, md_text)
-        quiet_print(self.quiet, 'finished.')
+        self.output.write_file(save_as, md_text)
 
     def clean_text(self, text):
         """
@@ -160,3 +251,30 @@ class OBSConverter(object):
             return_val[k.strip().lower().replace(' ', '_')] = v.strip()
 
         return return_val
+
+
+def convert_story_text(dw_text):
+    """
+    Converts the DokuWiki text of a story to markdown. This runs in the conversion processes.
+    :param str|unicode dw_text:
+    :return: str|unicode
+    """
+    return use_cdn_images(dokuwiki_to_markdown(dw_text))
+
+
+def convert_story_texts(dw_texts):
+    """
+    Converts several stories in one call, the same as convert_story_text converts each one.
+    :param list dw_texts:
+    :return: list
+    """
+    return [use_cdn_images(md_text) for md_text in dokuwiki_to_markdown_batch(dw_texts)]
+
+
+def use_cdn_images(md_text):
+    old_url = 'https://api.unfoldingword.org/obs/jpg/1/en/'
+    cdn_url = 'https://cdn.door43.org/obs/jpg/'
+    return md_text.replace(old_url, cdn_url)
+
+
+register_batch(convert_story_text, convert_story_texts)
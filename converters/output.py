@@ -0,0 +1,304 @@
+from __future__ import unicode_literals
+import io
+import multiprocessing
+import os
+import struct
+import threading
+import time
+import zlib
+from general_tools.file_utils import make_dir
+from converters.cache import write_text_file, replace_file
+from converters.state import STATE_FILE_NAME
+from converters import metrics
+
+try:
+    from queue import Queue
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from Queue import Queue
+
+OUTPUT_FORMATS = ('dir', 'zip')
+
+
+def open_output(out_dir, output_format='dir', parallel_compression=False):
+    """
+    Returns the output backend that the converters write the files of <out_dir> to.
+    :param str|unicode out_dir: The output directory of the converter
+    :param str|unicode output_format: 'dir' to write each file to the disk, 'zip' to write them to <out_dir>.zip
+    :param bool parallel_compression: In zip format, compress the files on separate threads, see ZipOutput
+    :return: DirectoryOutput|ZipOutput
+    """
+    if output_format == 'dir':
+        return DirectoryOutput(out_dir)
+
+    if output_format == 'zip':
+        return ZipOutput(out_dir.rstrip('/\\') + '.zip', out_dir, parallel_compression)
+
+    raise ValueError('Unknown output format "{0}", expected one of {1}.'.format(output_format,
+                                                                                ', '.join(OUTPUT_FORMATS)))
+
+
+class DirectoryOutput(object):
+    """
+    Writes each converted file to the disk. Each file is written to a temporary file and renamed, so a conversion
+    that is killed never leaves a truncated file behind.
+    """
+
+    def __init__(self, out_dir):
+        """
+        :param str|unicode out_dir:
+        """
+        self.out_dir = out_dir
+
+        # where the converted files can be read once the output is closed, see check_links
+        self.path = out_dir
+
+        # the conversion state is kept next to the files, see ConversionState
+        self.state_file = os.path.join(out_dir, STATE_FILE_NAME)
+
+    def __enter__(self):
+        return self
+
+    # noinspection PyUnusedLocal
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    @staticmethod
+    def write_file(file_name, text):
+        with metrics.stage('write'):
+            # worker threads may create the same directory at the same time, which make_dir does not allow for
+            dir_name = os.path.dirname(file_name)
+            if not os.path.isdir(dir_name):
+                try:
+                    os.makedirs(dir_name)
+                except OSError:
+                    if not os.path.isdir(dir_name):
+                        raise
+
+            write_text_file(file_name, text)
+
+        metrics.increment('output.files')
+        metrics.increment('output.bytes_out', len(text.encode('utf-8')))
+
+    @staticmethod
+    def isfile(file_name):
+        return os.path.isfile(file_name)
+
+    @staticmethod
+    def remove(file_name):
+        if os.path.isfile(file_name):
+            os.remove(file_name)
+
+
+class ZipOutput(object):
+    """
+    Streams the converted files straight into a zip archive, in a top-level directory named after the output
+    directory, instead of writing each one to the disk. The archive is written to a temporary file and only
+    renamed to <zip_file> when the conversion finishes without an error. An archive with more than 65535 files, or
+    larger than 4 GiB, uses the ZIP64 extensions.
+
+    The files are deflated with zlib, which releases the GIL. The converters write the files from one thread, so with
+    <parallel> write_file only queues each file, <threads> compression threads deflate them and work out their CRC,
+    and the archive lock is only held to append the compressed bytes. The standard zipfile module compresses while
+    it holds its lock, so the archive is written with a small writer of local headers and the central directory.
+    """
+
+    def __init__(self, zip_file, out_dir, parallel=False, compress_level=6, threads=None):
+        """
+        :param str|unicode zip_file: The archive to create
+        :param str|unicode out_dir: The output directory of the converter, the names in the archive are relative to
+                                    its parent directory
+        :param bool parallel: Compress the files on the compression threads
+        :param int compress_level: The zlib compression level
+        :param int threads: The number of compression threads, defaults to the number of CPUs
+        """
+        self.zip_file = zip_file
+        self.out_dir = out_dir
+        self.parallel = parallel
+        self.compress_level = compress_level
+        self.threads = threads or multiprocessing.cpu_count()
+        self.root_dir = os.path.dirname(os.path.abspath(out_dir))
+        self.path = zip_file
+
+        # nothing is kept between runs, every file is converted again
+        self.state_file = None
+
+        self.lock = threading.Lock()
+        self.entries = []
+        self.names = set()
+        self.temp_name = None
+        self.fp = None
+
+        # the files waiting for a compression thread, a few per thread so the writer waits when they fall behind
+        self.pending = None
+        self.workers = []
+        self.errors = []
+
+    def __enter__(self):
+        make_dir(os.path.dirname(os.path.abspath(self.zip_file)))
+        self.temp_name = '{0}.{1}.tmp'.format(self.zip_file, os.getpid())
+        self.fp = io.open(self.temp_name, 'wb')
+
+        if self.parallel:
+            self.pending = Queue(self.threads * 4)
+            active_metrics = metrics.current()
+            for _ in range(self.threads):
+                worker = threading.Thread(target=self._compress_pending, args=(active_metrics,))
+                worker.daemon = True
+                worker.start()
+                self.workers.append(worker)
+
+        return self
+
+    # noinspection PyUnusedLocal
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._stop_workers()
+            self.fp.close()
+            os.remove(self.temp_name)
+
+    def get_name(self, file_name):
+        return os.path.relpath(os.path.abspath(file_name), self.root_dir).replace(os.sep, '/')
+
+    def write_file(self, file_name, text):
+        """
+        Adds <text> to the archive as <file_name>, a path in the output directory. With <parallel> the file is only
+        queued, it is in the archive once the output is closed.
+        :param str|unicode file_name:
+        :param str|unicode text:
+        """
+        name = self.get_name(file_name)
+        data = text.encode('utf-8') if not isinstance(text, bytes) else text
+
+        with self.lock:
+            if self.errors:
+                raise self.errors[0]
+            if name in self.names:
+                raise ValueError('{0} was already written to {1}.'.format(name, self.zip_file))
+            self.names.add(name)
+
+        if self.parallel:
+            self.pending.put((name, data))
+        else:
+            self._add(name, data)
+
+    def isfile(self, file_name):
+        with self.lock:
+            return self.get_name(file_name) in self.names
+
+    def remove(self, file_name):
+        # the archive only holds the files written by this run
+        pass
+
+    def _compress_pending(self, active_metrics):
+        with metrics.activate(active_metrics):
+            while True:
+                entry = self.pending.get()
+                if entry is None:
+                    return
+
+                try:
+                    self._add(*entry)
+                except Exception as e:
+                    with self.lock:
+                        self.errors.append(e)
+
+    def _stop_workers(self):
+        for _ in self.workers:
+            self.pending.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+
+    def _add(self, name, data):
+        with metrics.stage('compress'):
+            compressor = zlib.compressobj(self.compress_level, zlib.DEFLATED, -zlib.MAX_WBITS)
+            compressed = compressor.compress(data) + compressor.flush()
+            crc = zlib.crc32(data) & 0xffffffff
+
+        with metrics.stage('write'), self.lock:
+            self._write_entry(name, data, crc, compressed)
+
+        metrics.increment('output.files')
+        metrics.increment('output.bytes_out', len(compressed))
+
+    def _write_entry(self, name, data, crc, compressed):
+        name_bytes = name.encode('utf-8')
+        dos_time, dos_date = _dos_date_time(time.localtime())
+        offset = self.fp.tell()
+
+        # the sizes of a file of 4 GiB or more only fit in the ZIP64 extra field
+        if len(data) >= ZIP64_LIMIT or len(compressed) >= ZIP64_LIMIT:
+            extra = struct.pack(str('<HHQQ'), 1, 16, len(data), len(compressed))
+            sizes = (0xffffffff, 0xffffffff)
+        else:
+            extra = b''
+            sizes = (len(compressed), len(data))
+
+        self.fp.write(struct.pack(_local_header, b'PK\x03\x04', 45 if extra else 20, _utf8_flag, 8, dos_time,
+                                  dos_date, crc, sizes[0], sizes[1], len(name_bytes), len(extra)))
+        self.fp.write(name_bytes)
+        self.fp.write(extra)
+        self.fp.write(compressed)
+
+        self.entries.append((name_bytes, dos_time, dos_date, crc, len(compressed), len(data), offset))
+
+    def close(self):
+        """
+        Waits for the compression threads, writes the central directory of the archive and moves it to <zip_file>.
+        """
+        self._stop_workers()
+        if self.errors:
+            self.fp.close()
+            os.remove(self.temp_name)
+            raise self.errors[0]
+
+        directory_offset = self.fp.tell()
+        for name_bytes, dos_time, dos_date, crc, compressed_size, size, offset in self.entries:
+            # each value that does not fit in its field is moved to the ZIP64 extra field, in this order
+            values = [size, compressed_size, offset]
+            large = [value for value in values if value >= ZIP64_LIMIT]
+            extra = struct.pack(str('<HH{0}Q'.format(len(large))), 1, 8 * len(large), *large) if large else b''
+            size, compressed_size, offset = [min(value, 0xffffffff) for value in values]
+
+            version = 45 if extra else 20
+            self.fp.write(struct.pack(_central_header, b'PK\x01\x02', version, version, _utf8_flag, 8, dos_time,
+                                      dos_date, crc, compressed_size, size, len(name_bytes), len(extra), 0, 0, 0,
+                                      0o644 << 16, offset))
+            self.fp.write(name_bytes)
+            self.fp.write(extra)
+
+        directory_size = self.fp.tell() - directory_offset
+        count = len(self.entries)
+
+        if count > 0xffff or directory_offset >= ZIP64_LIMIT or directory_size >= ZIP64_LIMIT:
+            end_offset = self.fp.tell()
+            self.fp.write(struct.pack(_zip64_end_record, b'PK\x06\x06', 44, 45, 45, 0, 0, count, count,
+                                      directory_size, directory_offset))
+            self.fp.write(struct.pack(_zip64_end_locator, b'PK\x06\x07', 0, end_offset, 1))
+
+        self.fp.write(struct.pack(_end_record, b'PK\x05\x06', 0, 0, min(count, 0xffff), min(count, 0xffff),
+                                  min(directory_size, 0xffffffff), min(directory_offset, 0xffffffff), 0))
+        self.fp.close()
+        replace_file(self.temp_name, self.zip_file)
+
+
+# the zip record layouts, see https://pkware.cachefly.net/webdocs/casestudies/APPNOTE.TXT
+_local_header = str('<4sHHHHHIIIHH')
+_central_header = str('<4sHHHHHHIIIHHHHHII')
+_end_record = str('<4sHHHHIIH')
+_zip64_end_record = str('<4sQHHIIQQQQ')
+_zip64_end_locator = str('<4sIQI')
+
+# a size or offset from this one on is written in the ZIP64 records
+ZIP64_LIMIT = 0xffffffff
+
+# the names are encoded as UTF-8
+_utf8_flag = 0x800
+
+
+def _dos_date_time(t):
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), \
+           ((max(t.tm_year, 1980) - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
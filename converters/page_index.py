@@ -0,0 +1,140 @@
+from __future__ import unicode_literals
+import re
+import threading
+
+# the first heading of a page is its title
+heading_re = re.compile(r'^\s*={2,6}\s*(.*?)\s*={2,6}\s*$', re.UNICODE | re.MULTILINE)
+tags_re = re.compile(r'\{\{tag>(.*?)\}\}', re.UNICODE)
+
+# a query term, ex. god, -god, tag:kt, title:"son of god", tag:fa*
+query_term_re = re.compile(r'(-?)(?:(tag|title):)?("[^"]*"|\S+)', re.UNICODE)
+
+
+class PageIndex(object):
+    """
+    The titles and tags of the pages of a DokuWiki corpus, to answer door43pages queries without asking door43.
+
+    A query is a list of terms, all of which a page has to match. The word "or" separates alternatives. A term
+    matches a tag, a word of the title or the name of the page, "tag:" or "title:" in front of it limits it to one of
+    those, a "*" at its end matches any ending and a "-" in front of it excludes the pages that match it. A quoted
+    term matches a phrase in the title. Case is ignored.
+
+    The results are the pages in the namespace or below it, except the home page, sorted by name, as [url, title]
+    pairs like door43 returns.
+    """
+
+    def __init__(self, namespaces):
+        """
+        :param list namespaces: The namespaces the corpus holds all the pages of, ex. ['en:obe:kt', 'en:obe:other']
+        """
+        self.namespaces = [n.strip(':') for n in namespaces]
+        self.pages = {}
+        self.lock = threading.Lock()
+
+    def covers(self, namespace):
+        """
+        Returns True if the queries for <namespace> can be answered from this index.
+        :param str|unicode namespace:
+        :return: bool
+        """
+        namespace = namespace.strip(':')
+        return any(namespace == n or namespace.startswith(n + ':') for n in self.namespaces)
+
+    @staticmethod
+    def read_page(dw_text):
+        """
+        Returns what the index keeps of a page: its title and tags.
+        :param str|unicode dw_text: The DokuWiki text of the page
+        :return: dict
+        """
+        heading = heading_re.search(dw_text)
+        tags = []
+        for match in tags_re.finditer(dw_text):
+            tags.extend(t.lower() for t in match.group(1).split())
+
+        return {'title': heading.group(1) if heading else None, 'tags': tags}
+
+    def add(self, page_id, page):
+        """
+        :param str|unicode page_id: ex. en:obe:kt:god
+        :param dict page: See read_page
+        """
+        with self.lock:
+            self.pages[page_id] = page
+
+    def get(self, page_id):
+        with self.lock:
+            return self.pages.get(page_id)
+
+    def query(self, namespace, query):
+        """
+        Returns the [url, title] pairs of the pages in <namespace> that match <query>.
+        :param str|unicode namespace: ex. en:obe:kt
+        :param str|unicode query: See the class description
+        :return: list
+        """
+        prefix = namespace.strip(':') + ':'
+        alternatives = parse_query(query)
+
+        with self.lock:
+            pages = sorted((k, v) for k, v in self.pages.items() if k.startswith(prefix))
+
+        results = []
+        for page_id, page in pages:
+            name = page_id.rsplit(':', 1)[-1]
+            if name == 'home':
+                continue
+
+            if any(all(match_term(name, page, term) != negated for negated, term in terms) for terms in alternatives):
+                results.append(['/' + page_id.replace(':', '/'), page['title'] or name])
+
+        return results
+
+
+def parse_query(query):
+    """
+    Splits a door43pages query into its alternatives.
+    :param str|unicode query:
+    :return: list Lists of (negated, (field, value, is_prefix)) tuples, one list for each alternative
+    """
+    alternatives = [[]]
+
+    for match in query_term_re.finditer(query.lower()):
+        negated, field, value = match.groups()
+
+        if value == 'or' and not negated and not field:
+            alternatives.append([])
+            continue
+
+        if value.startswith('"'):
+            alternatives[-1].append((bool(negated), ('phrase', value.strip('"'), False)))
+        else:
+            is_prefix = value.endswith('*')
+            alternatives[-1].append((bool(negated), (field, value.rstrip('*'), is_prefix)))
+
+    return [terms for terms in alternatives if terms] or [[]]
+
+
+def match_term(name, page, term):
+    """
+    Returns True if the page named <name> matches query term <term>, see parse_query.
+    :return: bool
+    """
+    field, value, is_prefix = term
+    title = (page['title'] or '').lower()
+
+    if field == 'phrase':
+        return value in title
+
+    words = []
+    if field in (None, 'tag'):
+        words.extend(page['tags'])
+    if field in (None, 'title'):
+        words.extend(re.findall(r'\w+', title, re.UNICODE))
+    if field is None:
+        words.append(name)
+
+    if is_prefix:
+        return any(w.startswith(value) for w in words)
+
+    return value in words
@@ -0,0 +1,356 @@
+from __future__ import unicode_literals
+import multiprocessing
+import threading
+import timeit
+from converters import metrics
+
+try:
+    from queue import Queue
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from Queue import Queue
+
+# the size of the texts that may be fetched before they are written
+DEFAULT_MAX_QUEUED_BYTES = 64 * 1024 * 1024
+
+# the number of texts converted together at once
+DEFAULT_BATCH_SIZE = 32
+
+# the functions that convert a list of texts, by the function that converts one text, see register_batch
+batch_functions = {}
+
+
+class ConversionPipeline(object):
+    """
+    Runs a conversion in three stages, so the waits for the network and the work of the CPU overlap:
+
+    * fetch: the threads of a WorkerPool get the DokuWiki text of each file
+    * convert: a pool of processes converts the text to markdown, without processes a thread of the pipeline does it
+    * write: the thread that called run saves each converted file
+
+    The texts that have been fetched but not written yet are limited to <max_queued_bytes>. When there are more the
+    fetch threads wait for the writer, so the memory used does not grow with the size of the language.
+
+    With a ConversionCache, a text that was converted before is looked up on the fetch thread instead of being
+    converted, and the writer adds the texts that were converted to the cache.
+
+    The texts that are fetched while the conversion is busy are converted together, up to <batch_size> at once, see
+    convert_texts, whether they are sent to a process or converted on the thread. Sending a text to a process and
+    getting it back costs more than converting a small file, and a function registered with register_batch converts
+    a batch in one call. A text is never held back to wait for others.
+    """
+
+    def __init__(self, pool, processes=0, max_queued_bytes=DEFAULT_MAX_QUEUED_BYTES, cache=None,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        """
+        :param WorkerPool pool: The threads that fetch the files
+        :param int processes: The number of processes that convert the files, 0 to convert them on a thread
+        :param int max_queued_bytes: The size of the texts that may be waiting to be converted and written
+        :param ConversionCache cache: The texts converted before, None to convert every text
+        :param int batch_size: The number of texts converted together at once
+        """
+        self.pool = pool
+        self.processes = processes
+        self.max_queued_bytes = max_queued_bytes
+        self.cache = cache
+        self.batch_size = batch_size
+        self.process_pool = None
+
+    def __enter__(self):
+        if self.processes > 0:
+            self.process_pool = multiprocessing.Pool(self.processes)
+        return self
+
+    # noinspection PyUnusedLocal
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.process_pool is not None:
+            if exc_type is None:
+                self.process_pool.close()
+            else:
+                self.process_pool.terminate()
+            self.process_pool.join()
+            self.process_pool = None
+
+    def run(self, items, fetch, write):
+        """
+        Fetches, converts and writes each of <items>.
+
+        All the files that were fetched are allowed to finish before returning. An error from the writer, or from
+        converting a file, is raised straight away and stops the fetching. An error from fetching is raised after
+        the other files are written.
+        :param items: The files to convert, may be a generator, it is read on another thread
+        :param fetch: A function that takes an item and returns a tuple of the function that converts it and the
+                      text to convert. The function is sent to a process, so it has to be defined at the top level
+                      of a module, and it cannot use the state of the converter.
+        :param write: A function that takes an item and its converted text, it is called on the calling thread
+        """
+        converted = Queue()
+        budget = ByteBudget(self.max_queued_bytes)
+        done = object()
+        errors = []
+        active_metrics = metrics.current()
+
+        # the texts waiting to be converted, in the order they were fetched
+        ready = Queue()
+
+        def fetch_and_convert(item):
+            # the writer failed, the error is raised by run
+            if budget.stopped:
+                return
+
+            convert, text = fetch(item)
+            size = get_size(text)
+            budget.acquire(size)
+
+            key = self.cache.get_key(convert, text) if self.cache is not None else None
+            md_text = self.cache.get(key) if key is not None else None
+
+            if md_text is None:
+                ready.put((item, size, key, convert, text))
+            else:
+                # there is nothing to add to the cache
+                converted.put((item, size, None, CachedText(md_text)))
+
+        def submit():
+            # every text that is ready is converted, the texts of each function together
+            finished = False
+            while not finished:
+                batch = [ready.get()]
+                while len(batch) < self.batch_size and not ready.empty():
+                    batch.append(ready.get())
+
+                if batch[-1] is done:
+                    batch.pop()
+                    finished = True
+
+                groups = []
+                for entry in batch:
+                    group = next((g for g in groups if g[0][3] is entry[3]), None)
+                    if group is None:
+                        groups.append([entry])
+                    else:
+                        group.append(entry)
+
+                for group in groups:
+                    # split so every process gets a share
+                    chunk_size = -(-len(group) // self.processes) if self.process_pool is not None else len(group)
+                    for chunk in (group[i:i + chunk_size] for i in range(0, len(group), chunk_size)):
+                        convert, texts = chunk[0][3], [e[4] for e in chunk]
+                        if self.process_pool is None:
+                            result = ConvertedBatch(convert, texts)
+                        else:
+                            try:
+                                result = self.process_pool.apply_async(convert_texts, (convert, texts))
+                            except Exception as e:
+                                result = FailedBatch(e)
+                        for index, (item, size, key, convert, text) in enumerate(chunk):
+                            converted.put((item, size, key, BatchPart(result, index)))
+
+            converted.put(done)
+
+        def unless_stopped():
+            for item in items:
+                if budget.stopped:
+                    return
+                yield item
+
+        def produce():
+            with metrics.activate(active_metrics):
+                try:
+                    self.pool.map(fetch_and_convert, unless_stopped())
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    ready.put(done)
+
+        producer = threading.Thread(target=produce)
+        producer.daemon = True
+        producer.start()
+
+        submitter = threading.Thread(target=submit)
+        submitter.daemon = True
+        submitter.start()
+
+        try:
+            while True:
+                entry = converted.get()
+                if entry is done:
+                    break
+
+                item, size, key, result = entry
+                try:
+                    md_text, start, seconds = result.get()
+                    if start is not None:
+                        metrics.add_stage('convert', seconds, start)
+                    if key is not None:
+                        self.cache.set(key, md_text)
+                    write(item, md_text)
+                finally:
+                    budget.release(size)
+
+        except Exception:
+            budget.stop()
+            raise
+
+        finally:
+            producer.join()
+            submitter.join()
+
+        if errors:
+            raise errors[0]
+
+
+class ByteBudget(object):
+    """
+    Limits the size of the texts that are between the fetch and the write stage of a ConversionPipeline.
+    """
+
+    def __init__(self, limit):
+        """
+        :param int limit:
+        """
+        self.limit = limit
+        self.used = 0
+        self.stopped = False
+        self.condition = threading.Condition()
+
+    def acquire(self, size):
+        """
+        Waits until there is room for a text of <size>. A text larger than the limit is let in when nothing else is
+        waiting.
+        :param int size:
+        """
+        with self.condition:
+            if self.used and self.used + size > self.limit:
+                metrics.increment('pipeline.waits')
+
+            while not self.stopped and self.used and self.used + size > self.limit:
+                self.condition.wait()
+
+            if self.stopped:
+                raise Exception('The conversion was stopped.')
+
+            self.used += size
+
+    def release(self, size):
+        with self.condition:
+            self.used -= size
+            self.condition.notify_all()
+
+    def stop(self):
+        """
+        Stops the fetch stage, the threads waiting for room raise an exception.
+        """
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+
+class ConvertedBatch(object):
+    """
+    Texts converted together on the current thread by convert_texts, with the same get method as the results of the
+    process pool.
+    """
+
+    def __init__(self, convert, texts):
+        try:
+            self.value = convert_texts(convert, texts)
+            self.error = None
+        except Exception as e:
+            self.error = e
+
+    def get(self):
+        if self.error is not None:
+            raise self.error
+
+        return self.value
+
+
+class CachedText(object):
+    """
+    A text found in the ConversionCache, with the same get method as the results of the process pool.
+    """
+
+    def __init__(self, md_text):
+        self.md_text = md_text
+
+    def get(self):
+        return self.md_text, None, 0
+
+
+class BatchPart(object):
+    """
+    One of the texts converted together by convert_texts, with the same get method as the results of the process
+    pool. An error converting any text of the batch is raised for all of them.
+    """
+
+    def __init__(self, result, index):
+        """
+        :param result: The result of the process pool for the whole batch
+        :param int index: The position of the text in the batch
+        """
+        self.result = result
+        self.index = index
+
+    def get(self):
+        return self.result.get()[self.index]
+
+
+class FailedBatch(object):
+    """
+    A batch that could not be sent to the processes, with the same get method as the results of the process pool.
+    """
+
+    def __init__(self, error):
+        self.error = error
+
+    def get(self):
+        raise self.error
+
+
+def get_size(text):
+    """
+    Returns the number of bytes <text> takes in UTF-8, the characters of most languages take two to four.
+    :param str|unicode|bytes text:
+    :return: int
+    """
+    return len(text) if isinstance(text, bytes) else len(text.encode('utf-8'))
+
+
+def register_batch(convert, convert_batch):
+    """
+    Registers the function that converts a list of texts the same as <convert> converts each one, see
+    convert_texts. Call it at the top level of the module that defines them, so it runs in every process.
+    :param convert: A function that takes a text and returns its markdown
+    :param convert_batch: A function that takes a list of texts and returns the list of their markdown
+    """
+    batch_functions[convert] = convert_batch
+
+
+def convert_texts(convert, texts):
+    """
+    Converts several texts in one call, so a process is sent all of them at once. When a batch function was
+    registered for <convert> it converts all the texts together, and the time it took is shared between them. The
+    result of each text is the same as converting it alone with convert_text.
+    :param convert: A function defined at the top level of a module
+    :param list texts:
+    :return: list The result of convert_text for each text, in the order of <texts>
+    """
+    convert_batch = batch_functions.get(convert)
+    if convert_batch is None:
+        return [convert_text(convert, text) for text in texts]
+
+    start = timeit.default_timer()
+    md_texts = convert_batch(texts)
+    seconds = (timeit.default_timer() - start) / len(texts)
+    return [(md_text, start + index * seconds, seconds) for index, md_text in enumerate(md_texts)]
+
+
+def convert_text(convert, text):
+    """
+    Returns the result of convert(text), when it started and how long it took. The timer is the same in all the
+    processes, so the start can be added to the trace of the parent process.
+    """
+    start = timeit.default_timer()
+    md_text = convert(text)
+    return md_text, start, timeit.default_timer() - start
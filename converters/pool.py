@@ -0,0 +1,128 @@
+from __future__ import unicode_literals
+import threading
+from converters.common import capture_output, quiet_print
+from converters import metrics
+
+try:
+    from queue import Queue
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from Queue import Queue
+
+DEFAULT_MAX_WORKERS = 8
+
+
+class WorkerPool(object):
+    """
+    A bounded pool of worker threads used to download and convert files in parallel.
+
+    Progress messages printed by a task with quiet_print are buffered and written out in the order the tasks
+    were submitted, so the console output of a run does not depend on which download finishes first. The tasks
+    record their stages and counters in the Metrics that is active on the thread that calls map.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        :param int max_workers: The maximum number of tasks to run at the same time
+        """
+        if max_workers < 1:
+            raise ValueError('max_workers must be at least 1.')
+
+        self.max_workers = max_workers
+
+    def map(self, func, items, queue_size=None):
+        """
+        Calls <func> once for each item in <items> and returns the results in the same order as <items>.
+
+        <items> may be a generator. It is read while the tasks run, at most <queue_size> items ahead of the workers,
+        so the tasks can start before the last item has been produced.
+
+        All the tasks are allowed to finish before returning. If any of them failed, the exception raised by
+        the first failed task, in the order of <items>, is raised again. If reading <items> failed, the tasks that
+        were already started are finished and then that exception is raised.
+        :param func: A function that takes one argument
+        :param items: The arguments to pass to <func>
+        :param int queue_size: The number of items to read ahead, defaults to twice the number of workers
+        :return: list
+        """
+        results = []
+        finished = {}
+        condition = threading.Condition()
+        errors = []
+        read_error = None
+        active_metrics = metrics.current()
+
+        def run_task(index, item):
+            with capture_output() as output, metrics.activate(active_metrics):
+                try:
+                    result = (True, func(item))
+                except Exception as e:
+                    result = (False, e)
+
+            with condition:
+                finished[index] = result + (''.join(output),)
+                condition.notify_all()
+
+        def write_finished(count, wait):
+            # write the buffered output in the order the tasks were submitted
+            while len(results) < count:
+                index = len(results)
+                with condition:
+                    while index not in finished:
+                        if not wait:
+                            return
+                        condition.wait()
+                    succeeded, value, output = finished.pop(index)
+
+                if output:
+                    quiet_print(False, output, end='')
+
+                if succeeded:
+                    results.append(value)
+                else:
+                    results.append(None)
+                    errors.append(value)
+
+        # with a single worker the tasks run on the calling thread
+        tasks = None
+        threads = []
+
+        if self.max_workers > 1:
+            tasks = Queue(maxsize=queue_size or self.max_workers * 2)
+
+            def worker():
+                while True:
+                    task = tasks.get()
+                    if task is None:
+                        return
+                    run_task(*task)
+
+            threads = [threading.Thread(target=worker) for _ in range(self.max_workers)]
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+
+        count = 0
+        try:
+            for item in items:
+                if tasks is None:
+                    run_task(count, item)
+                else:
+                    tasks.put((count, item))
+                count += 1
+                write_finished(count, False)
+        except Exception as e:
+            read_error = e
+        finally:
+            for _ in threads:
+                tasks.put(None)
+
+        write_finished(count, True)
+
+        if errors:
+            raise errors[0]
+
+        if read_error is not None:
+            raise read_error
+
+        return results
@@ -0,0 +1,224 @@
+from __future__ import unicode_literals
+import hashlib
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from general_tools.file_utils import make_dir
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError
+from requests.packages.urllib3.response import HTTPResponse
+from converters import metrics
+
+RECORDING_MODES = ('record', 'replay')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# a query parameter that carries a credential, and the ? or & left behind at the end when it is removed
+credential_re = re.compile(r'(?<=[?&])access_token=[^&#]*&?', re.UNICODE)
+trailing_separator_re = re.compile(r'[?&](?=#|$)', re.UNICODE)
+
+
+def strip_credentials(url):
+    """
+    Returns <url> without its access_token parameter. The recordings are shared and replayed, so they must not hold
+    a credential, and a request matches its recording whether or not it was sent with a token.
+    :param str|unicode url: ex. https://api.github.com/repos/Door43/d43-en?recursive=1&access_token=abc
+    :return: str|unicode ex. https://api.github.com/repos/Door43/d43-en?recursive=1
+    """
+    if 'access_token=' not in url:
+        return url
+
+    return trailing_separator_re.sub('', credential_re.sub('', url))
+
+
+class RecordingStore(object):
+    """
+    Keeps HTTP responses in a SQLite database, with the bodies compressed by zlib. When the compressed bodies add up
+    to more than <max_bytes>, the responses that were used the longest time ago are deleted.
+
+    The size of the bodies is kept up to date in a table of its own, in the same transaction as each response, so
+    recording a response does not add up the sizes of all the others. The processes of a batch can share the
+    database.
+    """
+
+    def __init__(self, file_name, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        :param str|unicode file_name: The database
+        :param int max_bytes: The size the stored bodies are limited to
+        """
+        self.file_name = file_name
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.connection = None
+        self.pid = None
+
+    def connect(self):
+        # a connection cannot be used by a forked process, each process opens its own
+        if self.connection is None or self.pid != os.getpid():
+            make_dir(os.path.dirname(os.path.abspath(self.file_name)))
+            # the transactions are begun and ended explicitly, see set
+            self.connection = sqlite3.connect(self.file_name, timeout=60, check_same_thread=False,
+                                              isolation_level=None)
+            self.connection.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, method TEXT, '
+                                    'url TEXT, status INTEGER, headers TEXT, body BLOB, size INTEGER, used REAL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS responses_used ON responses (used)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY, size INTEGER)')
+
+            # a database recorded before the total was kept is added up once
+            if self.connection.execute('SELECT size FROM totals WHERE id = 0').fetchone() is None:
+                self.connection.execute('INSERT OR IGNORE INTO totals SELECT 0, COALESCE(SUM(size), 0) FROM responses')
+            self.pid = os.getpid()
+
+        return self.connection
+
+    @staticmethod
+    def get_key(method, url, body=None):
+        """
+        Returns the key of a request. The body of a POST request is part of the key, a credential in the URL is not,
+        see strip_credentials.
+        :param str|unicode method:
+        :param str|unicode url:
+        :param bytes|str|unicode body:
+        :return: str|unicode
+        """
+        key = '{0} {1}'.format(method, strip_credentials(url))
+
+        if body:
+            if not isinstance(body, bytes):
+                body = body.encode('utf-8')
+            key += ' ' + hashlib.sha1(body).hexdigest()
+
+        return key
+
+    def get(self, key):
+        """
+        Returns the recorded response for request <key>, or None.
+        :param str|unicode key:
+        :return: tuple (status, headers, body)
+        """
+        with self.lock:
+            connection = self.connect()
+            row = connection.execute('SELECT status, headers, body FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+
+            connection.execute('UPDATE responses SET used = ? WHERE key = ?', (time.time(), key))
+
+        return row[0], json.loads(row[1]), zlib.decompress(bytes(row[2]))
+
+    def set(self, key, method, url, status, headers, body):
+        """
+        Records a response.
+        :param str|unicode key: See get_key
+        :param str|unicode method:
+        :param str|unicode url: It is stored without its credentials, see strip_credentials
+        :param int status:
+        :param dict headers:
+        :param bytes body:
+        """
+        compressed = zlib.compress(body)
+
+        with self.lock:
+            connection = self.connect()
+
+            # the other processes wait until the total is updated
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+                connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                   (key, method, strip_credentials(url), status, json.dumps(headers),
+                                    sqlite3.Binary(compressed),
+                                    len(compressed), time.time()))
+                connection.execute('UPDATE totals SET size = size + ? WHERE id = 0',
+                                   (len(compressed) - (row[0] if row else 0),))
+                self.evict(connection)
+                connection.execute('COMMIT')
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+
+    def evict(self, connection):
+        """
+        Deletes the responses used the longest time ago until the bodies fit in <max_bytes>. Called in the
+        transaction that recorded a response.
+        """
+        total = connection.execute('SELECT size FROM totals WHERE id = 0').fetchone()[0]
+        evicted = 0
+
+        while total > self.max_bytes:
+            rows = connection.execute('SELECT key, size FROM responses ORDER BY used LIMIT 100').fetchall()
+            if not rows:
+                break
+
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+                metrics.increment('recording.evicted')
+                total -= size
+                evicted += size
+
+        if evicted:
+            connection.execute('UPDATE totals SET size = size - ? WHERE id = 0', (evicted,))
+
+
+class RecordingAdapter(HTTPAdapter):
+    """
+    A transport adapter for the shared session that records each response in a RecordingStore, or answers each
+    request with the response recorded for it without using the network.
+
+    The conditional headers are removed from the recorded requests, so the recording always holds the whole body
+    and does not depend on the state of the HTTP cache.
+    """
+
+    conditional_headers = ('If-None-Match', 'If-Modified-Since')
+
+    # the body is stored decoded, so these no longer apply to it
+    dropped_headers = ('content-encoding', 'content-length', 'transfer-encoding')
+
+    def __init__(self, store, mode, **kwargs):
+        """
+        :param RecordingStore store:
+        :param str|unicode mode: 'record' or 'replay'
+        :param kwargs: The arguments of HTTPAdapter
+        """
+        if mode not in RECORDING_MODES:
+            raise ValueError('Unknown recording mode "{0}", expected one of {1}.'.format(mode,
+                                                                                      ', '.join(RECORDING_MODES)))
+        self.store = store
+        self.mode = mode
+        super(RecordingAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        key = RecordingStore.get_key(request.method, request.url, request.body)
+
+        if self.mode == 'replay':
+            recorded = self.store.get(key)
+            if recorded is None:
+                raise ConnectionError('Nothing was recorded for {0} {1}.'.format(request.method,
+                                                                                 strip_credentials(request.url)),
+                                      request=request)
+
+            metrics.increment('recording.replayed')
+            return self.make_response(request, *recorded)
+
+        for header in self.conditional_headers:
+            request.headers.pop(header, None)
+
+        response = super(RecordingAdapter, self).send(request, **kwargs)
+        body = response.content
+        headers = dict((k, v) for k, v in response.headers.items() if k.lower() not in self.dropped_headers)
+
+        self.store.set(key, request.method, request.url, response.status_code, headers, body)
+        metrics.increment('recording.recorded')
+
+        return self.make_response(request, response.status_code, headers, body, response.raw.retries)
+
+    def make_response(self, request, status, headers, body, retries=None):
+        raw = HTTPResponse(body=io.BytesIO(body), headers=headers, status=status, preload_content=False,
+                           decode_content=False, retries=retries)
+        return self.build_response(request, raw)
@@ -0,0 +1,290 @@
+from __future__ import unicode_literals
+import hashlib
+import re
+
+# the version of the way RuleSet applies its rules, part of its fingerprint. Increase it when a change to RuleSet or
+# CombinedRules changes the text they return for the same rules.
+RULE_SET_VERSION = '2'
+
+# the group references in a replacement template, and the other escapes that are copied as they are
+template_ref_re = re.compile(r'\\(?:(\d{1,2})|g<(\d+)>|(.))', re.UNICODE | re.DOTALL)
+
+# an escaped punctuation character or a character without a special meaning, that is not repeated
+first_literal_re = re.compile(r'(\\[^\w\s]|[^\\.^$*+?{}\[\]|()])(?![*+?{])', re.UNICODE)
+
+
+class Rule(object):
+    """
+    A regular expression and what to replace its matches with, see RuleSet.
+    """
+
+    def __init__(self, pattern, replacement, triggers=None):
+        """
+        :param str|unicode pattern: The expression, it cannot have named groups
+        :param str|unicode|function replacement: A template like re.sub takes, or a function that is called with the
+                                                 match and returns the replacement
+        :param list triggers: Literal strings, one of which is in every text the pattern can match. Texts that have
+                              none of them are not searched for this rule. Leave empty to always search.
+        """
+        self.pattern = pattern
+        self.regex = re.compile(pattern, re.UNICODE)
+        self.replacement = replacement
+        self.triggers = tuple(triggers or ())
+
+        if self.regex.groupindex:
+            raise ValueError('The pattern of a rule cannot have named groups: {0}'.format(pattern))
+
+    def applies_to(self, text):
+        return not self.triggers or any(trigger in text for trigger in self.triggers)
+
+    def get_fingerprint(self):
+        """
+        Returns a hash of what the rule does: its pattern, its replacement and its triggers. For a replacement function
+        the code of the function is hashed, so editing it changes the fingerprint.
+        :return: str|unicode
+        """
+        if callable(self.replacement):
+            replacement = get_code_fingerprint(self.replacement.__code__)
+        else:
+            replacement = self.replacement
+
+        fingerprint = hashlib.sha1()
+        for part in (self.pattern, replacement) + self.triggers:
+            fingerprint.update(part.encode('utf-8') + b'\0')
+        return fingerprint.hexdigest()
+
+
+class RuleSet(object):
+    """
+    Applies rewrite rules to a text in as few scans as possible.
+
+    The rules are given in passes, which are applied one after the other. The rules of a pass are combined into one
+    alternation, in the order they are given, so the text is scanned once for all of them. At each position the
+    first rule that matches wins, which gives the same result as applying the rules one after the other as long as
+    their matches do not overlap. A text where the match of one rule has a match of another inside it, ex. a tag in
+    the label of a link, is given the rules one after the other instead, see CombinedRules. A rule that has to see
+    the output of another one goes in a later pass.
+
+    Before each pass the rules whose triggers are not in the text are left out. The combined expression of each set
+    of rules that is left is compiled once and kept.
+    """
+
+    def __init__(self, *passes):
+        """
+        :param passes: Lists of Rule objects
+        """
+        self.passes = [tuple(rules) for rules in passes]
+        self.combined = {}
+
+    def get_fingerprint(self):
+        """
+        Returns a hash of RULE_SET_VERSION and of the rules of each pass, in order, see Rule.get_fingerprint.
+        :return: str|unicode
+        """
+        fingerprint = hashlib.sha1(RULE_SET_VERSION.encode('utf-8'))
+        for rules in self.passes:
+            for rule in rules:
+                fingerprint.update(rule.get_fingerprint().encode('utf-8'))
+            fingerprint.update(b'\0')
+        return fingerprint.hexdigest()
+
+    def apply(self, text):
+        """
+        Returns <text> with the rules applied.
+        :param str|unicode text:
+        :return: str|unicode
+        """
+        for rules in self.passes:
+            rules = tuple(rule for rule in rules if rule.applies_to(text))
+
+            if len(rules) == 1:
+                text = rules[0].regex.sub(rules[0].replacement, text)
+            elif rules:
+                text = self.get_combined(rules).sub(text)
+
+        return text
+
+    def apply_batch(self, texts):
+        """
+        Returns each of <texts> with the rules applied, the same as apply would. The rules of each pass are chosen
+        once for all the texts, by the triggers found in any of them, and their combined expression is run over
+        each text. A rule whose triggers are not in a text cannot match it, so it does not change that text.
+        :param list texts:
+        :return: list
+        """
+        for rules in self.passes:
+            # no trigger has a NUL in it, so none is found across two texts
+            joined = '\0'.join(texts)
+            rules = tuple(rule for rule in rules if rule.applies_to(joined))
+
+            if len(rules) == 1:
+                texts = [rules[0].regex.sub(rules[0].replacement, text) for text in texts]
+            elif rules:
+                combined = self.get_combined(rules)
+                texts = [combined.sub(text) for text in texts]
+
+        return list(texts)
+
+    def get_combined(self, rules):
+        combined = self.combined.get(rules)
+        if combined is None:
+            combined = self.combined[rules] = CombinedRules(rules)
+        return combined
+
+
+class CombinedRules(object):
+    """
+    The alternation of the expressions of several rules. Each alternative has an empty named group that tells
+    which rule matched, with the groups of the rule right after it.
+
+    When an expression starts with a literal character, the character is put in front of the named group. If every
+    alternative starts with one, the regular expression engine only tries to match at those characters instead of at
+    every position in the text.
+
+    The scan replaces the outer match of two nested ones and does not look inside it, where applying the rules one
+    after the other would replace both. So if another rule matches inside a match, the rules are applied to the text
+    one after the other instead.
+    """
+
+    def __init__(self, rules):
+        """
+        :param tuple rules:
+        """
+        self.rules = rules
+        self.dispatch = []
+        parts = []
+        offset = 0
+
+        for index, rule in enumerate(rules):
+            name = 'rule{0}'.format(index)
+            first, rest = split_first_literal(rule.pattern)
+            parts.append('{0}(?P<{1}>)(?:{2})'.format(first, name, rest))
+
+            offset += 1
+            others = rules[:index] + rules[index + 1:]
+            if callable(rule.replacement):
+                self.dispatch.append((name, rule.replacement, offset, None, others))
+            else:
+                self.dispatch.append((name, None, offset, shift_template(rule.replacement, offset), others))
+            offset += rule.regex.groups
+
+        self.regex = re.compile('|'.join(parts), re.UNICODE)
+
+    def sub(self, text):
+        # the matches that have another one inside them, a local list because the rules are shared by the threads
+        nested = []
+        result = self.regex.sub(lambda match: self.replace(match, nested), text)
+        if not nested:
+            return result
+
+        for rule in self.rules:
+            text = rule.regex.sub(rule.replacement, text)
+        return text
+
+    def replace(self, match, nested):
+        for name, func, offset, template, others in self.dispatch:
+            if match.group(name) is None:
+                continue
+
+            matched = match.group(0)
+            if any(rule.applies_to(matched) and rule.regex.search(matched) for rule in others):
+                nested.append(match)
+
+            if template is not None:
+                return match.expand(template)
+
+            return func(RuleMatch(match, offset))
+
+
+class RuleMatch(object):
+    """
+    Gives a replacement function the groups of its own rule, numbered as in the pattern of the rule.
+    """
+
+    def __init__(self, match, offset):
+        self.match = match
+        self.offset = offset
+
+    def group(self, index=0):
+        return self.match.group(self.offset + index if index else 0)
+
+
+def split_first_literal(pattern):
+    """
+    Splits the first character off <pattern> if it always matches that literal character.
+    :param str|unicode pattern:
+    :return: tuple The character, or an empty string, and the rest of <pattern>
+    """
+    match = first_literal_re.match(pattern)
+    if not match or has_top_level_branch(pattern):
+        return '', pattern
+
+    return match.group(1), pattern[match.end(1):]
+
+
+def has_top_level_branch(pattern):
+    """
+    Returns True if <pattern> is an alternation, ex. a|b, rather than an expression that contains one.
+    :param str|unicode pattern:
+    :return: bool
+    """
+    depth = 0
+    in_class = False
+    escaped = False
+
+    for char in pattern:
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return True
+
+    return False
+
+
+def shift_template(template, offset):
+    """
+    Returns replacement template <template> with its group references moved by <offset>.
+    :param str|unicode template:
+    :param int offset:
+    :return: str|unicode
+    """
+    def shift(match):
+        number = match.group(1) or match.group(2)
+        if number is None:
+            return match.group(0)
+
+        return '\\g<{0}>'.format(int(number) + offset if int(number) else 0)
+
+    return template_ref_re.sub(shift, template)
+
+
+def get_code_fingerprint(code):
+    """
+    Returns a hash of the byte code, constants and names of a function. A nested function is hashed the same way,
+    because the text of its code object has its memory address in it.
+    :param code: The __code__ of a function
+    :return: str|unicode
+    """
+    fingerprint = hashlib.sha1(code.co_code)
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            const = get_code_fingerprint(const)
+        fingerprint.update(repr(const).encode('utf-8') + b'\0')
+    fingerprint.update(repr(code.co_names).encode('utf-8'))
+    return fingerprint.hexdigest()
+
+
+# rules used by more than one converter
+tag_rule = Rule(r'\{\{tag>.*?\}\}', r'', ['{{tag>'])
+squiggly_rule = Rule(r'~~(?:DISCUSSION|NOCACHE)~~', r'', ['~~'])
+extra_blanks_rule = Rule(r'\n{3,}', r'\n\n', ['\n\n\n'])
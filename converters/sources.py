@@ -0,0 +1,277 @@
+from __future__ import unicode_literals
+import io
+import json
+import os
+import tarfile
+import zipfile
+from general_tools.url_utils import join_url_parts
+from converters.common import get_session, session_settings, get_url
+from converters import metrics
+
+try:
+    from os import scandir
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from scandir import scandir
+
+
+def get_archive_url(git_repo, branch='master'):
+    """
+    Returns the URL of the tar.gz archive GitHub builds for <branch> of <git_repo>.
+    :param str|unicode git_repo: https://github.com/Door43/d43-en
+    :param str|unicode branch:
+    :return: str|unicode
+    """
+    if git_repo[-4:] == '.git':
+        git_repo = git_repo[:-4]
+
+    return join_url_parts(git_repo, 'archive', branch + '.tar.gz')
+
+
+def get_api_url(git_repo):
+    """
+    Returns the base URL of the GitHub API for <git_repo>. Other hosts, such as a local test server, are expected
+    to serve the API under /repos.
+    :param str|unicode git_repo: https://github.com/Door43/d43-en
+    :return: str|unicode https://api.github.com/repos/Door43/d43-en
+    """
+    git_repo = clean_repo_url(git_repo)
+    if '//github.com/' in git_repo:
+        return git_repo.replace('//github.com/', '//api.github.com/repos/')
+
+    scheme, rest = git_repo.split('//', 1)
+    host, repo_path = rest.split('/', 1)
+    return join_url_parts(scheme + '//' + host, 'repos', repo_path)
+
+
+def get_raw_url(git_repo, path, branch='master'):
+    """
+    Returns the URL to download file <path> of <branch> of <git_repo>.
+    :param str|unicode git_repo: https://github.com/Door43/d43-en
+    :param str|unicode path: obe/kt/god.txt
+    :param str|unicode branch:
+    :return: str|unicode
+    """
+    git_repo = clean_repo_url(git_repo)
+    if '//github.com/' in git_repo:
+        return join_url_parts(git_repo.replace('//github.com/', '//raw.githubusercontent.com/'), branch, path)
+
+    return join_url_parts(git_repo, 'raw', branch, path)
+
+
+def list_repo_files(git_repo, prefixes, access_token='', branch='master'):
+    """
+    Lists the files under <prefixes> in <branch> of <git_repo> with a single request for the recursive git tree,
+    instead of one contents API request per directory.
+    :param str|unicode git_repo: https://github.com/Door43/d43-en
+    :param list prefixes: Directories in the repository to list, ex. ['obe/kt', 'obe/other']
+    :param str|unicode access_token: A GitHub API token
+    :param str|unicode branch:
+    :return: list|None Entries with the same 'name', 'path', 'sha' and 'download_url' keys as the contents API
+                       returns, or None if the tree was too large for GitHub to return in full
+    """
+    prefixes = [p.strip('/') + '/' for p in prefixes]
+    url = join_url_parts(get_api_url(git_repo), 'git', 'trees', branch) + '?recursive=1'
+    tree = json.loads(get_url(url, get_api_headers(access_token)))
+    if tree.get('truncated'):
+        return None
+
+    files = []
+    for item in tree['tree']:
+        if item['type'] != 'blob' or not any(item['path'].startswith(p) for p in prefixes):
+            continue
+
+        files.append({'name': item['path'].rsplit('/', 1)[-1],
+                      'path': item['path'],
+                      'sha': item['sha'],
+                      'type': 'file',
+                      'download_url': get_raw_url(git_repo, item['path'], branch)})
+
+    return files
+
+
+def get_api_headers(access_token):
+    """
+    Returns the headers that send <access_token> to the GitHub API. The token goes in a header rather than in the
+    query string, so it is not written to the traces, the HTTP cache or the recordings, which all keep the URL.
+    :param str|unicode access_token: A GitHub API token, or an empty string
+    :return: dict|None
+    """
+    if not access_token:
+        return None
+
+    return {'Authorization': 'token {0}'.format(access_token)}
+
+
+def clean_repo_url(git_repo):
+    """
+    Returns <git_repo> without a trailing .git or slash.
+    :param str|unicode git_repo: https://github.com/Door43/d43-en.git
+    :return: str|unicode https://github.com/Door43/d43-en
+    """
+    if git_repo[-4:] == '.git':
+        git_repo = git_repo[:-4]
+
+    return git_repo.rstrip('/')
+
+
+def iter_source_files(source, prefixes, lang_code=None):
+    """
+    Yields the files found under <prefixes> in <source>, a directory or an archive, see iter_directory_files and
+    iter_archive_files.
+    :param str|unicode source: A directory, or the file name or URL of an archive
+    :param list prefixes: Directories in the repository to read, ex. ['obe/kt', 'obe/other']
+    :param str|unicode lang_code: The language namespace to read from a DokuWiki data directory
+    :return: Yields (path, text) tuples, the path is relative to the root of the repository
+    """
+    if os.path.isdir(source):
+        return iter_directory_files(source, prefixes, lang_code)
+
+    return iter_archive_files(source, prefixes)
+
+
+def iter_directory_files(directory, prefixes, lang_code=None):
+    """
+    Reads the files found under <prefixes> in a local directory, without any HTTP. The directory can be a git checkout
+    of the source repository, or a DokuWiki data directory, its pages directory or the namespace of the language in
+    it, see get_pages_dir. Only the directories under <prefixes> are walked, and the hidden files are skipped.
+    :param str|unicode directory:
+    :param list prefixes: Directories in the repository to read, ex. ['obe/kt', 'obe/other']
+    :param str|unicode lang_code: The language namespace to read from a DokuWiki data directory
+    :return: Yields (path, text) tuples in the order of the paths, the path is relative to the root of the repository
+    """
+    root = get_pages_dir(directory, prefixes, lang_code)
+
+    for prefix in prefixes:
+        prefix = prefix.strip('/')
+        for path, file_name in sorted(_walk_files(os.path.join(root, *prefix.split('/')), prefix)):
+            with io.open(file_name, 'rb') as in_file:
+                data = in_file.read()
+
+            metrics.increment('directory.files')
+            metrics.increment('directory.bytes_in', len(data))
+            yield path, data.decode('utf-8')
+
+
+def get_pages_dir(directory, prefixes, lang_code=None):
+    """
+    Returns the directory that holds <prefixes>. In a DokuWiki data directory that is data/pages/<lang_code>, in a
+    git checkout it is the checkout.
+    :param str|unicode directory:
+    :param list prefixes:
+    :param str|unicode lang_code:
+    :return: str|unicode
+    """
+    def has_prefixes(path):
+        return any(os.path.isdir(os.path.join(path, *p.strip('/').split('/'))) for p in prefixes)
+
+    if not has_prefixes(directory) and os.path.isdir(os.path.join(directory, 'pages')):
+        directory = os.path.join(directory, 'pages')
+
+    if lang_code and not has_prefixes(directory) and os.path.isdir(os.path.join(directory, lang_code)):
+        directory = os.path.join(directory, lang_code)
+
+    return directory
+
+
+def _walk_files(directory, path):
+    """
+    Yields a (path, file name) tuple for each file in <directory> and its sub-directories, <path> is the path of
+    <directory> in the repository.
+    """
+    if not os.path.isdir(directory):
+        return
+
+    for entry in scandir(directory):
+        if entry.name.startswith('.'):
+            continue
+
+        if entry.is_dir():
+            for item in _walk_files(entry.path, path + '/' + entry.name):
+                yield item
+        elif entry.is_file():
+            yield path + '/' + entry.name, entry.path
+
+
+def iter_archive_files(archive, prefixes):
+    """
+    Reads a tar or zip archive of a source repository and yields the files found under <prefixes>. The members are
+    read one at a time, straight from the archive, without extracting anything to disk. A remote tar archive is
+    streamed while it downloads.
+
+    GitHub puts all the files in a top-level directory named after the repository and branch, so the paths are
+    matched with and without their first directory.
+    :param str|unicode archive: The file name or URL of the archive
+    :param list prefixes: Directories in the repository to read, ex. ['obe/kt', 'obe/other']
+    :return: Yields (path, text) tuples, the path is relative to the root of the repository
+    """
+    prefixes = [p.strip('/') + '/' for p in prefixes]
+    is_remote = archive.startswith('http://') or archive.startswith('https://')
+    is_zip = archive.lower().endswith('.zip')
+
+    if is_remote:
+        response = get_session().get(archive, stream=True, timeout=session_settings['timeout'])
+        metrics.record_http(response.status_code, int(response.headers.get('Content-Length', 0)),
+                            metrics.get_retries(response))
+        response.raise_for_status()
+
+        if is_zip:
+            # zip files can only be read from a seekable file
+            stream = io.BytesIO(response.content)
+        else:
+            response.raw.decode_content = True
+            stream = response.raw
+    else:
+        stream = io.open(archive, 'rb')
+
+    try:
+        if is_zip:
+            members = _iter_zip_members(stream)
+        else:
+            members = _iter_tar_members(stream)
+
+        for name, read in members:
+            path = _match_prefixes(name, prefixes)
+            if path:
+                data = read()
+                metrics.increment('archive.files')
+                metrics.increment('archive.bytes_in', len(data))
+                yield path, data.decode('utf-8')
+    finally:
+        stream.close()
+
+
+def _iter_tar_members(stream):
+    # mode 'r|*' reads the archive front to back, decompressing as it goes
+    with tarfile.open(fileobj=stream, mode='r|*') as tar:
+        for member in tar:
+            if member.isfile():
+                yield member.name, tar.extractfile(member).read
+
+
+def _iter_zip_members(stream):
+    with zipfile.ZipFile(stream) as zf:
+        for info in zf.infolist():
+            if not info.filename.endswith('/'):
+                yield info.filename, lambda name=info.filename: zf.read(name)
+
+
+def _match_prefixes(name, prefixes):
+    """
+    Returns the path of archive member <name> relative to the repository root if it is under one of <prefixes>.
+    :return: str|unicode|None
+    """
+    name = name.replace(os.sep, '/')
+    if name.startswith('./'):
+        name = name[2:]
+
+    candidates = [name]
+    if '/' in name:
+        candidates.append(name.split('/', 1)[1])
+
+    for candidate in candidates:
+        for prefix in prefixes:
+            if candidate.startswith(prefix):
+                return candidate
+
+    return None
@@ -0,0 +1,207 @@
+from __future__ import unicode_literals
+import hashlib
+import io
+import json
+import os
+import threading
+from converters.cache import read_json_file, write_json_file
+from converters import metrics
+
+STATE_FILE_NAME = '.conversion_state.json'
+
+# the journal is kept next to the state file, with this added to its name
+JOURNAL_SUFFIX = '.journal'
+
+
+def git_blob_sha(data):
+    """
+    Returns the SHA that git, and the GitHub contents API, give a file with the contents <data>.
+    :param bytes|str|unicode data:
+    :return: str|unicode
+    """
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+
+    sha = hashlib.sha1('blob {0}\0'.format(len(data)).encode('ascii'))
+    sha.update(data)
+    return sha.hexdigest()
+
+
+class ConversionState(object):
+    """
+    Remembers the blob SHA of each source file that was converted into an output directory, and the version of the
+    converter that did it, so the next run only converts the files that changed or were added.
+
+    The state is kept in a JSON file in the output directory, so deleting the directory also forgets the state.
+    Outputs that do not keep anything between runs, such as a zip archive, have no state file.
+
+    The state file is only written by save, at the end of a run. So that a run that is killed part way does not lose
+    what it did, each file that is recorded or removed is also appended to a journal next to the state file, once
+    its output has been written. The next run replays the journal and carries on from where the killed run stopped.
+    The journal survives the process being killed, it is not synced to the disk after each file.
+    """
+
+    def __init__(self, output, version):
+        """
+        :param DirectoryOutput|ZipOutput output: The output backend of the converter
+        :param str|unicode version: The version of the converter, files converted by another version are converted again
+        """
+        self.output = output
+        self.out_dir = output.out_dir
+        self.version = version
+        self.file_name = output.state_file
+        self.lock = threading.Lock()
+        self.changed = False
+
+        # a damaged state file is not an error, everything will be converted again
+        data = read_json_file(self.file_name) if self.file_name else None
+        self.entries = data.get('files', {}) if isinstance(data, dict) else {}
+
+        # opened the first time a file is recorded
+        self.journal_name = self.file_name + JOURNAL_SUFFIX if self.file_name else None
+        self.journal = None
+        if self.journal_name:
+            self.replay_journal()
+
+    def replay_journal(self):
+        """
+        Applies the records of the journal left by a run that did not save the state. A record cut short by the run
+        being killed is dropped from the journal, so the records of this run start on a new line.
+        """
+        if not os.path.isfile(self.journal_name):
+            return
+
+        count = 0
+        valid_size = 0
+        with io.open(self.journal_name, 'rb') as in_file:
+            for line in in_file:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError('The record is incomplete.')
+                    record = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    break
+
+                if record.get('removed'):
+                    self.entries.pop(record['path'], None)
+                else:
+                    self.entries[record['path']] = record['entry']
+
+                count += 1
+                valid_size += len(line)
+
+        if os.path.getsize(self.journal_name) > valid_size:
+            with io.open(self.journal_name, 'r+b') as journal:
+                journal.truncate(valid_size)
+
+        if count:
+            self.changed = True
+            metrics.increment('state.resumed', count)
+
+    def append_journal(self, records):
+        """
+        Appends <records> to the journal. Called with the lock held.
+        :param list records: dicts with the path of a source file, and its entry or that it was removed
+        """
+        if not self.journal_name or not records:
+            return
+
+        if self.journal is None:
+            self.journal = io.open(self.journal_name, 'ab')
+
+        self.journal.write(''.join(json.dumps(r, sort_keys=True) + '\n' for r in records).encode('utf-8'))
+        self.journal.flush()
+
+    def is_current(self, path, sha):
+        """
+        Returns True if source file <path> was converted from <sha> by this version and the output still exists.
+        :param str|unicode path: The path of the source file in the repository
+        :param str|unicode sha: The blob SHA of the source file
+        :return: bool
+        """
+        with self.lock:
+            entry = self.entries.get(path)
+
+        if not entry or entry.get('sha') != sha or entry.get('version') != self.version:
+            return False
+
+        if not self.output.isfile(os.path.join(self.out_dir, entry['output'])):
+            return False
+
+        metrics.increment('files.unchanged')
+        return True
+
+    def set(self, path, sha, save_as, data=None):
+        """
+        Records that source file <path> with blob SHA <sha> was converted to <save_as>.
+        :param str|unicode path:
+        :param str|unicode sha:
+        :param str|unicode save_as: The converted file
+        :param data: Anything the converter needs to know about the file when it is skipped, see get_data
+        """
+        output = os.path.relpath(save_as, self.out_dir).replace(os.sep, '/')
+        entry = {'sha': sha, 'version': self.version, 'output': output}
+        if data is not None:
+            entry['data'] = data
+
+        with self.lock:
+            self.entries[path] = entry
+            self.changed = True
+            self.append_journal([{'path': path, 'entry': entry}])
+
+        metrics.increment('files.converted')
+
+    def get_data(self, path):
+        """
+        Returns the data recorded with source file <path>, see set.
+        :param str|unicode path:
+        """
+        with self.lock:
+            return self.entries.get(path, {}).get('data')
+
+    def remove_missing(self, paths):
+        """
+        Deletes the output of every recorded source file that is not in <paths>, because it was removed from the
+        source repository.
+        :param paths: The paths of all the source files that are still in the repository
+        :return: list The paths that were removed
+        """
+        paths = set(paths)
+
+        with self.lock:
+            removed = sorted(p for p in self.entries if p not in paths)
+            outputs = [self.entries.pop(p)['output'] for p in removed]
+            if removed:
+                self.changed = True
+
+        for output in outputs:
+            self.output.remove(os.path.join(self.out_dir, output))
+
+        with self.lock:
+            self.append_journal([{'path': p, 'removed': True} for p in removed])
+
+        metrics.increment('files.removed', len(removed))
+
+        return removed
+
+    def save(self):
+        """
+        Writes the state file, if anything changed since it was loaded, and deletes the journal.
+        """
+        with self.lock:
+            if not self.file_name:
+                return
+
+            data = {'files': dict(self.entries)} if self.changed else None
+            self.changed = False
+
+        if data is not None:
+            write_json_file(self.file_name, data)
+
+        # everything in the journal is in the state file now
+        with self.lock:
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+            if os.path.isfile(self.journal_name):
+                os.remove(self.journal_name)
@@ -4,24 +4,59 @@ import codecs
 import inspect
 import json
 import os
-import re
-from general_tools.file_utils import write_file
-from general_tools.url_utils import get_languages, join_url_parts, get_url
-from converters.common import quiet_print, dokuwiki_to_markdown, ResourceManifest, ResourceManifestEncoder
+from general_tools.url_utils import join_url_parts
+from converters.common import quiet_print, dokuwiki_to_markdown, dokuwiki_to_markdown_batch, get_url, \
+    configure_session, configure_http_cache, ResourceManifest, ResourceManifestEncoder
+from converters import metrics, links
+from converters.cache import get_cache_dir
+from converters.conversion_cache import ConversionCache
+from converters.languages import get_language_data
+from converters.metrics import Metrics
+from converters.output import open_output
+from converters.pipeline import ConversionPipeline, register_batch
+from converters.pool import WorkerPool, DEFAULT_MAX_WORKERS
+from converters.rules import Rule, RuleSet, tag_rule, squiggly_rule, extra_blanks_rule
+from converters.sources import get_archive_url, iter_source_files, get_api_url, get_api_headers, list_repo_files, \
+    clean_repo_url
+from converters.state import ConversionState, git_blob_sha
 
 
 class TQConverter(object):
 
-    tag_re = re.compile(r'\{\{tag>.*?\}\}', re.UNICODE)
-    squiggly_re = re.compile(r'~~(?:DISCUSSION|NOCACHE)~~', re.UNICODE)
-    extra_blanks_re = re.compile(r'\n{3,}', re.UNICODE)
-    chapter_link_re = re.compile(r'\[\[:en:bible:questions:comprehension:(.*?):home\|(.*?)\]\]', re.UNICODE)
-    missing_blank_line_re = re.compile(r'(\n    \*.*\n)(__)', re.UNICODE)
-    story_num_re = re.compile(r'(Story )#', re.UNICODE)
-    navigate_re = re.compile(r'\[\[:en:obs:notes:questions:(.*?)\|\s*(.*?)\s*\]\]', re.UNICODE)
-    navigate2_re = re.compile(r'\[\[en/obs/notes/questions/(.*?)\|\s*(.*?)\s*\]\]', re.UNICODE)
+    # fix links to chapter list
+    # **[[:en:bible:questions:comprehension:1ch:home|Back to 1 Chronicles Chapter List]]**
+    chapter_link_rule = Rule(r'\[\[:en:bible:questions:comprehension:(.*?):home\|(.*?)\]\]', r'[\2](./)',
+                             [':en:bible:questions:comprehension:'])
 
-    def __init__(self, lang_code, git_repo, bible_out_dir, obs_out_dir, quiet):
+    # insert missing blank line
+    missing_blank_line_rule = Rule(r'(\n    \*.*\n)(__)', r'\1\n\2', ['\n    *'])
+
+    # fix story number
+    story_num_rule = Rule(r'Story #', r'Story ', ['Story #'])
+
+    # navigation
+    navigate_rule = Rule(r'\[\[:en:obs:notes:questions:(.*?)\|\s*(.*?)\s*\]\]', r'[\2](./\1.md)',
+                         [':en:obs:notes:questions:'])
+    navigate2_rule = Rule(r'\[\[en/obs/notes/questions/(.*?)\|\s*(.*?)\s*\]\]', r'[\2](./\1.md)',
+                          ['en/obs/notes/questions/'])
+
+    # the blank lines are removed after the tags, which leave blank lines behind, and the missing ones are inserted
+    # after that
+    bible_rules = RuleSet([chapter_link_rule, tag_rule, squiggly_rule], [extra_blanks_rule])
+    obs_rules = RuleSet([chapter_link_rule, tag_rule, squiggly_rule, story_num_rule, navigate_rule, navigate2_rule],
+                        [extra_blanks_rule], [missing_blank_line_rule])
+
+    # the directories in the source repository that hold the questions
+    bible_source_dir = 'bible/questions/comprehension'
+    obs_source_dir = 'obs/notes/questions'
+
+    # change this when the conversion changes, so the files converted by an older version are converted again
+    converter_version = '1'
+
+    def __init__(self, lang_code, git_repo, bible_out_dir, obs_out_dir, quiet, max_workers=DEFAULT_MAX_WORKERS,
+                 cache_dir=None, source_archive=None, output_format='dir', parallel_compression=False,
+                 metrics_file=None, trace_file=None, processes=0, conversion_cache=True, link_check=True,
+                 http_cache=True):
         """
 
         :param str|unicode lang_code:
@@ -29,31 +64,90 @@ class TQConverter(object):
         :param str|unicode bible_out_dir:
         :param str|unicode obs_out_dir:
         :param bool quiet:
+        :param int max_workers: The number of files to download and convert at the same time
+        :param str|unicode cache_dir: Where to keep data between runs, defaults to get_cache_dir()
+        :param str|unicode|bool source_archive: Read the source files from this tar or zip archive, file name or URL,
+                                                or from this directory, a git checkout or a DokuWiki data directory,
+                                                instead of downloading them one at a time. If True, the archive of
+                                                the master branch of <git_repo> is downloaded from GitHub.
+        :param str|unicode output_format: 'dir' to write the files to the output directories, 'zip' to stream them
+                                          into <bible_out_dir>.zip and <obs_out_dir>.zip
+        :param bool parallel_compression: In zip format, compress the files on separate threads, see ZipOutput
+        :param str|unicode metrics_file: Write the time spent in each stage of the run, and its counters, to this JSON
+                                         file
+        :param str|unicode trace_file: Write an event for each stage to this file, in the Trace Event Format
+        :param int processes: The number of processes that convert the files, 0 to convert them on the download
+                              threads
+        :param bool conversion_cache: Look up the texts converted before, by any run, see ConversionCache
+        :param bool link_check: Check the relative links of the converted files once they are written, see
+                                check_links
+        :param bool http_cache: Keep the downloaded files with their ETag or Last-Modified date in the cache
+                                directory, and only download them again if they changed, see HttpCache
         """
-        self.git_repo = git_repo
+        # cleaned here rather than in run(), so nothing in run() changes the state of the converter
+        self.git_repo = clean_repo_url(git_repo)
         self.bible_out_dir = bible_out_dir
         self.obs_out_dir = obs_out_dir
         self.quiet = quiet
+        self.output_format = output_format
+        self.parallel_compression = parallel_compression
+        self.processes = processes
+        self.link_check = link_check
+
+        # the links check_links found broken by the last run
+        self.broken_links = []
+
+        # where the converted files are written while run() is working, see open_output
+        self.bible_output = None
+        self.obs_output = None
+
+        # the time spent in each stage of the run, see converters.metrics
+        self.metrics_file = metrics_file
+        self.trace_file = trace_file
+        self.metrics = Metrics(trace=bool(trace_file))
+
+        # the files are downloaded by the pool and converted by the pipeline while run() is working
+        self.pool = WorkerPool(max_workers)
+        self.pipeline = None
+        configure_session(pool_maxsize=max_workers)
         # self.temp_dir = tempfile.mkdtemp()
 
-        if 'github' not in git_repo:
+        if 'github' not in git_repo and (not source_archive or source_archive is True):
             raise Exception('Currently only github repositories are supported.')
 
+        if source_archive is True:
+            source_archive = get_archive_url(git_repo)
+
+        self.source_archive = source_archive
+
         # get the language data
-        quiet_print(self.quiet, 'Downloading language data...', end=' ')
-        langs = get_languages()
+        quiet_print(self.quiet, 'Loading language data...', end=' ')
+        with metrics.activate(self.metrics), metrics.stage('languages'):
+            self.lang_data = get_language_data(lang_code, cache_dir)
         quiet_print(self.quiet, 'finished.')
 
-        self.lang_data = next((l for l in langs if l['lc'] == lang_code), '')
-
         if not self.lang_data:
             raise Exception('Information for language "{0}" was not found.'.format(lang_code))
 
-        # read the github access token
+        # the caches are made once the arguments are known to be good
+        configure_http_cache(os.path.join(cache_dir or get_cache_dir(), 'http') if http_cache else None)
+
+        # the markdown converted from each text, shared with the other converters and runs
+        self.conversion_cache = None
+        if conversion_cache:
+            self.conversion_cache = ConversionCache(os.path.join(cache_dir or get_cache_dir(), 'conversions.sqlite'),
+                                                    '{0}-{1}'.format(type(self).__name__, self.converter_version),
+                                                    rule_sets=[self.bible_rules, self.obs_rules])
+
+        # read the github access token, without one the requests are limited to the anonymous rate
         root_dir = os.path.dirname(os.path.dirname(inspect.stack()[0][1]))
-        with codecs.open(os.path.join(root_dir, 'github_api_token'), 'r', 'utf-8-sig') as in_file:
-            # read the text from the file
-            self.access_token = in_file.read()
+        token_file = os.path.join(root_dir, 'github_api_token')
+        self.access_token = ''
+
+        if os.path.isfile(token_file):
+            with codecs.open(token_file, 'r', 'utf-8-sig') as in_file:
+                # read the text from the file, a new line at its end cannot be sent in a header
+                self.access_token = in_file.read().strip()
 
     def __enter__(self):
         return self
@@ -63,159 +157,312 @@ class TQConverter(object):
         # delete temp files
         # if os.path.isdir(self.temp_dir):
         #     shutil.rmtree(self.temp_dir, ignore_errors=True)
-        pass
 
-    def run(self):
+        # the metrics are written even if the run failed
+        if self.metrics_file:
+            self.metrics.save(self.metrics_file)
+        if self.trace_file:
+            self.metrics.save_trace(self.trace_file)
 
-        # https://          github.com/Door43/d43-en
-        # https://api.github.com/repos/door43/d43-en/contents/obe/kt
-        # https://api.github.com/repos/door43/d43-en/contents/obe/other
-        lang_code = self.lang_data['lc']
-
-        # clean up the git repo url
-        if self.git_repo[-4:] == '.git':
-            self.git_repo = self.git_repo[:-4]
-
-        if self.git_repo[-1:] == '/':
-            self.git_repo = self.git_repo[:-1]
-
-        # get the source files from the git repository
-        base_url = self.git_repo.replace('github.com', 'api.github.com/repos')
-        bible_api_url = join_url_parts(base_url, 'contents/bible/questions/comprehension')
-        obs_api_url = join_url_parts(base_url, 'contents/obs/notes/questions')
-
-        quiet_print(self.quiet, 'Downloading Bible tQ list.')
-        bible_list = self.process_api_request(bible_api_url)
-        quiet_print(self.quiet, 'Finished downloading Bible tQ list.')
-
-        quiet_print(self.quiet, 'Downloading OBS tQ list.')
-        obs_list = self.process_api_request(obs_api_url)
-        quiet_print(self.quiet, 'Finished downloading OBS tQ list.')
+    def run(self):
 
-        target_dir = os.path.join(self.bible_out_dir, 'content')
-        for url in bible_list:
-            self.download_bible_file(url, target_dir)
+        with metrics.activate(self.metrics), \
+                ConversionPipeline(self.pool, self.processes, cache=self.conversion_cache) as self.pipeline, \
+                open_output(self.bible_out_dir, self.output_format, self.parallel_compression) as self.bible_output, \
+                open_output(self.obs_out_dir, self.output_format, self.parallel_compression) as self.obs_output:
+            # https://          github.com/Door43/d43-en
+            # https://api.github.com/repos/door43/d43-en/contents/obe/kt
+            # https://api.github.com/repos/door43/d43-en/contents/obe/other
+            lang_code = self.lang_data['lc']
+
+            bible_dir = os.path.join(self.bible_out_dir, 'content')
+            obs_dir = os.path.join(self.obs_out_dir, 'content')
+
+            # the source files converted by previous runs
+            bible_state = ConversionState(self.bible_output, self.converter_version)
+            obs_state = ConversionState(self.obs_output, self.converter_version)
+
+            if self.source_archive:
+                with metrics.stage('read_archive'):
+                    self.convert_archive(bible_dir, obs_dir, bible_state, obs_state)
+
+            else:
+                # get the source files from the git repository
+                bible_list, obs_list = self.list_source_files()
+
+                self.download_changed(bible_list, bible_state, lambda path: self.get_bible_save_as(path, bible_dir),
+                                      convert_bible_text, self.bible_output)
+                self.download_changed(obs_list, obs_state, lambda path: self.get_obs_save_as(path, obs_dir),
+                                      convert_obs_text, self.obs_output)
+
+            with metrics.stage('manifest'):
+                manifest = ResourceManifest('tq', 'translationQuestions')
+                manifest.status['checking_level'] = '3'
+                manifest.status['version'] = '3'
+                manifest.status['checking_entity'] = 'Wycliffe Associates'
+
+                manifest.language['slug'] = lang_code
+                manifest.language['name'] = self.lang_data['ang']
+                manifest.language['dir'] = self.lang_data['ld']
+
+                manifest_str = json.dumps(manifest, sort_keys=False, indent=2, cls=ResourceManifestEncoder)
+                self.bible_output.write_file(os.path.join(self.bible_out_dir, 'manifest.json'), manifest_str)
+
+                manifest = ResourceManifest('obs-tq', 'OBS translationQuestions')
+                manifest.status['checking_level'] = '3'
+                manifest.status['version'] = '3'
+                manifest.status['checking_entity'] = 'Wycliffe Associates'
+
+                manifest.language['slug'] = lang_code
+                manifest.language['name'] = self.lang_data['ang']
+                manifest.language['dir'] = self.lang_data['ld']
+
+                manifest_str = json.dumps(manifest, sort_keys=False, indent=2, cls=ResourceManifestEncoder)
+                self.obs_output.write_file(os.path.join(self.obs_out_dir, 'manifest.json'), manifest_str)
+
+        # the output is read back once it is complete, a zip archive only exists once it has been closed
+        if self.link_check:
+            self.broken_links = self.check_links([self.bible_output, self.obs_output])
+
+    def check_links(self, outputs):
+        """
+        Checks the links between the converted files, including the ones earlier runs converted, and prints the
+        broken ones, see converters.links.
+        :param list outputs: The closed DirectoryOutput or ZipOutput of each output directory
+        :return: list (name, line, target) tuples of the broken links
+        """
+        broken_links = []
 
-        manifest = ResourceManifest('tq', 'translationQuestions')
-        manifest.status['checking_level'] = '3'
-        manifest.status['version'] = '3'
-        manifest.status['checking_entity'] = 'Wycliffe Associates'
+        with metrics.activate(self.metrics), metrics.stage('check_links'):
+            for output in outputs:
+                quiet_print(self.quiet, 'Checking the links in {0}...'.format(output.path), end=' ')
+                found = links.check_links(output.path)
+                quiet_print(self.quiet, 'found {0} broken.'.format(len(found)))
 
-        manifest.language['slug'] = lang_code
-        manifest.language['name'] = self.lang_data['ang']
-        manifest.language['dir'] = self.lang_data['ld']
+                for broken_link in found:
+                    quiet_print(self.quiet, '   ' + links.format_broken_link(broken_link))
+                broken_links.extend(found)
 
-        manifest_str = json.dumps(manifest, sort_keys=False, indent=2, cls=ResourceManifestEncoder)
-        write_file(os.path.join(self.bible_out_dir, 'manifest.json'), manifest_str)
+        return broken_links
 
-        target_dir = os.path.join(self.obs_out_dir, 'content')
-        for url in obs_list:
-            self.download_obs_file(url, target_dir)
+    def list_source_files(self):
+        """
+        Lists the Bible and OBS question files in the git repository. The whole git tree is listed with a single
+        request, unless it is too large for GitHub to return, then each directory is listed separately.
+        :return: tuple (bible_list, obs_list) of GitHub contents API entries, generators if each directory is listed
+        """
+        quiet_print(self.quiet, 'Downloading tQ list...', end=' ')
+        with metrics.stage('list'):
+            files = list_repo_files(self.git_repo, [self.bible_source_dir, self.obs_source_dir], self.access_token)
+        quiet_print(self.quiet, 'finished.')
 
-        manifest = ResourceManifest('obs-tq', 'OBS translationQuestions')
-        manifest.status['checking_level'] = '3'
-        manifest.status['version'] = '3'
-        manifest.status['checking_entity'] = 'Wycliffe Associates'
+        if files is None:
+            quiet_print(self.quiet, 'The repository tree is too large, listing each directory.')
+            base_url = get_api_url(self.git_repo)
+            return (self.process_api_request(join_url_parts(base_url, 'contents', self.bible_source_dir)),
+                    self.process_api_request(join_url_parts(base_url, 'contents', self.obs_source_dir)))
 
-        manifest.language['slug'] = lang_code
-        manifest.language['name'] = self.lang_data['ang']
-        manifest.language['dir'] = self.lang_data['ld']
+        files = [o for o in files if o['name'] != 'home.txt' and o['name'] != 'sidebar.txt']
+        bible_list = [o for o in files if o['path'].startswith(self.bible_source_dir + '/')]
+        obs_list = [o for o in files if o['path'].startswith(self.obs_source_dir + '/')]
 
-        manifest_str = json.dumps(manifest, sort_keys=False, indent=2, cls=ResourceManifestEncoder)
-        write_file(os.path.join(self.obs_out_dir, 'manifest.json'), manifest_str)
+        return bible_list, obs_list
 
     def process_api_request(self, url):
-
+        """
+        Lists the source files in the directory at GitHub contents API <url> and its sub-directories. The files in
+        a directory are yielded as soon as it has been listed, before its sub-directories are requested.
+        :param str|unicode url:
+        :return: Yields the GitHub contents API entries of the files
+        """
         quiet_print(self.quiet, '   Getting {0}.'.format(url))
 
-        if '?' in url:
-            url += '&access_token={0}'.format(self.access_token)
-        else:
-            url += '?access_token={0}'.format(self.access_token)
-
         # get the directory listing
-        items = json.loads(get_url(url))
+        with metrics.stage('list', url):
+            items = json.loads(get_url(url, get_api_headers(self.access_token)))
 
-        # collect the files
-        file_list = [o['download_url'] for o in items if o['type'] == 'file'
-                     and o['name'] != 'home.txt'
-                     and o['name'] != 'sidebar.txt']
+        # yield the files
+        for item in items:
+            if item['type'] == 'file' and item['name'] != 'home.txt' and item['name'] != 'sidebar.txt':
+                yield item
 
         # check for sub-directories
         dir_list = [o['url'] for o in items if o['type'] == 'dir']
 
         for sub_dir in dir_list:
-            file_list.extend(self.process_api_request(sub_dir))
+            for item in self.process_api_request(sub_dir):
+                yield item
 
-        return file_list
-
-    def download_bible_file(self, url_to_download, out_dir):
-
-        parts = url_to_download.rsplit('/', 2)
+    def download_changed(self, items, state, get_save_as, convert, output):
+        """
+        Downloads and converts the files in <items> that changed since the last run, and deletes the output of the
+        files that have been removed from the repository.
+
+        <items> may be a generator. The files are downloaded while it is still listing the repository, and the
+        removed files are only deleted once the listing is complete.
+        :param items: The GitHub contents API entries of all the source files
+        :param ConversionState state:
+        :param get_save_as: A function that takes the path of a source file and returns the name of the converted file
+        :param convert: convert_bible_text or convert_obs_text
+        :param DirectoryOutput|ZipOutput output:
+        """
+        paths = []
+
+        def changed_items():
+            for item in items:
+                paths.append(item['path'])
+                if state.is_current(item['path'], item['sha']):
+                    quiet_print(self.quiet, 'Skipping {0}.'.format(item['name']))
+                else:
+                    yield item
+
+        def write(item, md_text):
+            save_as = get_save_as(item['path'])
+            output.write_file(save_as, md_text)
+            state.set(item['path'], item['sha'], save_as)
+
+        try:
+            self.pipeline.run(changed_items(), lambda o: (convert, self.download_file(o['download_url'])), write)
+
+            for path in state.remove_missing(paths):
+                quiet_print(self.quiet, 'Removed {0}.'.format(path))
+        finally:
+            state.save()
+
+    def convert_archive(self, bible_dir, obs_dir, bible_state, obs_state):
+        """
+        Converts the questions found in the source archive that changed since the last run, as they are read from it.
+        :param str|unicode bible_dir: The output directory for the Bible questions
+        :param str|unicode obs_dir: The output directory for the OBS questions
+        :param ConversionState bible_state:
+        :param ConversionState obs_state:
+        """
+        quiet_print(self.quiet, 'Reading {0}.'.format(self.source_archive))
+        bible_paths = []
+        obs_paths = []
+
+        def changed_files():
+            for path, dw_text in iter_source_files(self.source_archive, [self.bible_source_dir, self.obs_source_dir],
+                                                   self.lang_data['lc']):
+
+                file_name = path.rsplit('/', 1)[1]
+                if not file_name.endswith('.txt') or file_name in ('home.txt', 'sidebar.txt'):
+                    continue
+
+                if path.startswith(self.bible_source_dir + '/'):
+                    save_as = self.get_bible_save_as(path, bible_dir)
+                    convert = convert_bible_text
+                    output = self.bible_output
+                    state = bible_state
+                    bible_paths.append(path)
+                else:
+                    save_as = self.get_obs_save_as(path, obs_dir)
+                    convert = convert_obs_text
+                    output = self.obs_output
+                    state = obs_state
+                    obs_paths.append(path)
+
+                sha = git_blob_sha(dw_text)
+                if state.is_current(path, sha):
+                    quiet_print(self.quiet, 'Skipping {0}.'.format(file_name))
+                    continue
+
+                quiet_print(self.quiet, 'Converting {0}.'.format(path))
+                yield path, sha, save_as, state, output, convert, dw_text
+
+        def write(item, md_text):
+            path, sha, save_as, state, output = item[:5]
+            output.write_file(save_as, md_text)
+            state.set(path, sha, save_as)
+
+        try:
+            self.pipeline.run(changed_files(), lambda f: (f[5], f[6]), write)
+
+            for state, paths in ((bible_state, bible_paths), (obs_state, obs_paths)):
+                for path in state.remove_missing(paths):
+                    quiet_print(self.quiet, 'Removed {0}.'.format(path))
+        finally:
+            bible_state.save()
+            obs_state.save()
+
+    @staticmethod
+    def get_bible_save_as(source_path, out_dir):
+
+        parts = source_path.rsplit('/', 2)
         file_name = parts[2]
         dir_name = parts[1]
-        save_as = os.path.join(out_dir, dir_name, file_name.replace('.txt', '.md'))
-        if os.path.isfile(save_as):
-            quiet_print(self.quiet, 'Skipping {0}.'.format(file_name))
-            return
-
-        quiet_print(self.quiet, 'Downloading {0}...'.format(url_to_download), end=' ')
-        dw_text = get_url(url_to_download)
-
-        md_text = dokuwiki_to_markdown(dw_text)
+        return os.path.join(out_dir, dir_name, file_name.replace('.txt', '.md'))
 
-        # fix links to chapter list
-        # **[[:en:bible:questions:comprehension:1ch:home|Back to 1 Chronicles Chapter List]]**
-        md_text = self.chapter_link_re.sub(r'[\2](./)', md_text)
+    @staticmethod
+    def get_obs_save_as(source_path, out_dir):
 
-        # remove tags
-        md_text = self.tag_re.sub(r'', md_text)
+        file_name = source_path.rsplit('/', 1)[1]
+        return os.path.join(out_dir, file_name.replace('.txt', '.md'))
 
-        # remove squiggly tags
-        md_text = self.squiggly_re.sub(r'', md_text)
-
-        # remove extra blank lines
-        md_text = self.extra_blanks_re.sub(r'\n\n', md_text)
-
-        write_file(save_as, md_text)
+    def download_file(self, url_to_download):
+        """
+        Downloads the DokuWiki text of a question file.
+        :return: str|unicode
+        """
+        quiet_print(self.quiet, 'Downloading {0}...'.format(url_to_download), end=' ')
+        with metrics.stage('download', url_to_download):
+            dw_text = get_url(url_to_download)
         quiet_print(self.quiet, 'finished.')
 
-    def download_obs_file(self, url_to_download, out_dir):
+        return dw_text
+
+    def fix_bible_markdown(self, md_text):
+        """
+        Cleans up the markdown of a Bible question file.
+        :param str|unicode md_text:
+        :return: str|unicode
+        """
+        return self.bible_rules.apply(md_text)
 
-        parts = url_to_download.rsplit('/', 1)
-        file_name = parts[1]
-        save_as = os.path.join(out_dir, file_name.replace('.txt', '.md'))
-        if os.path.isfile(save_as):
-            quiet_print(self.quiet, 'Skipping {0}.'.format(file_name))
-            return
+    def fix_obs_markdown(self, md_text):
+        """
+        Cleans up the markdown of an OBS question file.
+        :param str|unicode md_text:
+        :return: str|unicode
+        """
+        return self.obs_rules.apply(md_text)
 
-        quiet_print(self.quiet, 'Downloading {0}...'.format(url_to_download), end=' ')
-        dw_text = get_url(url_to_download)
 
-        md_text = dokuwiki_to_markdown(dw_text)
+def convert_bible_text(dw_text):
+    """
+    Converts the DokuWiki text of a Bible question file to markdown. This runs in the conversion processes.
+    :param str|unicode dw_text:
+    :return: str|unicode
+    """
+    return TQConverter.bible_rules.apply(dokuwiki_to_markdown(dw_text))
 
-        # fix links to chapter list
-        # **[[:en:bible:questions:comprehension:1ch:home|Back to 1 Chronicles Chapter List]]**
-        md_text = self.chapter_link_re.sub(r'[\2](./)', md_text)
 
-        # remove tags
-        md_text = self.tag_re.sub(r'', md_text)
+def convert_obs_text(dw_text):
+    """
+    Converts the DokuWiki text of an OBS question file to markdown. This runs in the conversion processes.
+    :param str|unicode dw_text:
+    :return: str|unicode
+    """
+    return TQConverter.obs_rules.apply(dokuwiki_to_markdown(dw_text))
 
-        # remove squiggly tags
-        md_text = self.squiggly_re.sub(r'', md_text)
 
-        # remove extra blank lines
-        md_text = self.extra_blanks_re.sub(r'\n\n', md_text)
+def convert_bible_texts(dw_texts):
+    """
+    Converts several Bible question files in one call, the same as convert_bible_text converts each one.
+    :param list dw_texts:
+    :return: list
+    """
+    return dokuwiki_to_markdown_batch(dw_texts, TQConverter.bible_rules)
 
-        # insert missing blank line
-        md_text = self.missing_blank_line_re.sub(r'\1\n\2', md_text)
 
-        # fix story number
-        md_text = self.story_num_re.sub(r'\1', md_text)
+def convert_obs_texts(dw_texts):
+    """
+    Converts several OBS question files in one call, the same as convert_obs_text converts each one.
+    :param list dw_texts:
+    :return: list
+    """
+    return dokuwiki_to_markdown_batch(dw_texts, TQConverter.obs_rules)
 
-        # navigation
-        md_text = self.navigate_re.sub(r'[\2](./\1.md)', md_text)
-        md_text = self.navigate2_re.sub(r'[\2](./\1.md)', md_text)
 
-        write_file(save_as, md_text)
-        quiet_print(self.quiet, 'finished.')
+register_batch(convert_bible_text, convert_bible_texts)
+register_batch(convert_obs_text, convert_obs_texts)
@@ -1,48 +1,160 @@
 from __future__ import print_function, unicode_literals
+import hashlib
 import json
 import os
 import re
-from general_tools.file_utils import write_file
-from general_tools.url_utils import get_languages, join_url_parts, get_url
-from converters.common import quiet_print, dokuwiki_to_markdown, ResourceManifest, ResourceManifestEncoder, post_url
+import threading
+from general_tools.url_utils import join_url_parts
+from converters.common import quiet_print, dokuwiki_to_markdown, dokuwiki_to_markdown_batch, get_url, \
+    configure_session, configure_http_cache, ResourceManifest, ResourceManifestEncoder, post_url
+from converters.cache import JsonCache, get_cache_dir
+from converters.conversion_cache import ConversionCache
+from converters import metrics, links
+from converters.languages import get_language_data
+from converters.metrics import Metrics
+from converters.output import open_output
+from converters.page_index import PageIndex
+from converters.pipeline import ConversionPipeline, register_batch
+from converters.pool import WorkerPool, DEFAULT_MAX_WORKERS
+from converters.rules import Rule, RuleSet, tag_rule, squiggly_rule, extra_blanks_rule
+from converters.sources import get_archive_url, iter_source_files, get_api_url, list_repo_files, clean_repo_url
+from converters.state import ConversionState, git_blob_sha
+
+
+def replace_tw_link(match):
+
+    parts = match.group(2).split('|', 1)
+
+    if len(parts) == 1:
+        return '[{0}](../{1}/{0}.md)'.format(parts[0], match.group(1))
+
+    return '[{0}](../{1}/{2}.md)'.format(parts[1], match.group(1), parts[0])
+
+
+def replace_obs_link(match):
+
+    parts = match.group(1).split('|', 1)
+    return '[{0}](https://door43.org/en/obs/notes/frames/{0})'.format(parts[0])
 
 
 class TWConverter(object):
 
+    # fix links to other tW articles
     # [[:en:obe:kt:adultery|adultery, adulterous, adulterer, adulteress]]
-    tw_link_re = re.compile(r'\[\[.*?:obe:(kt|other):(.*?)\]\]', re.UNICODE)
-    obs_link_re = re.compile(r'\[\[.*?:obs:notes:frames:(.*?)\]{2,3}', re.UNICODE)
-    squiggly_re = re.compile(r'~~(?:DISCUSSION|NOCACHE)~~', re.UNICODE)
-    extra_blanks_re = re.compile(r'\n{3,}', re.UNICODE)
+    tw_link_rule = Rule(r'\[\[.*?:obe:(kt|other):(.*?)\]\]', replace_tw_link, [':obe:'])
+    obs_link_rule = Rule(r'\[\[.*?:obs:notes:frames:(.*?)\]{2,3}', replace_obs_link, [':obs:notes:frames:'])
     page_query_re = re.compile(r'\{\{door43pages.*@:?(.*?)\s.*-q="(.*?)".*\}\}', re.UNICODE)
-    tag_re = re.compile(r'\{\{tag>.*?\}\}', re.UNICODE)
 
-    def __init__(self, lang_code, git_repo, out_dir, quiet):
+    # the page query is filled in between these, and the blank lines are removed after the tags, which leave blank
+    # lines behind
+    markdown_rules = RuleSet([tw_link_rule, obs_link_rule, tag_rule, squiggly_rule])
+    blank_line_rules = RuleSet([extra_blanks_rule])
+
+    # the number of seconds to reuse door43pages query results
+    page_query_ttl = 24 * 60 * 60
+
+    # where the page queries the page index does not cover are sent
+    door43_url = 'https://door43.org'
+
+    # the directories in the source repository that hold the articles
+    kt_source_dir = 'obe/kt'
+    other_source_dir = 'obe/other'
+
+    # change this when the conversion changes, so the articles converted by an older version are converted again
+    converter_version = '3'
+
+    def __init__(self, lang_code, git_repo, out_dir, quiet, max_workers=DEFAULT_MAX_WORKERS, cache_dir=None,
+                 source_archive=None, output_format='dir', parallel_compression=False, metrics_file=None,
+                 trace_file=None, processes=0, conversion_cache=True, link_check=True, http_cache=True):
         """
 
         :param unicode lang_code:
         :param unicode git_repo:
         :param unicode out_dir:
         :param bool quiet:
+        :param int max_workers: The number of files to download and convert at the same time
+        :param unicode cache_dir: Where to keep data between runs, defaults to get_cache_dir()
+        :param unicode|bool source_archive: Read the source files from this tar or zip archive, file name or URL, or
+                                            from this directory, a git checkout or a DokuWiki data directory,
+                                            instead of downloading them one at a time. If True, the archive of the
+                                            master branch of <git_repo> is downloaded from GitHub.
+        :param unicode output_format: 'dir' to write the files to <out_dir>, 'zip' to stream them into <out_dir>.zip
+        :param bool parallel_compression: In zip format, compress the files on separate threads, see ZipOutput
+        :param unicode metrics_file: Write the time spent in each stage of the run, and its counters, to this JSON file
+        :param unicode trace_file: Write an event for each stage to this file, in the Trace Event Format
+        :param int processes: The number of processes that convert the articles, 0 to convert them on the download
+                              threads
+        :param bool conversion_cache: Look up the texts converted before, by any run, see ConversionCache
+        :param bool link_check: Check the relative links of the converted files once they are written, see
+                                check_links
+        :param bool http_cache: Keep the downloaded files with their ETag or Last-Modified date in the cache
+                                directory, and only download them again if they changed, see HttpCache
         """
-        self.git_repo = git_repo
+        # cleaned here rather than in run(), so nothing in run() changes the state of the converter
+        self.git_repo = clean_repo_url(git_repo)
         self.out_dir = out_dir
         self.quiet = quiet
+        self.output_format = output_format
+        self.parallel_compression = parallel_compression
+        self.processes = processes
+        self.link_check = link_check
+
+        # the links check_links found broken by the last run
+        self.broken_links = []
+
+        # where the converted files are written while run() is working, see open_output
+        self.output = None
+
+        # the titles and tags of the articles while run() is working, see PageIndex
+        self.page_index = None
+
+        # the time spent in each stage of the run, see converters.metrics
+        self.metrics_file = metrics_file
+        self.trace_file = trace_file
+        self.metrics = Metrics(trace=bool(trace_file))
+
+        # the articles are downloaded by the pool and converted by the pipeline while run() is working
+        self.pool = WorkerPool(max_workers)
+        self.pipeline = None
+        configure_session(pool_maxsize=max_workers)
+        # a lock for each door43pages query, so the articles that have the same query send it once, see
+        # get_page_query_results
+        self.page_query_locks = {}
+        self.page_query_locks_lock = threading.Lock()
+
         # self.temp_dir = tempfile.mkdtemp()
 
-        if 'github' not in git_repo:
+        if 'github' not in git_repo and (not source_archive or source_archive is True):
             raise Exception('Currently only github repositories are supported.')
 
+        if source_archive is True:
+            source_archive = get_archive_url(git_repo)
+
+        self.source_archive = source_archive
+
         # get the language data
-        quiet_print(self.quiet, 'Downloading language data...', end=' ')
-        langs = get_languages()
+        quiet_print(self.quiet, 'Loading language data...', end=' ')
+        with metrics.activate(self.metrics), metrics.stage('languages'):
+            self.lang_data = get_language_data(lang_code, cache_dir)
         quiet_print(self.quiet, 'finished.')
 
-        self.lang_data = next((l for l in langs if l['lc'] == lang_code), '')
-
         if not self.lang_data:
             raise Exception('Information for language "{0}" was not found.'.format(lang_code))
 
+        # the caches are made once the arguments are known to be good
+        configure_http_cache(os.path.join(cache_dir or get_cache_dir(), 'http') if http_cache else None)
+
+        # the markdown converted from each text, shared with the other converters and runs
+        self.conversion_cache = None
+        if conversion_cache:
+            self.conversion_cache = ConversionCache(os.path.join(cache_dir or get_cache_dir(), 'conversions.sqlite'),
+                                                    '{0}-{1}'.format(type(self).__name__, self.converter_version),
+                                                    rule_sets=[self.markdown_rules, self.blank_line_rules])
+
+        # door43pages query results, keyed by namespace and query
+        self.page_query_cache = JsonCache(os.path.join(cache_dir or get_cache_dir(), 'page_queries.json'),
+                                          self.page_query_ttl)
+
     def __enter__(self):
         return self
 
@@ -51,98 +163,309 @@ class TWConverter(object):
         # delete temp files
         # if os.path.isdir(self.temp_dir):
         #     shutil.rmtree(self.temp_dir, ignore_errors=True)
-        pass
+
+        # the metrics are written even if the run failed
+        if self.metrics_file:
+            self.metrics.save(self.metrics_file)
+        if self.trace_file:
+            self.metrics.save_trace(self.trace_file)
 
     def run(self):
 
-        # https://          github.com/Door43/d43-en
-        # https://api.github.com/repos/door43/d43-en/contents/obe/kt
-        # https://api.github.com/repos/door43/d43-en/contents/obe/other
-        lang_code = self.lang_data['lc']
+        with metrics.activate(self.metrics), \
+                ConversionPipeline(self.pool, self.processes, cache=self.conversion_cache) as self.pipeline, \
+                open_output(self.out_dir, self.output_format, self.parallel_compression) as self.output:
+            # https://          github.com/Door43/d43-en
+            # https://api.github.com/repos/door43/d43-en/contents/obe/kt
+            # https://api.github.com/repos/door43/d43-en/contents/obe/other
+            lang_code = self.lang_data['lc']
+
+            kt_dir = os.path.join(self.out_dir, 'content', 'kt')
+            other_dir = os.path.join(self.out_dir, 'content', 'other')
+
+            # the articles converted by previous runs
+            state = ConversionState(self.output, self.converter_version)
+
+            # the titles and tags of all the articles, the page queries are answered from it
+            self.page_index = PageIndex([self.get_page_id(self.kt_source_dir),
+                                         self.get_page_id(self.other_source_dir)])
+            deferred = []
+
+            # the articles skipped because they did not change, but that list other articles, see find_stale_listings
+            listings = []
+
+            def write_article(article, md_text):
+                path, sha, save_as = article[:3]
+                self.output.write_file(save_as, self.finish_markdown(md_text))
+
+                page = self.page_index.get(self.get_page_id(path))
+                page_query = self.get_local_page_query(md_text)
+                state.set(path, sha, save_as, dict(page, page_query=page_query) if page_query else page)
+
+            def write(article, md_text):
+                # a page query can list any article, so it is filled in once all of them have been read
+                if self.page_query_re.search(md_text):
+                    deferred.append((article, md_text))
+                else:
+                    write_article(article, md_text)
+
+            try:
+                if self.source_archive:
+                    def fetch(a):
+                        return self.prepare_article(a[0], a[3])
+
+                    with metrics.stage('read_archive'):
+                        self.pipeline.run(self.read_archive(kt_dir, other_dir, state, listings), fetch, write)
+
+                else:
+                    # get the source files from the git repository
+                    with metrics.stage('list'):
+                        kt_list, other_list = self.list_source_files()
+
+                    listed = [(o, kt_dir) for o in kt_list] + [(o, other_dir) for o in other_list]
+                    for path in state.remove_missing([f[0]['path'] for f in listed]):
+                        quiet_print(self.quiet, 'Removed {0}.'.format(path))
+
+                    def fetch(a):
+                        return self.prepare_article(a[0], self.download_file(a[3]))
+
+                    articles = []
+                    for item, out_dir in listed:
+                        article = (item['path'], item['sha'], self.get_save_as(item['path'], out_dir),
+                                   item['download_url'])
+                        page = state.get_data(item['path'])
+                        if page is not None and state.is_current(item['path'], item['sha']):
+                            quiet_print(self.quiet, 'Skipping {0}.'.format(item['name']))
+                            page = dict(page)
+                            page_query = page.pop('page_query', None)
+                            self.page_index.add(self.get_page_id(item['path']), page)
+                            if page_query:
+                                listings.append((article, page_query))
+                        else:
+                            articles.append(article)
+
+                    self.pipeline.run(articles, fetch, write)
+
+                # the page index is complete now, the listings of the skipped articles may have changed
+                stale = self.find_stale_listings(listings)
+                if stale:
+                    self.pipeline.run(stale, fetch, write)
+
+                with metrics.stage('page_queries'):
+                    for article, md_text in deferred:
+                        write_article(article, md_text)
+            finally:
+                state.save()
+                self.page_query_cache.save()
+
+            with metrics.stage('manifest'):
+                manifest = ResourceManifest('tw', 'translationWords')
+                manifest.status['checking_level'] = '3'
+                manifest.status['version'] = '3'
+                manifest.status['checking_entity'] = 'Wycliffe Associates'
+
+                manifest.language['slug'] = lang_code
+                manifest.language['name'] = self.lang_data['ang']
+                manifest.language['dir'] = self.lang_data['ld']
+
+                manifest_str = json.dumps(manifest, sort_keys=False, indent=2, cls=ResourceManifestEncoder)
+                self.output.write_file(os.path.join(self.out_dir, 'manifest.json'), manifest_str)
+
+        # the output is read back once it is complete, a zip archive only exists once it has been closed
+        if self.link_check:
+            self.broken_links = self.check_links([self.output])
+
+    def check_links(self, outputs):
+        """
+        Checks the links between the converted files, including the ones earlier runs converted, and prints the
+        broken ones, see converters.links.
+        :param list outputs: The closed DirectoryOutput or ZipOutput of each output directory
+        :return: list (name, line, target) tuples of the broken links
+        """
+        broken_links = []
 
-        # clean up the git repo url
-        if self.git_repo[-4:] == '.git':
-            self.git_repo = self.git_repo[:-4]
+        with metrics.activate(self.metrics), metrics.stage('check_links'):
+            for output in outputs:
+                quiet_print(self.quiet, 'Checking the links in {0}...'.format(output.path), end=' ')
+                found = links.check_links(output.path)
+                quiet_print(self.quiet, 'found {0} broken.'.format(len(found)))
 
-        if self.git_repo[-1:] == '/':
-            self.git_repo = self.git_repo[:-1]
+                for broken_link in found:
+                    quiet_print(self.quiet, '   ' + links.format_broken_link(broken_link))
+                broken_links.extend(found)
 
-        # get the source files from the git repository
-        base_url = self.git_repo.replace('github.com', 'api.github.com/repos')
-        kt_api_url = join_url_parts(base_url, 'contents/obe/kt')
-        other_api_url = join_url_parts(base_url, 'contents/obe/other')
+        return broken_links
 
-        quiet_print(self.quiet, 'Downloading kt file names...', end=' ')
-        kt_list = [o['download_url'] for o in json.loads(get_url(kt_api_url))]
+    def list_source_files(self):
+        """
+        Lists the kt and other articles in the git repository. The whole git tree is listed with a single request,
+        unless it is too large for GitHub to return, then each directory is listed separately.
+        :return: tuple (kt_list, other_list) of GitHub contents API entries
+        """
+        quiet_print(self.quiet, 'Downloading file names...', end=' ')
+        files = list_repo_files(self.git_repo, [self.kt_source_dir, self.other_source_dir])
         quiet_print(self.quiet, 'finished.')
 
-        quiet_print(self.quiet, 'Downloading other file names...', end=' ')
-        other_list = [o['download_url'] for o in json.loads(get_url(other_api_url))]
-        quiet_print(self.quiet, 'finished.')
+        if files is None:
+            quiet_print(self.quiet, 'The repository tree is too large, listing each directory.')
+            base_url = get_api_url(self.git_repo)
+            kt_list = json.loads(get_url(join_url_parts(base_url, 'contents', self.kt_source_dir)))
+            other_list = json.loads(get_url(join_url_parts(base_url, 'contents', self.other_source_dir)))
+            return kt_list, other_list
 
-        target_dir = os.path.join(self.out_dir, 'content', 'kt')
-        for url in kt_list:
-            self.download_tw_file(url, target_dir)
+        kt_list = [o for o in files if o['path'] == '{0}/{1}'.format(self.kt_source_dir, o['name'])]
+        other_list = [o for o in files if o['path'] == '{0}/{1}'.format(self.other_source_dir, o['name'])]
 
-        target_dir = os.path.join(self.out_dir, 'content', 'other')
-        for url in other_list:
-            self.download_tw_file(url, target_dir)
+        return kt_list, other_list
 
-        manifest = ResourceManifest('tw', 'translationWords')
-        manifest.status['checking_level'] = '3'
-        manifest.status['version'] = '3'
-        manifest.status['checking_entity'] = 'Wycliffe Associates'
+    def read_archive(self, kt_dir, other_dir, state, listings):
+        """
+        Reads the articles that changed since the last run from the source archive. The output of the articles that
+        are no longer in it is deleted once the whole archive has been read.
+        :param ConversionState state:
+        :param list listings: The articles that are skipped but have a page query are added to it, with the page
+                              query, see find_stale_listings
+        :return: Yields (path, sha, save_as, dw_text) tuples
+        """
+        quiet_print(self.quiet, 'Reading {0}.'.format(self.source_archive))
+        paths = []
+
+        for path, dw_text in iter_source_files(self.source_archive, [self.kt_source_dir, self.other_source_dir],
+                                               self.lang_data['lc']):
+
+            dir_name, file_name = path.rsplit('/', 1)
+            if not file_name.endswith('.txt') or dir_name not in (self.kt_source_dir, self.other_source_dir):
+                continue
+
+            out_dir = kt_dir if dir_name == self.kt_source_dir else other_dir
+            paths.append(path)
+
+            sha = git_blob_sha(dw_text)
+            article = (path, sha, self.get_save_as(path, out_dir), dw_text)
+            if state.is_current(path, sha):
+                quiet_print(self.quiet, 'Skipping {0}.'.format(file_name))
+                self.page_index.add(self.get_page_id(path), PageIndex.read_page(dw_text))
+
+                page_query = (state.get_data(path) or {}).get('page_query')
+                if page_query:
+                    listings.append((article, page_query))
+                continue
+
+            quiet_print(self.quiet, 'Converting {0}.'.format(path))
+            yield article
+
+        for path in state.remove_missing(paths):
+            quiet_print(self.quiet, 'Removed {0}.'.format(path))
+
+    def get_local_page_query(self, md_text):
+        """
+        Returns the page query of an article if it is answered from the page index, with a digest of its results, so
+        the next run can tell whether the listing changed.
+        :param str|unicode md_text: The markdown of the article, before finish_markdown
+        :return: dict|None With the namespace, query and digest
+        """
+        search_results = self.page_query_re.search(md_text)
+        if not search_results or not self.page_index.covers(search_results.group(1)):
+            return None
 
-        manifest.language['slug'] = lang_code
-        manifest.language['name'] = self.lang_data['ang']
-        manifest.language['dir'] = self.lang_data['ld']
+        namespace, query = search_results.group(1), search_results.group(2)
+        return {'namespace': namespace, 'query': query, 'digest': self.get_page_query_digest(namespace, query)}
 
-        manifest_str = json.dumps(manifest, sort_keys=False, indent=2, cls=ResourceManifestEncoder)
-        write_file(os.path.join(self.out_dir, 'manifest.json'), manifest_str)
+    def get_page_query_digest(self, namespace, query):
+        results = self.page_index.query(namespace, query)
+        return hashlib.sha1(json.dumps(results, sort_keys=True).encode('utf-8')).hexdigest()
 
-    def download_tw_file(self, url_to_download, out_dir):
+    def find_stale_listings(self, listings):
+        """
+        Returns the articles that did not change, but whose page query lists other articles that were added, removed
+        or retitled since the last run. Called once the page index holds every article.
+        :param list listings: (article, page_query) tuples, see get_local_page_query
+        :return: list The articles to convert again
+        """
+        stale = [article for article, page_query in listings
+                 if self.get_page_query_digest(page_query['namespace'], page_query['query']) != page_query['digest']]
+
+        for article in stale:
+            quiet_print(self.quiet, 'Updating the listing of {0}.'.format(article[0]))
+        metrics.increment('page_queries.stale_listings', len(stale))
+
+        return stale
+
+    def get_page_id(self, source_path):
+        """
+        Returns the DokuWiki ID of a page or namespace of the source repository.
+        :param str|unicode source_path: ex. obe/kt/god.txt
+        :return: str|unicode ex. en:obe:kt:god
+        """
+        if source_path.endswith('.txt'):
+            source_path = source_path[:-4]
 
-        file_name = url_to_download.rsplit('/', 1)[1]
-        save_as = os.path.join(out_dir, file_name.replace('.txt', '.md'))
-        if os.path.isfile(save_as):
-            quiet_print(self.quiet, 'Skipping {0}.'.format(file_name))
-            return
+        return '{0}:{1}'.format(self.lang_data['lc'], source_path.replace('/', ':'))
 
+    @staticmethod
+    def get_save_as(source_path, out_dir):
+
+        file_name = source_path.rsplit('/', 1)[1]
+        return os.path.join(out_dir, file_name.replace('.txt', '.md'))
+
+    def download_file(self, url_to_download):
+        """
+        Downloads the DokuWiki text of an article.
+        :return: str|unicode
+        """
         try:
             quiet_print(self.quiet, 'Downloading {0}...'.format(url_to_download), end=' ')
-            dw_text = get_url(url_to_download)
+            with metrics.stage('download', url_to_download):
+                dw_text = get_url(url_to_download)
 
         finally:
             quiet_print(self.quiet, 'finished.')
 
-        quiet_print(self.quiet, 'Converting {0} to markdown...'.format(file_name), end=' ')
-        md_text = dokuwiki_to_markdown(dw_text)
+        return dw_text
 
+    def prepare_article(self, path, dw_text):
+        """
+        Adds an article to the page index. A page query for a namespace outside the tW corpus is sent to door43,
+        unless it is cached, so the results are ready when the converted article is written. This runs on the download
+        threads.
+        :param str|unicode path: The path of the article in the source repository
+        :param str|unicode dw_text:
+        :return: tuple The function that converts the article and its text, see ConversionPipeline.run
+        """
+        self.page_index.add(self.get_page_id(path), PageIndex.read_page(dw_text))
+
+        search_results = self.page_query_re.search(dw_text)
+        if search_results and not self.page_index.covers(search_results.group(1)):
+            with metrics.stage('page_queries'):
+                self.get_page_query_results(search_results.group(1), search_results.group(2))
+
+        return convert_tw_text, dw_text
+
+    def fix_markdown(self, md_text):
+        """
+        Cleans up the markdown of an article and fills in its page query.
+        :param str|unicode md_text:
+        :return: str|unicode
+        """
         # old_url = 'https://api.unfoldingword.org/obs/jpg/1/en/'
         # cdn_url = 'https://cdn.door43.org/obs/jpg/'
         # md_text = md_text.replace(old_url, cdn_url)
 
-        # fix links to other tW articles
-        md_text = self.update_tw_links(md_text)  # self.tw_link_re.sub(r'[\3](../\1/\2.md)', md_text)
-        md_text = self.update_obs_links(md_text)
-
-        # remove tags
-        md_text = self.tag_re.sub(r'', md_text)
-
-        # remove squiggly tags
-        md_text = self.squiggly_re.sub(r'', md_text)
+        # fix links to other tW articles and to OBS, remove tags
+        return self.finish_markdown(self.markdown_rules.apply(md_text))
 
+    def finish_markdown(self, md_text):
+        """
+        Fills in the page query of an article converted by convert_tw_text. This runs on the thread that writes the
+        articles, because the page query results are not available to the conversion processes.
+        :param str|unicode md_text:
+        :return: str|unicode
+        """
         # get page query
         md_text = self.get_page_query(md_text)
 
         # remove extra blank lines
-        md_text = self.extra_blanks_re.sub(r'\n\n', md_text)
-
-        quiet_print(self.quiet, 'finished.')
-
-        quiet_print(self.quiet, 'Saving {0}...'.format(save_as), end=' ')
-        write_file(save_as, md_text)
-        quiet_print(self.quiet, 'finished.')
+        return self.blank_line_rules.apply(md_text)
 
     def get_page_query(self, md_text):
 
@@ -150,6 +473,52 @@ class TWConverter(object):
         if not search_results:
             return md_text
 
+        listing = '\n'
+
+        for ref in self.get_page_query_results(search_results.group(1), search_results.group(2)):
+            listing += '* [{0}](https://door43.org{1})\n'.format(ref[1], ref[0])
+
+        md_text = self.page_query_re.sub(listing, md_text)
+
+        return md_text
+
+    @staticmethod
+    def get_page_query_key(namespace, query):
+        return json.dumps([namespace, query])
+
+    def get_page_query_results(self, namespace, query):
+        """
+        Returns the list of [url, title] pairs that door43 returns for a door43pages query. A query for the kt or
+        other articles is answered from the page index. Other queries are sent to door43, and the results are kept in
+        the page query cache, so each namespace and query is only sent once per <page_query_ttl> seconds. While a
+        query is being sent, the download threads that need the same one wait for its results.
+        :param str|unicode namespace:
+        :param str|unicode query:
+        :return: list
+        """
+        if self.page_index is not None and self.page_index.covers(namespace):
+            metrics.increment('page_queries.local')
+            return self.page_index.query(namespace, query)
+
+        key = self.get_page_query_key(namespace, query)
+        with self.page_query_locks_lock:
+            key_lock = self.page_query_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            results = self.page_query_cache.get(key)
+
+            if results is None:
+                metrics.increment('page_queries.cache_misses')
+                results = self.query_door43_pages(namespace, query)
+                self.page_query_cache.set(key, results)
+            else:
+                metrics.increment('page_queries.cache_hits')
+
+        return results
+
+    @classmethod
+    def query_door43_pages(cls, namespace, query):
+
         post_data = {'call': 'get_door43pagequery2',
                      'data[subns]': 'false',
                      'data[nopages]': 'false',
@@ -178,53 +547,35 @@ class TWConverter(object):
                      'data[useLegacySyntax]': 'false',
                      'data[hidenopages]': 'false',
                      'data[hidenosubns]': 'false',
-                     'data[requested_namespaces][]': search_results.group(1),
-                     'data[requested_directories][]': search_results.group(1).replace(':', '/'),
+                     'data[requested_namespaces][]': namespace,
+                     'data[requested_directories][]': namespace.replace(':', '/'),
                      'data[showcount]': 'false',
                      'data[fontsize][]': '100%',
                      'data[pos]': '1638',
-                     'data[query][]': search_results.group(2),
+                     'data[query][]': query,
                      'data[div_id]': '66D43DB7-68D9-781D-F94B-37FCAAAC0171'
                      }
 
-        response = json.loads(post_url('https://door43.org/lib/exe/ajax.php', post_data))
-        listing = '\n'
+        return json.loads(post_url(join_url_parts(cls.door43_url, 'lib/exe/ajax.php'), post_data))
 
-        for ref in response:
-            listing += '* [{0}](https://door43.org{1})\n'.format(ref[1], ref[0])
-
-        md_text = self.page_query_re.sub(listing, md_text)
 
-        return md_text
+def convert_tw_text(dw_text):
+    """
+    Converts the DokuWiki text of an article to markdown, except for its page query, see finish_markdown. This runs in
+    the conversion processes.
+    :param str|unicode dw_text:
+    :return: str|unicode
+    """
+    return TWConverter.markdown_rules.apply(dokuwiki_to_markdown(dw_text))
 
-    def update_tw_links(self, md_text):
 
-        search_results = self.tw_link_re.search(md_text)
-        if not search_results:
-            return md_text
+def convert_tw_texts(dw_texts):
+    """
+    Converts the DokuWiki texts of several articles in one call, the same as convert_tw_text converts each one.
+    :param list dw_texts:
+    :return: list
+    """
+    return dokuwiki_to_markdown_batch(dw_texts, TWConverter.markdown_rules)
 
-        return self.tw_link_re.sub(self.replace_tw_link, md_text)
-
-    @staticmethod
-    def replace_tw_link(match):
-
-        parts = match.group(2).split('|', 1)
-
-        if len(parts) == 1:
-            return '[{0}](../{1}/{0}.md)'.format(parts[0], match.group(1))
-
-        return '[{0}](../{1}/{2}.md)'.format(parts[1], match.group(1), parts[0])
-
-    def update_obs_links(self, md_text):
-
-        search_results = self.obs_link_re.search(md_text)
-        if not search_results:
-            return md_text
-
-        return self.obs_link_re.sub(self.replace_obs_link, md_text)
-
-    @staticmethod
-    def replace_obs_link(match):
 
-        parts = match.group(1).split('|', 1)
-        return '[{0}](https://door43.org/en/obs/notes/frames/{0})'.format(parts[0])
+register_batch(convert_tw_text, convert_tw_texts)
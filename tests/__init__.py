@@ -0,0 +1,11 @@
+from __future__ import unicode_literals
+import atexit
+import os
+import shutil
+import tempfile
+
+# the converters keep their caches in ~/.cache unless they are given a cache_dir, the tests use a directory of their
+# own so they neither read nor leave behind the entries of a real run
+test_cache_dir = tempfile.mkdtemp(prefix='dokuwiki-to-rc-tests-')
+os.environ['DOKUWIKI_TO_RC_CACHE'] = test_cache_dir
+atexit.register(shutil.rmtree, test_cache_dir, True)
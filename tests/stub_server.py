@@ -0,0 +1,96 @@
+from __future__ import unicode_literals
+import gzip
+import io
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    # noinspection PyUnresolvedReferences
+    from SocketServer import ThreadingMixIn
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubServer(object):
+    """
+    A local HTTP server for the unit tests. Responses are looked up by path in <routes>, and every request is
+    recorded in <requests> as a (method, path, headers, client_port) tuple.
+    """
+
+    def __init__(self, routes=None):
+        """
+        :param dict routes: Maps a path to the response body, or to a function that takes the request handler and
+                            returns (status, headers, body)
+        """
+        self.routes = routes if routes is not None else {}
+        self.requests = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{0}'.format(self.server.server_address[1])
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    # noinspection PyUnusedLocal
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self.respond()
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                self.body = self.rfile.read(length)
+                self.respond()
+
+            def respond(self):
+                stub.requests.append((self.command, self.path, dict(self.headers), self.client_address[1]))
+                route = stub.routes.get(self.path.split('?', 1)[0])
+
+                if route is None:
+                    status, headers, body = 404, {}, b'Not Found'
+                elif callable(route):
+                    status, headers, body = route(self)
+                else:
+                    status, headers, body = 200, {}, route
+
+                if not isinstance(body, bytes):
+                    body = body.encode('utf-8')
+
+                if 'gzip' in self.headers.get('Accept-Encoding', '') and status == 200:
+                    buf = io.BytesIO()
+                    with gzip.GzipFile(fileobj=buf, mode='wb') as gz:
+                        gz.write(body)
+                    body = buf.getvalue()
+                    headers = dict(headers, **{'Content-Encoding': 'gzip'})
+
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            # noinspection PyShadowingBuiltins
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
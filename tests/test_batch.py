@@ -0,0 +1,81 @@
+from __future__ import print_function, unicode_literals
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+from unittest import TestCase
+from converters.batch import make_jobs, run_batch, format_summary, BatchJob
+from converters.cache import write_json_file
+
+
+class TestBatch(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='testBatch_')
+        self.cache_dir = os.path.join(self.temp_dir, 'cache')
+        self.out_dir = os.path.join(self.temp_dir, 'out')
+
+        catalog = [{'lc': 'en', 'ang': 'English', 'ld': 'ltr'}, {'lc': 'fr', 'ang': 'French', 'ld': 'ltr'}]
+        write_json_file(os.path.join(self.cache_dir, 'langnames.json'), catalog)
+        write_json_file(os.path.join(self.cache_dir, 'langnames.json.meta'), {'time': time.time()})
+
+        # a tW source archive for each language
+        for lang_code in ('en', 'fr'):
+            with tarfile.open(os.path.join(self.temp_dir, lang_code + '.tar.gz'), 'w:gz') as tar:
+                data = '====== God ({0}) ======\n'.format(lang_code).encode('utf-8')
+                info = tarfile.TarInfo('d43-{0}-master/obe/kt/god.txt'.format(lang_code))
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def make_jobs(self, lang_codes):
+        return make_jobs(lang_codes, ['tw'], self.out_dir, source_archive=os.path.join(self.temp_dir, '{lang}.tar.gz'),
+                         cache_dir=self.cache_dir)
+
+    def assert_converted(self, lang_code):
+        with io.open(os.path.join(self.out_dir, lang_code + '_tw', 'content', 'kt', 'god.md'), encoding='utf-8') as f:
+            self.assertEqual('# God ({0}) #\n'.format(lang_code), f.read())
+
+    def test_make_jobs(self):
+        jobs = make_jobs(['en', 'fr'], ['tq', 'tw'], self.out_dir)
+        self.assertEqual([('en', 'tq'), ('en', 'tw'), ('fr', 'tq'), ('fr', 'tw')],
+                         [(j.lang_code, j.resource) for j in jobs])
+        self.assertEqual('https://github.com/Door43/d43-fr', jobs[2].git_repo)
+
+        with self.assertRaises(ValueError):
+            BatchJob('en', 'ta', 'https://github.com/Door43/d43-en', self.out_dir)
+
+    def test_obs_archive(self):
+        """
+        This tests that a bare --archive makes the OBS conversion of a batch download the GitHub archive, like
+        convert-obs.py does
+        """
+        job = make_jobs(['en'], ['obs'], self.out_dir, source_archive=True, cache_dir=self.cache_dir)[0]
+        with job.make_converter() as converter:
+            self.assertEqual('https://github.com/Door43/d43-en/archive/master.tar.gz', converter.source_archive)
+
+    def test_single_process(self):
+        results = run_batch(self.make_jobs(['en', 'no_lang']), processes=1)
+
+        self.assertTrue(results[0].succeeded)
+        self.assertFalse(results[1].succeeded)
+        self.assertIn('no_lang', results[1].error)
+        self.assert_converted('en')
+
+        summary = format_summary(results)
+        self.assertIn('FAILED', summary)
+        self.assertIn('1 succeeded, 1 failed.', summary)
+
+    def test_process_pool(self):
+        reported = []
+        results = run_batch(self.make_jobs(['en', 'fr']), processes=2, on_result=reported.append)
+
+        self.assertEqual(['en', 'fr'], [r.lang_code for r in results])
+        self.assertTrue(all(r.succeeded for r in results))
+        self.assertEqual(2, len(reported))
+        self.assert_converted('en')
+        self.assert_converted('fr')
@@ -0,0 +1,38 @@
+from __future__ import print_function, unicode_literals
+from unittest import TestCase
+from benchmarks.corpus import scale_corpus
+from benchmarks.suite import BenchmarkSuite, compare_reports, format_report
+
+
+class TestBenchmarks(TestCase):
+
+    def test_scale_corpus(self):
+        self.assertEqual(['a', 'b', 'a', 'b'], list(scale_corpus(['a', 'b'], 2)))
+        self.assertEqual(4, len(set(scale_corpus(['a', 'b'], 2, True))))
+
+    def test_suite(self):
+        """
+        This tests that every benchmark runs on the smallest corpus
+        """
+        with BenchmarkSuite([1], [1], 1, True) as suite:
+            report = suite.run()
+
+        names = set(r['name'] for r in report['results'])
+        self.assertEqual({'dokuwiki_to_markdown_cascade', 'dokuwiki_to_markdown', 'tq_bible_post_processing',
+                          'tq_obs_post_processing', 'tw_post_processing', 'obs_run', 'tq_run', 'tw_run',
+                          'tw_run_zip', 'tw_run_processes', 'tw_run_unchanged', 'tw_run_cached'}, names)
+
+        for result in report['results']:
+            self.assertGreater(result['pages'], 0)
+            self.assertGreater(result['pages_per_second'], 0)
+
+        self.assertIn('dokuwiki_to_markdown', format_report(report))
+
+    def test_compare_reports(self):
+        baseline = {'results': [{'name': 'a', 'scale': 1, 'pages_per_second': 100.0},
+                                {'name': 'b', 'scale': 1, 'pages_per_second': 100.0}]}
+        current = {'results': [{'name': 'a', 'scale': 1, 'pages_per_second': 95.0},
+                               {'name': 'b', 'scale': 1, 'pages_per_second': 50.0},
+                               {'name': 'c', 'scale': 1, 'pages_per_second': 1.0}]}
+
+        self.assertEqual([('b', 1, 100.0, 50.0)], compare_reports(baseline, current, 0.1))
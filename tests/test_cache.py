@@ -0,0 +1,111 @@
+from __future__ import print_function, unicode_literals
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+from converters.cache import JsonCache, HttpCache
+
+
+class TestJsonCache(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='testCache_')
+        self.file_name = os.path.join(self.temp_dir, 'sub', 'cache.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_saved_between_runs(self):
+        cache = JsonCache(self.file_name, 60)
+        cache.set('["en:obe:kt", "tag"]', [['/en/obe/kt/god', 'God']])
+        cache.save()
+
+        cache = JsonCache(self.file_name, 60)
+        self.assertIn('["en:obe:kt", "tag"]', cache)
+        self.assertEqual([['/en/obe/kt/god', 'God']], cache.get('["en:obe:kt", "tag"]'))
+        self.assertIsNone(cache.get('missing'))
+
+    def test_expired(self):
+        cache = JsonCache(self.file_name, 60)
+        cache.set('old', 1)
+        cache.entries['old']['time'] = time.time() - 120
+        cache.set('new', 2)
+
+        self.assertNotIn('old', cache)
+        self.assertEqual('default', cache.get('old', 'default'))
+
+        # expired entries are not written to the file
+        cache.save()
+        self.assertEqual(['new'], list(JsonCache(self.file_name, 60).entries.keys()))
+
+    def test_damaged_file(self):
+        os.makedirs(os.path.dirname(self.file_name))
+        with open(self.file_name, 'w') as out_file:
+            out_file.write('{not json')
+
+        self.assertEqual({}, JsonCache(self.file_name, 60).entries)
+
+    def test_save_keeps_other_entries(self):
+        first = JsonCache(self.file_name, 60)
+        second = JsonCache(self.file_name, 60)
+        first.set('a', 1)
+        second.set('b', 2)
+        first.save()
+        second.save()
+
+        cache = JsonCache(self.file_name, 60)
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(2, cache.get('b'))
+
+
+class TestHttpCache(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='testHttpCache_')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    @staticmethod
+    def set_used(cache, url, seconds_ago):
+        used = time.time() - seconds_ago
+        os.utime(cache.get_file_name(url), (used, used))
+
+    def test_expired(self):
+        cache = HttpCache(self.temp_dir, max_age=60)
+        cache.set('https://example.com/old', {'ETag': '"v1"'}, 'Old')
+        cache.set('https://example.com/new', {'ETag': '"v1"'}, 'New')
+        self.set_used(cache, 'https://example.com/old', 120)
+
+        self.assertIsNone(cache.get('https://example.com/old'))
+        self.assertEqual('New', cache.get('https://example.com/new')['body'])
+
+        # the next prune removes the file
+        cache.prune()
+        self.assertFalse(os.path.isfile(cache.get_file_name('https://example.com/old')))
+
+    def test_least_recently_used(self):
+        body = 'x' * 1000
+        cache = HttpCache(self.temp_dir, max_bytes=4000)
+        for i in range(3):
+            cache.set('https://example.com/{0}'.format(i), {'ETag': '"v1"'}, body)
+            self.set_used(cache, 'https://example.com/{0}'.format(i), 100 - i)
+
+        # a response that is used is kept longer than the ones added after it
+        self.assertIsNotNone(cache.get('https://example.com/0'))
+        cache.set('https://example.com/3', {'ETag': '"v1"'}, body)
+
+        kept = [i for i in range(4) if os.path.isfile(cache.get_file_name('https://example.com/{0}'.format(i)))]
+        self.assertEqual([0, 2, 3], kept)
+        self.assertLessEqual(cache.size, 4000 * 0.9)
+
+    def test_size_counted_again(self):
+        # responses added by another process count when this one prunes
+        other = HttpCache(self.temp_dir)
+        for i in range(3):
+            other.set('https://example.com/{0}'.format(i), {'ETag': '"v1"'}, 'x' * 1000)
+
+        cache = HttpCache(self.temp_dir, max_bytes=2500)
+        cache.set('https://example.com/3', {'ETag': '"v1"'}, 'x' * 1000)
+        self.assertEqual(2, len(os.listdir(self.temp_dir)))
@@ -0,0 +1,246 @@
+from __future__ import print_function, unicode_literals
+import codecs
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+from converters import metrics, common
+from converters.common import dokuwiki_to_markdown, dokuwiki_to_markdown_batch, dokuwiki_to_markdown_cascade, \
+    get_url, post_url, get_session, configure_session, configure_http_cache
+from converters.cache import write_json_file
+from converters.metrics import Metrics
+from converters.tw_converter import TWConverter
+from tests.stub_server import StubServer
+
+resources_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'resources')
+
+
+class TestDokuwikiToMarkdown(TestCase):
+
+    def assert_same_as_cascade(self, text):
+        self.assertEqual(dokuwiki_to_markdown_cascade(text), dokuwiki_to_markdown(text))
+
+    def test_obs_corpus(self):
+        """
+        This tests that every file in the OBS test corpus converts the same as with the regex cascade
+        """
+        count = 0
+        for root, dirs, files in os.walk(os.path.join(resources_dir, 'master', 'obs')):
+            for file_name in files:
+                with codecs.open(os.path.join(root, file_name), 'r', 'utf-8') as in_file:
+                    self.assert_same_as_cascade(in_file.read())
+                count += 1
+
+        self.assertGreater(count, 700)
+
+    def test_batch(self):
+        """
+        This tests that converting the OBS test corpus in one batch gives each file the same markdown as converting
+        it alone
+        """
+        texts = []
+        for root, dirs, files in os.walk(os.path.join(resources_dir, 'master', 'obs')):
+            for file_name in sorted(files)[:100]:
+                with codecs.open(os.path.join(root, file_name), 'r', 'utf-8') as in_file:
+                    texts.append(in_file.read())
+
+        self.assertEqual([dokuwiki_to_markdown(text) for text in texts], dokuwiki_to_markdown_batch(texts))
+        self.assertEqual([TWConverter.markdown_rules.apply(dokuwiki_to_markdown(text)) for text in texts],
+                         dokuwiki_to_markdown_batch(texts, TWConverter.markdown_rules))
+
+    def test_formatting(self):
+        text = '====== Title ======\n\n===== Sub =====\n== Small ==\nSome //italic// and **bold** text.\n' \
+               '{{https://cdn.door43.org/obs/jpg/01-01.jpg}}\n[[https://door43.org|Door43]]\n'
+        expected = '# Title #\n\n## Sub ##\n##### Small #####\nSome _italic_ and __bold__ text.\n' \
+                   '![Image](https://cdn.door43.org/obs/jpg/01-01.jpg)\n[Door43](https://door43.org)\n'
+        self.assertEqual(expected, dokuwiki_to_markdown(text))
+        self.assert_same_as_cascade(text)
+
+    def test_lists(self):
+        self.assert_same_as_cascade('  * one\n\n  * two\n\n\n  * three\n      * nested\n  - numbered\n')
+        self.assertEqual('*one\n*two', dokuwiki_to_markdown(' *one\n\n*two'))
+
+    def test_blank_lines(self):
+        for count in range(1, 30):
+            self.assert_same_as_cascade('a' + '\n' * count + 'b')
+            self.assert_same_as_cascade('\n' * count + 'a' + '\r\n' * count)
+            self.assert_same_as_cascade('\n' * count)
+
+    def test_italic_at_line_start(self):
+        self.assert_same_as_cascade('//first//\n//second// and http://example.com')
+        self.assertEqual('//first//\n_second_', dokuwiki_to_markdown('//first//\n//second//'))
+
+    def test_link_across_lines(self):
+        self.assert_same_as_cascade('[[http://door43.org/en\nobs|OBS]] text')
+        self.assert_same_as_cascade('[[http://a.org|a]]\nnext line|b]]')
+        self.assert_same_as_cascade('[[http://a.org\n\nno colon\nstill none|b]] ok: yes')
+
+    def test_closed_link(self):
+        """
+        This tests that a page with closed external links is converted line by line, without the cascade
+        """
+        calls = []
+        cascade = common.dokuwiki_to_markdown_cascade
+        common.dokuwiki_to_markdown_cascade = lambda text: calls.append(text) or cascade(text)
+        try:
+            for text in ['See [[https://example.com|text]].\nMore: text|with a pipe]] after a colon\n',
+                         '[[https://example.com|text]]\n[[http://door43.org|Door43]]\n',
+                         '[[http://door43.org/en/obs|OBS\nno end']:
+                self.assertEqual(cascade(text), dokuwiki_to_markdown(text))
+        finally:
+            common.dokuwiki_to_markdown_cascade = cascade
+
+        self.assertEqual([], calls)
+
+
+class TestSharedSession(TestCase):
+
+    def test_keep_alive(self):
+        """
+        This tests that consecutive requests reuse one gzip-compressed connection
+        """
+        routes = {'/a.txt': 'first', '/b.txt': 'second \u00e9', '/ajax.php': '[]'}
+        with StubServer(routes) as server:
+            self.assertEqual('first', get_url(server.url + '/a.txt'))
+            self.assertEqual('second \u00e9', get_url(server.url + '/b.txt'))
+            self.assertEqual('[]', post_url(server.url + '/ajax.php', {'call': 'test'}))
+
+        self.assertEqual(3, len(server.requests))
+        self.assertEqual(1, len(set(r[3] for r in server.requests)))
+        self.assertIn('gzip', server.requests[0][2]['Accept-Encoding'])
+        self.assertEqual('POST', server.requests[2][0])
+
+    def test_http_error(self):
+        with StubServer() as server:
+            with self.assertRaises(Exception):
+                get_url(server.url + '/missing.txt')
+
+    def test_file_url(self):
+        file_name = os.path.join(resources_dir, 'master', 'obs', '01.txt')
+        with codecs.open(file_name, 'r', 'utf-8') as in_file:
+            self.assertEqual(in_file.read(), get_url('file://' + file_name))
+
+    def test_configure_session(self):
+        session = get_session()
+        self.assertIs(session, get_session())
+
+        configure_session(pool_maxsize=1)
+        self.assertIs(session, get_session())
+
+        configure_session(pool_maxsize=64)
+        self.assertIsNot(session, get_session())
+        self.assertEqual(64, get_session().get_adapter('https://github.com')._pool_maxsize)
+
+
+class TestHttpCache(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='testHttpCache_')
+        configure_http_cache(self.temp_dir)
+
+    def tearDown(self):
+        configure_http_cache(None)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    @staticmethod
+    def make_route(body, etag=None, last_modified=None):
+        def route(handler):
+            headers = {}
+            if etag:
+                headers['ETag'] = etag
+            if last_modified:
+                headers['Last-Modified'] = last_modified
+
+            if (etag and handler.headers.get('If-None-Match') == etag) or \
+                    (last_modified and handler.headers.get('If-Modified-Since') == last_modified):
+                return 304, headers, b''
+
+            return 200, headers, body
+
+        return route
+
+    def test_etag(self):
+        m = Metrics()
+        routes = {'/page.txt': self.make_route('Pagé', etag='"v1"')}
+
+        with StubServer(routes) as server, metrics.activate(m):
+            self.assertEqual('Pagé', get_url(server.url + '/page.txt'))
+            self.assertEqual('Pagé', get_url(server.url + '/page.txt'))
+
+            # the page changed
+            routes['/page.txt'] = self.make_route('Changed', etag='"v2"')
+            self.assertEqual('Changed', get_url(server.url + '/page.txt'))
+
+        self.assertNotIn('If-None-Match', server.requests[0][2])
+        self.assertEqual('"v1"', server.requests[1][2]['If-None-Match'])
+        self.assertEqual('"v1"', server.requests[2][2]['If-None-Match'])
+        self.assertEqual(1, m.report()['counters']['http_cache.not_modified'])
+
+    def test_last_modified(self):
+        date = 'Wed, 21 Oct 2015 07:28:00 GMT'
+        with StubServer({'/contents': self.make_route('[]', last_modified=date)}) as server:
+            self.assertEqual('[]', get_url(server.url + '/contents'))
+            self.assertEqual('[]', get_url(server.url + '/contents'))
+
+        self.assertEqual(date, server.requests[1][2]['If-Modified-Since'])
+
+    def test_no_validators(self):
+        with StubServer({'/page.txt': 'Page'}) as server:
+            get_url(server.url + '/page.txt')
+            get_url(server.url + '/page.txt')
+
+        self.assertNotIn('If-Modified-Since', server.requests[1][2])
+        self.assertEqual([], os.listdir(self.temp_dir))
+
+    def test_not_configured(self):
+        configure_http_cache(None)
+        with StubServer({'/page.txt': self.make_route('Page', etag='"v1"')}) as server:
+            get_url(server.url + '/page.txt')
+            get_url(server.url + '/page.txt')
+
+        self.assertNotIn('If-None-Match', server.requests[1][2])
+
+    def test_converter_option(self):
+        """
+        This tests that a converter made with http_cache=False sends no conditional requests, and that the cache
+        is kept in the cache directory otherwise
+        """
+        cache_dir = os.path.join(self.temp_dir, 'cache')
+        write_json_file(os.path.join(cache_dir, 'langnames.json'), [{'lc': 'en', 'ang': 'English', 'ld': 'ltr'}])
+        write_json_file(os.path.join(cache_dir, 'langnames.json.meta'), {'time': time.time()})
+
+        with StubServer({'/page.txt': self.make_route('Page', etag='"v1"')}) as server:
+            TWConverter('en', 'https://github.com/Door43/d43-en', self.temp_dir, True, cache_dir=cache_dir,
+                        http_cache=False)
+            get_url(server.url + '/page.txt')
+            get_url(server.url + '/page.txt')
+
+            TWConverter('en', 'https://github.com/Door43/d43-en', self.temp_dir, True, cache_dir=cache_dir)
+            get_url(server.url + '/page.txt')
+            get_url(server.url + '/page.txt')
+
+        self.assertEqual([False, False, False, True], ['If-None-Match' in r[2] for r in server.requests])
+        self.assertEqual(1, len(os.listdir(os.path.join(cache_dir, 'http'))))
+
+    def test_no_cache_for_bad_arguments(self):
+        """
+        This tests that a converter whose language is not found leaves no cache behind, and does not turn the
+        HTTP cache on
+        """
+        configure_http_cache(None)
+        cache_dir = os.path.join(self.temp_dir, 'cache')
+        write_json_file(os.path.join(cache_dir, 'langnames.json'), [{'lc': 'en', 'ang': 'English', 'ld': 'ltr'}])
+        write_json_file(os.path.join(cache_dir, 'langnames.json.meta'), {'time': time.time()})
+
+        with self.assertRaises(Exception):
+            TWConverter('xx', 'https://github.com/Door43/d43-xx', self.temp_dir, True, cache_dir=cache_dir)
+        with self.assertRaises(Exception):
+            TWConverter('en', 'https://example.com/d43-en', self.temp_dir, True, cache_dir=cache_dir)
+
+        with StubServer({'/page.txt': self.make_route('Page', etag='"v1"')}) as server:
+            get_url(server.url + '/page.txt')
+            get_url(server.url + '/page.txt')
+
+        self.assertNotIn('If-None-Match', server.requests[1][2])
+        self.assertEqual(['langnames.json', 'langnames.json.meta'], sorted(os.listdir(cache_dir)))
@@ -0,0 +1,159 @@
+from __future__ import print_function, unicode_literals
+import binascii
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+from unittest import TestCase
+from converters import conversion_cache, metrics
+from converters.cache import write_json_file
+from converters.conversion_cache import ConversionCache
+from converters.metrics import Metrics
+from converters.pipeline import ConversionPipeline
+from converters.pool import WorkerPool
+from converters.rules import Rule, RuleSet, tag_rule
+from converters.tw_converter import TWConverter
+
+converted = []
+
+
+def upper(text):
+    converted.append(text)
+    return text.upper()
+
+
+def lower(text):
+    return text.lower()
+
+
+class TestConversionCache(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='testConversionCache_')
+        self.file_name = os.path.join(self.temp_dir, 'conversions.sqlite')
+        del converted[:]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_keys(self):
+        cache = ConversionCache(self.file_name, 'TWConverter-1')
+        key = cache.get_key(upper, 'Pagé')
+
+        self.assertEqual(key, ConversionCache(self.file_name, 'TWConverter-1').get_key(upper, 'Pagé'))
+        self.assertNotEqual(key, cache.get_key(lower, 'Pagé'))
+        self.assertNotEqual(key, cache.get_key(upper, 'Page'))
+        self.assertNotEqual(key, ConversionCache(self.file_name, 'TWConverter-2').get_key(upper, 'Pagé'))
+
+    def test_keys_follow_the_rules(self):
+        """
+        This tests that changing a rule, or the version of dokuwiki_to_markdown, changes the keys
+        """
+        def get_key(*rule_sets):
+            return ConversionCache(self.file_name, 'TWConverter-1', rule_sets=rule_sets).get_key(upper, 'Pagé')
+
+        key = get_key(RuleSet([tag_rule, Rule(r'Story #', r'Story ', ['Story #'])]))
+        self.assertEqual(key, get_key(RuleSet([tag_rule, Rule(r'Story #', r'Story ', ['Story #'])])))
+        self.assertNotEqual(key, get_key(RuleSet([tag_rule, Rule(r'Story #', r'Story: ', ['Story #'])])))
+        self.assertNotEqual(key, get_key(RuleSet([tag_rule, Rule(r'Story  #', r'Story ', ['Story #'])])))
+        self.assertNotEqual(key, get_key(RuleSet([tag_rule], [Rule(r'Story #', r'Story ', ['Story #'])])))
+        self.assertNotEqual(key, get_key())
+
+        version = conversion_cache.DOKUWIKI_TO_MARKDOWN_VERSION
+        conversion_cache.DOKUWIKI_TO_MARKDOWN_VERSION = version + '.1'
+        try:
+            self.assertNotEqual(key, get_key(RuleSet([tag_rule, Rule(r'Story #', r'Story ', ['Story #'])])))
+        finally:
+            conversion_cache.DOKUWIKI_TO_MARKDOWN_VERSION = version
+
+    def test_get_and_set(self):
+        cache = ConversionCache(self.file_name, '1')
+        key = cache.get_key(upper, 'pagé')
+        self.assertIsNone(cache.get(key))
+
+        cache.set(key, 'PAGÉ')
+        self.assertEqual('PAGÉ', cache.get(key))
+
+        # another process sees the entry
+        self.assertEqual('PAGÉ', ConversionCache(self.file_name, '1').get(key))
+
+    def test_evict_least_recently_used(self):
+        cache = ConversionCache(self.file_name, '1', max_bytes=1400)
+        texts = dict((k, binascii.hexlify(os.urandom(500)).decode('ascii')) for k in 'abc')
+
+        cache.set('a', texts['a'])
+        cache.set('b', texts['b'])
+        cache.get('a')
+
+        m = Metrics()
+        with metrics.activate(m):
+            cache.set('c', texts['c'])
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(texts['a'], cache.get('a'))
+        self.assertEqual(texts['c'], cache.get('c'))
+        self.assertEqual(1, m.report()['counters']['conversion_cache.evicted'])
+
+    def test_pipeline(self):
+        cache = ConversionCache(self.file_name, '1')
+
+        def run(texts):
+            written = {}
+            m = Metrics()
+            with ConversionPipeline(WorkerPool(4), cache=cache) as pipeline, metrics.activate(m):
+                pipeline.run(texts, lambda t: (upper, t), written.__setitem__)
+            return written, m.report()
+
+        written, report = run(['a', 'b', 'c'])
+        self.assertEqual({'a': 'A', 'b': 'B', 'c': 'C'}, written)
+        self.assertEqual(3, report['stages']['convert']['count'])
+
+        written, report = run(['a', 'b', 'c', 'd'])
+        self.assertEqual({'a': 'A', 'b': 'B', 'c': 'C', 'd': 'D'}, written)
+        self.assertEqual(['a', 'b', 'c', 'd'], sorted(converted))
+        self.assertEqual(3, report['counters']['conversion_cache.hits'])
+        self.assertEqual(1, report['stages']['convert']['count'])
+
+
+class TestConverterCache(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='testConverterCache_')
+        self.cache_dir = os.path.join(self.temp_dir, 'cache')
+        write_json_file(os.path.join(self.cache_dir, 'langnames.json'), [{'lc': 'en', 'ang': 'English', 'ld': 'ltr'},
+                                                                         {'lc': 'fr', 'ang': 'French', 'ld': 'ltr'}])
+        write_json_file(os.path.join(self.cache_dir, 'langnames.json.meta'), {'time': time.time()})
+
+        self.archive = os.path.join(self.temp_dir, 'source.tar.gz')
+        with tarfile.open(self.archive, 'w:gz') as tar:
+            for i in range(5):
+                data = '====== Word {0} ======\n\nSee [[:en:obe:kt:god|God]].\n'.format(i).encode('utf-8')
+                info = tarfile.TarInfo('d43-master/obe/kt/word{0}.txt'.format(i))
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def convert(self, lang_code):
+        out_dir = os.path.join(self.temp_dir, lang_code)
+        with TWConverter(lang_code, 'https://github.com/Door43/d43-' + lang_code, out_dir, True,
+                         cache_dir=self.cache_dir, source_archive=self.archive) as converter:
+            converter.run()
+
+        with io.open(os.path.join(out_dir, 'content', 'kt', 'word3.md'), encoding='utf-8') as f:
+            return f.read(), converter.metrics.report()['counters']
+
+    def test_shared_between_languages(self):
+        """
+        This tests that a language with the same text as another one is looked up instead of converted
+        """
+        md_text, counters = self.convert('en')
+        self.assertEqual(5, counters['conversion_cache.misses'])
+
+        fr_text, counters = self.convert('fr')
+        self.assertEqual(md_text, fr_text)
+        self.assertEqual(5, counters['conversion_cache.hits'])
+        self.assertNotIn('conversion_cache.misses', counters)
@@ -0,0 +1,107 @@
+from __future__ import print_function, unicode_literals
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+from unittest import TestCase
+import requests
+from converters.cache import write_json_file
+from converters.daemon import ConversionDaemon
+
+
+class TestConversionDaemon(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='testDaemon_')
+        self.cache_dir = os.path.join(self.temp_dir, 'cache')
+        write_json_file(os.path.join(self.cache_dir, 'langnames.json'), [{'lc': 'en', 'ang': 'English', 'ld': 'ltr'},
+                                                                         {'lc': 'fr', 'ang': 'French', 'ld': 'ltr'}])
+        write_json_file(os.path.join(self.cache_dir, 'langnames.json.meta'), {'time': time.time()})
+
+        self.archive = os.path.join(self.temp_dir, 'source.tar.gz')
+        with tarfile.open(self.archive, 'w:gz') as tar:
+            for i in range(10):
+                data = '====== Word {0} ======\n\nSee [[:en:obe:kt:god|God]].\n'.format(i).encode('utf-8')
+                info = tarfile.TarInfo('d43-en-master/obe/kt/word{0}.txt'.format(i))
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def wait_for(self, url, job_id):
+        for _ in range(200):
+            job = requests.get('{0}/jobs/{1}'.format(url, job_id)).json()
+            if job['status'] in ('succeeded', 'failed'):
+                return job
+            time.sleep(0.05)
+
+        self.fail('Job {0} did not finish.'.format(job_id))
+
+    def test_jobs(self):
+        out_dir = os.path.join(self.temp_dir, 'out')
+
+        with ConversionDaemon(port=0, max_jobs=2, cache_dir=self.cache_dir) as daemon:
+            submitted = []
+            for lang in ('en', 'fr', 'xx'):
+                response = requests.post(daemon.url + '/jobs', json={'resource': 'tw', 'lang': lang, 'out_dir': out_dir,
+                                                                     'source_archive': self.archive})
+                self.assertEqual(202, response.status_code)
+                submitted.append(response.json())
+
+            jobs = [self.wait_for(daemon.url, j['id']) for j in submitted]
+            listed = requests.get(daemon.url + '/jobs').json()['jobs']
+
+        self.assertEqual([1, 2, 3], [j['id'] for j in listed])
+        self.assertEqual(['succeeded', 'succeeded', 'failed'], [j['status'] for j in jobs])
+        self.assertIn('"xx" was not found', jobs[2]['error'])
+        self.assertEqual(10, jobs[0]['metrics']['counters']['files.converted'])
+        self.assertGreater(jobs[0]['seconds'], 0)
+
+        for lang in ('en', 'fr'):
+            with io.open(os.path.join(out_dir, lang + '_tw', 'content', 'kt', 'word3.md'), encoding='utf-8') as f:
+                self.assertEqual('# Word 3 #\n\nSee [God](../kt/god.md).\n', f.read())
+
+    def test_bad_requests(self):
+        with ConversionDaemon(port=0, cache_dir=self.cache_dir) as daemon:
+            response = requests.post(daemon.url + '/jobs', json={'resource': 'ta', 'lang': 'en', 'out_dir': 'out'})
+            self.assertEqual(400, response.status_code)
+            self.assertIn('Unknown resource', response.json()['error'])
+
+            response = requests.post(daemon.url + '/jobs', json={'resource': 'tw'})
+            self.assertEqual(400, response.status_code)
+
+            response = requests.post(daemon.url + '/jobs', data='not json',
+                                     headers={'Content-Type': 'application/json'})
+            self.assertEqual(400, response.status_code)
+
+            # what a web page can post to another site without asking first is refused
+            job = '{"resource": "tw", "lang": "en", "out_dir": "out"}'
+            for content_type in ('application/x-www-form-urlencoded', 'text/plain', 'multipart/form-data'):
+                response = requests.post(daemon.url + '/jobs', data=job, headers={'Content-Type': content_type})
+                self.assertEqual(415, response.status_code)
+            self.assertEqual(415, requests.post(daemon.url + '/jobs', data=job).status_code)
+
+            self.assertEqual(404, requests.get(daemon.url + '/jobs/7').status_code)
+            self.assertEqual([], requests.get(daemon.url + '/jobs').json()['jobs'])
+
+    def test_out_root(self):
+        out_root = os.path.join(self.temp_dir, 'out')
+
+        with ConversionDaemon(port=0, cache_dir=self.cache_dir, out_root=out_root) as daemon:
+            for out_dir in ('/tmp/elsewhere', '../escaped', out_root + '-other'):
+                response = requests.post(daemon.url + '/jobs', json={'resource': 'tw', 'lang': 'en', 'out_dir': out_dir,
+                                                                     'source_archive': self.archive})
+                self.assertEqual(400, response.status_code)
+                self.assertIn('has to be in', response.json()['error'])
+
+            response = requests.post(daemon.url + '/jobs', json={'resource': 'tw', 'lang': 'en', 'out_dir': 'en',
+                                                                 'source_archive': self.archive})
+            self.assertEqual(202, response.status_code)
+            job = self.wait_for(daemon.url, response.json()['id'])
+
+        self.assertEqual('succeeded', job['status'])
+        self.assertEqual(os.path.join(os.path.realpath(out_root), 'en'), job['out_dir'])
+        self.assertTrue(os.path.isfile(os.path.join(out_root, 'en', 'en_tw', 'content', 'kt', 'word3.md')))
@@ -0,0 +1,71 @@
+from __future__ import print_function, unicode_literals
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+from converters.cache import read_json_file, write_json_file
+from converters.languages import load_language_catalog, get_language_data
+from tests.stub_server import StubServer
+
+catalog = [{'lc': 'en', 'ang': 'English', 'ld': 'ltr'}, {'lc': 'ar', 'ang': 'Arabic', 'ld': 'rtl'}]
+
+
+def serve_catalog(handler):
+    if handler.headers.get('If-None-Match') == '"v1"':
+        return 304, {'ETag': '"v1"'}, b''
+
+    return 200, {'ETag': '"v1"', 'Last-Modified': 'Mon, 03 Oct 2016 00:00:00 GMT'}, json.dumps(catalog)
+
+
+class TestLanguageCatalog(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='testLanguages_')
+        self.file_name = os.path.join(self.temp_dir, 'langnames.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_download_and_revalidate(self):
+        with StubServer({'/langnames.json': serve_catalog}) as server:
+            url = server.url + '/langnames.json'
+
+            # not cached yet
+            self.assertEqual(catalog, load_language_catalog(self.file_name, url))
+            self.assertEqual(1, len(server.requests))
+
+            # still fresh, the server is not asked
+            self.assertEqual(catalog, load_language_catalog(self.file_name, url))
+            self.assertEqual(1, len(server.requests))
+
+            # expired, the server answers 304 Not Modified
+            meta = read_json_file(self.file_name + '.meta')
+            self.assertEqual('"v1"', meta['etag'])
+            meta['time'] = time.time() - 120
+            write_json_file(self.file_name + '.meta', meta)
+
+            self.assertEqual(catalog, load_language_catalog(self.file_name, url, ttl=60))
+            self.assertEqual(2, len(server.requests))
+            self.assertEqual('"v1"', server.requests[1][2]['If-None-Match'])
+            self.assertGreater(read_json_file(self.file_name + '.meta')['time'], meta['time'])
+
+    def test_stale_catalog_used_when_offline(self):
+        write_json_file(self.file_name, catalog)
+        write_json_file(self.file_name + '.meta', {'time': 0, 'etag': '"v1"'})
+
+        with StubServer() as server:
+            url = server.url + '/missing.json'
+            self.assertEqual(catalog, load_language_catalog(self.file_name, url))
+
+            # nothing cached to fall back on
+            with self.assertRaises(Exception):
+                load_language_catalog(os.path.join(self.temp_dir, 'other.json'), url)
+
+    def test_language_index(self):
+        write_json_file(self.file_name, catalog)
+        write_json_file(self.file_name + '.meta', {'time': time.time()})
+
+        self.assertEqual('Arabic', get_language_data('ar', self.temp_dir)['ang'])
+        self.assertEqual('', get_language_data('no_lang', self.temp_dir))
@@ -0,0 +1,85 @@
+from __future__ import print_function, unicode_literals
+import codecs
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+from converters.cache import write_json_file
+from converters.links import LinkIndex, check_links, get_anchor
+from converters.output import open_output
+from converters.tw_converter import TWConverter
+
+
+class TestLinkIndex(TestCase):
+
+    def test_get_anchor(self):
+        self.assertEqual('god-the-father', get_anchor(' God, the Father '))
+        self.assertEqual('translation-suggestions', get_anchor('Translation Suggestions:'))
+
+    def test_find_broken(self):
+        index = LinkIndex()
+        index.add('manifest.json')
+        index.add('content/kt/god.md', '# God #\n\n## Definition: ##\n\n## Definition: ##\n')
+        index.add('content/other/bread.md',
+                  '# bread #\n\n'
+                  '* [God](../kt/god.md), [defined](../kt/god.md#definition), [again](../kt/god.md#definition-1)\n'
+                  '* [grace](../kt/grace.md)\n'
+                  '* [here](#bread) [there](#missing)\n'
+                  '* [list](./) [root](../../manifest.json) [outside](../../../x.md) [web](https://door43.org/x)\n'
+                  '* [title](../kt/god.md "God") ![image](../kt/image.jpg)\n')
+
+        self.assertEqual([('content/other/bread.md', 4, '../kt/grace.md'),
+                          ('content/other/bread.md', 5, '#missing'),
+                          ('content/other/bread.md', 6, '../../../x.md'),
+                          ('content/other/bread.md', 7, '../kt/image.jpg')], index.find_broken())
+        self.assertEqual(11, len(index.links))
+
+
+class TestCheckLinks(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='testLinks_')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def write_files(self, output_format):
+        out_dir = os.path.join(self.temp_dir, 'en_tq')
+        with open_output(out_dir, output_format) as output:
+            output.write_file(os.path.join(out_dir, 'content', '01.md'), '[>>](./02.md)\n')
+            output.write_file(os.path.join(out_dir, 'content', '02.md'), '[<<](./01.md) [>>](./03.md)\n')
+
+        return output.path
+
+    def test_directory(self):
+        path = self.write_files('dir')
+        self.assertEqual([('content/02.md', 1, './03.md')], check_links(path))
+
+    def test_zip(self):
+        path = self.write_files('zip')
+        self.assertEqual([('en_tq/content/02.md', 1, './03.md')], check_links(path))
+
+    def test_tw_run(self):
+        cache_dir = os.path.join(self.temp_dir, 'cache')
+        write_json_file(os.path.join(cache_dir, 'langnames.json'), [{'lc': 'en', 'ang': 'English', 'ld': 'ltr'}])
+        write_json_file(os.path.join(cache_dir, 'langnames.json.meta'), {'time': time.time()})
+
+        checkout_dir = os.path.join(self.temp_dir, 'd43-en')
+        for path, dw_text in [('obe/kt/god.txt', '====== God ======\n\nSee [[:en:obe:other:bread|bread]].\n'),
+                              ('obe/other/bread.txt', '====== bread ======\n\nSee [[:en:obe:kt:grace|grace]].\n')]:
+            file_name = os.path.join(checkout_dir, *path.split('/'))
+            if not os.path.isdir(os.path.dirname(file_name)):
+                os.makedirs(os.path.dirname(file_name))
+            with codecs.open(file_name, 'w', 'utf-8') as out_file:
+                out_file.write(dw_text)
+
+        out_dir = os.path.join(self.temp_dir, 'en_tw')
+        with TWConverter('en', 'https://github.com/Door43/d43-en', out_dir, True, cache_dir=cache_dir,
+                         source_archive=checkout_dir, conversion_cache=False) as converter:
+            converter.run()
+
+        self.assertEqual([('content/other/bread.md', 3, '../kt/grace.md')], converter.broken_links)
+        counters = converter.metrics.report()['counters']
+        self.assertEqual(2, counters['links.checked'])
+        self.assertEqual(1, counters['links.broken'])
@@ -0,0 +1,116 @@
+from __future__ import print_function, unicode_literals
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+from unittest import TestCase
+from converters import metrics
+from converters.cache import read_json_file, write_json_file
+from converters.metrics import Metrics
+from converters.pool import WorkerPool
+from converters.tw_converter import TWConverter
+
+
+class TestMetrics(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='testMetrics_')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_stages_and_counters(self):
+        m = Metrics()
+        for i in range(3):
+            with m.stage('convert'):
+                time.sleep(0.01)
+        m.increment('output.files')
+        m.increment('output.bytes_out', 100)
+
+        report = m.report()
+        self.assertEqual(3, report['stages']['convert']['count'])
+        self.assertGreaterEqual(report['stages']['convert']['seconds'], 0.03)
+        self.assertLessEqual(report['stages']['convert']['max_seconds'], report['stages']['convert']['seconds'])
+        self.assertEqual({'output.files': 1, 'output.bytes_out': 100}, report['counters'])
+
+    def test_stage_timed_on_error(self):
+        m = Metrics()
+        with self.assertRaises(ValueError):
+            with m.stage('download'):
+                raise ValueError('Not found')
+
+        self.assertEqual(1, m.report()['stages']['download']['count'])
+
+    def test_no_active_metrics(self):
+        self.assertIsNone(metrics.current())
+        with metrics.stage('convert'):
+            metrics.increment('output.files')
+            metrics.record_http(200, 10)
+
+    def test_record_http(self):
+        m = Metrics()
+        with metrics.activate(m):
+            metrics.record_http(200, 10)
+            metrics.record_http(404, 5, 2)
+
+        self.assertIsNone(metrics.current())
+        self.assertEqual({'http.requests': 2, 'http.status.200': 1, 'http.status.404': 1, 'http.bytes_in': 15,
+                          'http.retries': 2}, m.report()['counters'])
+
+    def test_worker_pool(self):
+        """
+        This tests that the tasks of a WorkerPool record in the Metrics of the thread that started it
+        """
+        m = Metrics(trace=True)
+
+        def task(i):
+            with metrics.stage('convert', str(i)):
+                metrics.increment('pages')
+            return threading.current_thread().ident
+
+        with metrics.activate(m):
+            threads = WorkerPool(4).map(task, range(20))
+
+        self.assertGreater(len(set(threads)), 1)
+        self.assertEqual(20, m.report()['stages']['convert']['count'])
+        self.assertEqual(20, m.report()['counters']['pages'])
+
+        trace_file = os.path.join(self.temp_dir, 'trace.json')
+        m.save_trace(trace_file)
+        events = read_json_file(trace_file)['traceEvents']
+        self.assertEqual(20, len(events))
+        self.assertEqual(set(threads), set(e['tid'] for e in events))
+        self.assertEqual(sorted(str(i) for i in range(20)), sorted(e['args']['detail'] for e in events))
+
+    def test_tw_run(self):
+        cache_dir = os.path.join(self.temp_dir, 'cache')
+        write_json_file(os.path.join(cache_dir, 'langnames.json'), [{'lc': 'en', 'ang': 'English', 'ld': 'ltr'}])
+        write_json_file(os.path.join(cache_dir, 'langnames.json.meta'), {'time': time.time()})
+
+        archive = os.path.join(self.temp_dir, 'en.tar.gz')
+        with tarfile.open(archive, 'w:gz') as tar:
+            for name in ('god', 'faith'):
+                data = '====== {0} ======\n'.format(name).encode('utf-8')
+                info = tarfile.TarInfo('d43-en-master/obe/kt/{0}.txt'.format(name))
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+
+        metrics_file = os.path.join(self.temp_dir, 'metrics.json')
+        trace_file = os.path.join(self.temp_dir, 'trace.json')
+        with TWConverter('en', 'https://github.com/Door43/d43-en', os.path.join(self.temp_dir, 'en_tw'), True,
+                         cache_dir=cache_dir, source_archive=archive, metrics_file=metrics_file,
+                         trace_file=trace_file) as converter:
+            converter.run()
+
+        report = read_json_file(metrics_file)
+        for name in ('languages', 'read_archive', 'convert', 'write', 'manifest'):
+            self.assertIn(name, report['stages'])
+        self.assertEqual(2, report['stages']['convert']['count'])
+        self.assertEqual(1, report['counters']['language_catalog.cache_hits'])
+        self.assertEqual(2, report['counters']['files.converted'])
+        self.assertEqual(3, report['counters']['output.files'])
+
+        self.assertIn('convert', [e['name'] for e in read_json_file(trace_file)['traceEvents']])
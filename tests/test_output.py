@@ -0,0 +1,121 @@
+from __future__ import print_function, unicode_literals
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from unittest import TestCase
+from converters.cache import write_json_file
+from converters import output as output_module
+from converters.output import open_output, DirectoryOutput, ZipOutput
+from converters.pool import WorkerPool
+from converters.tw_converter import TWConverter
+
+
+class TestOutput(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='testOutput_')
+        self.out_dir = os.path.join(self.temp_dir, 'en_tw')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def write_files(self, output, count):
+        WorkerPool(4).map(lambda i: output.write_file(os.path.join(self.out_dir, 'content', '{0}.md'.format(i)),
+                                                      'Pagé {0}\n'.format(i) * 50), range(count))
+
+    def assert_zip(self, count):
+        with zipfile.ZipFile(self.out_dir + '.zip') as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(sorted('en_tw/content/{0}.md'.format(i) for i in range(count)), sorted(zf.namelist()))
+            self.assertEqual('Pagé 7\n' * 50, zf.read('en_tw/content/7.md').decode('utf-8'))
+
+    def test_open_output(self):
+        self.assertIsInstance(open_output(self.out_dir), DirectoryOutput)
+        self.assertIsInstance(open_output(self.out_dir, 'zip'), ZipOutput)
+        with self.assertRaises(ValueError):
+            open_output(self.out_dir, 'tar')
+
+    def test_zip(self):
+        with open_output(self.out_dir, 'zip') as output:
+            self.write_files(output, 30)
+            self.assertTrue(output.isfile(os.path.join(self.out_dir, 'content', '3.md')))
+
+        self.assert_zip(30)
+        self.assertFalse(os.path.isdir(self.out_dir))
+
+    def test_zip64(self):
+        # more files than a zip archive without the ZIP64 extensions can hold
+        count = 0x10000 + 10
+        with open_output(self.out_dir, 'zip') as output:
+            for i in range(count):
+                output.write_file(os.path.join(self.out_dir, 'content', '{0}.md'.format(i)), 'Pagé {0}\n'.format(i))
+
+        with zipfile.ZipFile(self.out_dir + '.zip') as zf:
+            self.assertEqual(count, len(zf.namelist()))
+            self.assertEqual('Pagé 65540\n', zf.read('en_tw/content/65540.md').decode('utf-8'))
+
+    def test_parallel_compression(self):
+        threads = set()
+
+        class ThreadZipOutput(ZipOutput):
+            def _add(self, name, data):
+                threads.add(threading.current_thread().name)
+                ZipOutput._add(self, name, data)
+
+        with ThreadZipOutput(self.out_dir + '.zip', self.out_dir, parallel=True, threads=3) as output:
+            for i in range(30):
+                file_name = os.path.join(self.out_dir, 'content', '{0}.md'.format(i))
+                output.write_file(file_name, 'Pagé {0}\n'.format(i) * 50)
+            self.assertTrue(output.isfile(os.path.join(self.out_dir, 'content', '3.md')))
+
+        self.assert_zip(30)
+
+        # the files were deflated on the compression threads, not on the thread that wrote them
+        self.assertNotIn(threading.current_thread().name, threads)
+        self.assertTrue(open_output(self.out_dir, 'zip', True).parallel)
+
+    def test_zip64_sizes(self):
+        # the sizes and offsets past the limit are written to the ZIP64 records, as for a file of 4 GiB or more
+        limit = output_module.ZIP64_LIMIT
+        output_module.ZIP64_LIMIT = 100
+        try:
+            with open_output(self.out_dir, 'zip', True) as output:
+                self.write_files(output, 30)
+        finally:
+            output_module.ZIP64_LIMIT = limit
+
+        self.assert_zip(30)
+
+    def test_failed_run(self):
+        with self.assertRaises(ValueError):
+            with open_output(self.out_dir, 'zip') as output:
+                self.write_files(output, 10)
+                raise ValueError('Conversion failed')
+
+        self.assertEqual([], os.listdir(self.temp_dir))
+
+    def test_tw_to_zip(self):
+        cache_dir = os.path.join(self.temp_dir, 'cache')
+        write_json_file(os.path.join(cache_dir, 'langnames.json'), [{'lc': 'en', 'ang': 'English', 'ld': 'ltr'}])
+        write_json_file(os.path.join(cache_dir, 'langnames.json.meta'), {'time': time.time()})
+
+        archive = os.path.join(self.temp_dir, 'en.tar.gz')
+        with tarfile.open(archive, 'w:gz') as tar:
+            data = '====== God ======\n'.encode('utf-8')
+            info = tarfile.TarInfo('d43-en-master/obe/kt/god.txt')
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+        with TWConverter('en', 'https://github.com/Door43/d43-en', self.out_dir, True, cache_dir=cache_dir,
+                         source_archive=archive, output_format='zip') as converter:
+            converter.run()
+
+        self.assertFalse(os.path.isdir(self.out_dir))
+        with zipfile.ZipFile(self.out_dir + '.zip') as zf:
+            self.assertEqual(['en_tw/content/kt/god.md', 'en_tw/manifest.json'], sorted(zf.namelist()))
+            self.assertEqual('# God #\n', zf.read('en_tw/content/kt/god.md').decode('utf-8'))
@@ -0,0 +1,155 @@
+from __future__ import print_function, unicode_literals
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+from unittest import TestCase
+from converters.cache import write_json_file
+from converters.page_index import PageIndex
+from converters.tw_converter import TWConverter
+from tests.stub_server import StubServer
+
+
+class TestPageIndex(TestCase):
+
+    def setUp(self):
+        self.index = PageIndex(['en:obe:kt', ':en:obe:other'])
+        pages = {'en:obe:kt:god': '====== God, Deity ======\n\n{{tag>kt god}}\n',
+                 'en:obe:kt:sin': '====== sin, sinful ======\n\n{{tag>kt}}\n{{tag>wrong}}\n',
+                 'en:obe:kt:home': '====== Key Terms ======\n\n{{tag>kt}}\n',
+                 'en:obe:other:bread': '====== bread ======\n\n{{tag>other food}}\n',
+                 'en:obe:other:fig': 'No heading {{tag>other Food tree}}'}
+        for page_id, dw_text in pages.items():
+            self.index.add(page_id, PageIndex.read_page(dw_text))
+
+    def query(self, namespace, query):
+        return [r[0].rsplit('/', 1)[-1] for r in self.index.query(namespace, query)]
+
+    def test_read_page(self):
+        self.assertEqual({'title': 'sin, sinful', 'tags': ['kt', 'wrong']}, self.index.get('en:obe:kt:sin'))
+        self.assertEqual({'title': None, 'tags': ['other', 'food', 'tree']}, self.index.get('en:obe:other:fig'))
+
+    def test_covers(self):
+        self.assertTrue(self.index.covers(':en:obe:kt'))
+        self.assertTrue(self.index.covers('en:obe:other:sub'))
+        self.assertFalse(self.index.covers('en:obe'))
+        self.assertFalse(self.index.covers('en:obs:notes'))
+
+    def test_results(self):
+        self.assertEqual([['/en/obe/kt/god', 'God, Deity'], ['/en/obe/kt/sin', 'sin, sinful']],
+                         self.index.query(':en:obe:kt', 'kt'))
+        self.assertEqual([['/en/obe/other/bread', 'bread'], ['/en/obe/other/fig', 'fig']],
+                         self.index.query('en:obe:other', ''))
+
+    def test_terms(self):
+        self.assertEqual(['bread', 'fig'], self.query('en:obe:other', 'tag:food'))
+        self.assertEqual(['god'], self.query('en:obe', 'deity'))
+        self.assertEqual(['sin'], self.query('en:obe', 'title:sinful'))
+        self.assertEqual([], self.query('en:obe', 'tag:sinful'))
+        self.assertEqual(['sin'], self.query('en:obe', 'sin*'))
+        self.assertEqual(['god'], self.query('en:obe', '"god, deity"'))
+        self.assertEqual(['god'], self.query('en:obe:kt', 'kt -wrong'))
+        self.assertEqual(['god', 'fig'], self.query('en:obe', 'tree OR tag:god'))
+
+
+class TestTWPageQueries(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='testPageQueries_')
+        self.cache_dir = os.path.join(self.temp_dir, 'cache')
+        self.out_dir = os.path.join(self.temp_dir, 'out')
+        write_json_file(os.path.join(self.cache_dir, 'langnames.json'), [{'lc': 'en', 'ang': 'English', 'ld': 'ltr'}])
+        write_json_file(os.path.join(self.cache_dir, 'langnames.json.meta'), {'time': time.time()})
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def convert(self, files, **kwargs):
+        archive = os.path.join(self.temp_dir, 'en.tar.gz')
+        with tarfile.open(archive, 'w:gz') as tar:
+            for path, dw_text in sorted(files.items()):
+                data = dw_text.encode('utf-8')
+                info = tarfile.TarInfo('d43-en-master/' + path)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+
+        with TWConverter('en', 'https://github.com/Door43/d43-en', self.out_dir, True, cache_dir=self.cache_dir,
+                         source_archive=archive, **kwargs) as converter:
+            converter.run()
+
+        with io.open(os.path.join(self.out_dir, 'content', 'kt', 'terms.md'), encoding='utf-8') as f:
+            return f.read(), converter.metrics.report()['counters']
+
+    def test_local_page_query(self):
+        files = {'obe/kt/terms.txt': '====== Terms ======\n\n{{door43pages @:en:obe:kt -q="tag:kt" -title}}\n',
+                 'obe/kt/god.txt': '====== God ======\n\n{{tag>kt}}\n',
+                 'obe/kt/grace.txt': '====== grace ======\n\n{{tag>kt}}\n',
+                 'obe/other/bread.txt': '====== bread ======\n\n{{tag>other}}\n'}
+
+        md_text, counters = self.convert(files)
+        self.assertEqual('# Terms #\n\n* [God](https://door43.org/en/obe/kt/god)\n'
+                         '* [grace](https://door43.org/en/obe/kt/grace)\n\n', md_text)
+        self.assertEqual(1, counters['page_queries.local'])
+        self.assertNotIn('http.requests', counters)
+
+        # the articles that did not change are skipped, but still listed
+        files['obe/kt/terms.txt'] += '\nMore.\n'
+        files['obe/kt/sin.txt'] = '====== sin ======\n\n{{tag>kt}}\n'
+        md_text, counters = self.convert(files)
+        self.assertIn('* [grace](https://door43.org/en/obe/kt/grace)\n* [sin](https://door43.org/en/obe/kt/sin)\n',
+                      md_text)
+        self.assertEqual(3, counters['files.unchanged'])
+
+    def test_stale_listing(self):
+        """
+        This tests that an article that did not change is converted again when its listing changed
+        """
+        files = {'obe/kt/terms.txt': '====== Terms ======\n\n{{door43pages @:en:obe:kt -q="tag:kt" -title}}\n',
+                 'obe/kt/god.txt': '====== God ======\n\n{{tag>kt}}\n',
+                 'obe/kt/grace.txt': '====== grace ======\n\n{{tag>kt}}\n'}
+        self.convert(files)
+
+        # nothing that is listed changed
+        files['obe/kt/bread.txt'] = '====== bread ======\n\n{{tag>other}}\n'
+        md_text, counters = self.convert(files)
+        self.assertEqual(0, counters['page_queries.stale_listings'])
+        self.assertEqual(3, counters['files.unchanged'])
+
+        # an article is retitled, and one is added
+        files['obe/kt/god.txt'] = '====== God, Deity ======\n\n{{tag>kt}}\n'
+        files['obe/kt/sin.txt'] = '====== sin ======\n\n{{tag>kt}}\n'
+        md_text, counters = self.convert(files)
+        self.assertEqual('# Terms #\n\n* [God, Deity](https://door43.org/en/obe/kt/god)\n'
+                         '* [grace](https://door43.org/en/obe/kt/grace)\n'
+                         '* [sin](https://door43.org/en/obe/kt/sin)\n\n', md_text)
+        self.assertEqual(1, counters['page_queries.stale_listings'])
+
+        # an article is removed
+        del files['obe/kt/grace.txt']
+        md_text, counters = self.convert(files)
+        self.assertNotIn('grace', md_text)
+        self.assertEqual(1, counters['page_queries.stale_listings'])
+
+    def test_shared_remote_query(self):
+        def ajax(handler):
+            # slow enough for the other download threads to need the same query while it is being sent
+            time.sleep(0.3)
+            return 200, {}, '[["/en/obs/01", "Creation"]]'
+
+        files = {'obe/kt/terms.txt': '====== Terms ======\n\n{{door43pages @:en:obs -q="story" -title}}\n'}
+        for name in ['god', 'grace', 'sin', 'love', 'faith']:
+            files['obe/kt/{0}.txt'.format(name)] = '====== {0} ======\n\n{{{{door43pages @:en:obs -q="story" ' \
+                                                  '-title}}}}\n'.format(name)
+
+        with StubServer({'/lib/exe/ajax.php': ajax}) as server:
+            TWConverter.door43_url = server.url
+            try:
+                md_text, counters = self.convert(files, max_workers=6, conversion_cache=False)
+            finally:
+                TWConverter.door43_url = 'https://door43.org'
+
+        self.assertEqual('# Terms #\n\n* [Creation](https://door43.org/en/obs/01)\n\n', md_text)
+        self.assertEqual(1, len(server.requests))
+        self.assertEqual(1, counters['page_queries.cache_misses'])
@@ -0,0 +1,236 @@
+from __future__ import print_function, unicode_literals
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+from unittest import TestCase
+from converters import tw_converter
+from converters.cache import write_json_file
+from converters.common import dokuwiki_to_markdown_batch
+from converters.pipeline import ConversionPipeline, get_size
+from converters.pool import WorkerPool
+from converters.tw_converter import TWConverter
+
+
+def upper(text):
+    return text.upper()
+
+
+def lower(text):
+    return text.lower()
+
+
+def fail(text):
+    raise ValueError('Cannot convert {0}'.format(text))
+
+
+class TestConversionPipeline(TestCase):
+
+    def run_pipeline(self, items, fetch, processes=0, max_queued_bytes=1000, write=None):
+        written = {}
+        writer_threads = set()
+
+        def default_write(item, md_text):
+            writer_threads.add(threading.current_thread().ident)
+            written[item] = md_text
+
+        with ConversionPipeline(WorkerPool(4), processes, max_queued_bytes) as pipeline:
+            pipeline.run(items, fetch, write or default_write)
+
+        if not write:
+            self.assertEqual({threading.current_thread().ident}, writer_threads)
+
+        return written
+
+    def test_convert_on_threads(self):
+        written = self.run_pipeline(range(20), lambda i: (upper, 'page {0}'.format(i)))
+        self.assertEqual(dict((i, 'PAGE {0}'.format(i)) for i in range(20)), written)
+
+    def test_convert_in_processes(self):
+        written = self.run_pipeline((i for i in range(20)), lambda i: (upper, 'page {0}'.format(i)), processes=2)
+        self.assertEqual(dict((i, 'PAGE {0}'.format(i)) for i in range(20)), written)
+
+    def test_batches(self):
+        """
+        This tests that the texts fetched while the processes are busy are sent to them together, split between the
+        processes and by the function that converts them
+        """
+        batches = []
+        fetched = []
+        all_fetched = threading.Event()
+
+        def fetch(i):
+            fetched.append(i)
+            if len(fetched) == 100:
+                all_fetched.set()
+            return upper if i % 2 else lower, 'Page {0}'.format(i)
+
+        written = {}
+        with ConversionPipeline(WorkerPool(4), 2, batch_size=16) as pipeline:
+            apply_async = pipeline.process_pool.apply_async
+
+            def counting_apply_async(func, args):
+                # the first text keeps the processes busy until the others are ready
+                all_fetched.wait(10)
+                batches.append((args[0], len(args[1])))
+                return apply_async(func, args)
+
+            pipeline.process_pool.apply_async = counting_apply_async
+            pipeline.run(range(100), fetch, written.__setitem__)
+
+        self.assertEqual(dict((i, 'PAGE {0}'.format(i) if i % 2 else 'page {0}'.format(i)) for i in range(100)),
+                         written)
+        self.assertEqual(100, sum(size for convert, size in batches))
+        self.assertLess(len(batches), 50)
+        self.assertEqual(4, max(size for convert, size in batches))
+
+    def test_queued_bytes_limited(self):
+        """
+        This tests that the fetch threads wait while the writer is behind
+        """
+        lock = threading.Lock()
+        queued = [0, 0]
+
+        def fetch(i):
+            with lock:
+                queued[0] += 1
+                queued[1] = max(queued[1], queued[0])
+            return upper, 'x' * 100
+
+        def write(item, md_text):
+            time.sleep(0.005)
+            with lock:
+                queued[0] -= 1
+
+        self.run_pipeline(range(50), fetch, max_queued_bytes=300, write=write)
+
+        # the threads waiting for room hold a fetched text each
+        self.assertLessEqual(queued[1], 3 + 4)
+
+    def test_queued_bytes_not_characters(self):
+        """
+        This tests that a text is charged the size of its UTF-8 bytes, not the number of its characters
+        """
+        self.assertEqual(200, get_size('\u044b' * 100))
+        self.assertEqual(400, get_size('\u0905' * 100 + '\U0001f600' * 25))
+
+        lock = threading.Lock()
+        queued = [0, 0]
+
+        def fetch(i):
+            with lock:
+                queued[0] += 1
+                queued[1] = max(queued[1], queued[0])
+            return upper, '\u044b' * 100
+
+        def write(item, md_text):
+            time.sleep(0.005)
+            with lock:
+                queued[0] -= 1
+
+        self.run_pipeline(range(50), fetch, max_queued_bytes=300, write=write)
+
+        # only one text of 200 bytes fits, and each of the other threads holds one while it waits
+        self.assertLessEqual(queued[1], 1 + 4)
+
+    def test_large_text(self):
+        written = self.run_pipeline(range(3), lambda i: (upper, 'x' * 5000), max_queued_bytes=1000)
+        self.assertEqual(3, len(written))
+
+    def test_write_error(self):
+        """
+        This tests that an error from the writer is raised, and that the rest of the items are not fetched
+        """
+        fetched = []
+
+        def write(item, md_text):
+            raise IOError('Disk full')
+
+        with self.assertRaises(IOError):
+            self.run_pipeline(range(1000), lambda i: fetched.append(i) or (upper, 'x'), write=write)
+
+        self.assertLess(len(fetched), 100)
+
+    def test_convert_error(self):
+        with self.assertRaises(ValueError):
+            self.run_pipeline(range(10), lambda i: (fail, 'x'), processes=2)
+
+    def test_fetch_error(self):
+        """
+        This tests that the files that were fetched are written before an error from fetching is raised
+        """
+        written = {}
+
+        def fetch(i):
+            if i == 3:
+                raise IOError('Not found')
+            return upper, 'page'
+
+        with self.assertRaises(IOError):
+            self.run_pipeline(range(10), fetch, write=written.__setitem__)
+
+        self.assertEqual([0, 1, 2, 4, 5, 6, 7, 8, 9], sorted(written))
+
+
+class TestConverterPipeline(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='testPipeline_')
+        self.cache_dir = os.path.join(self.temp_dir, 'cache')
+        write_json_file(os.path.join(self.cache_dir, 'langnames.json'), [{'lc': 'en', 'ang': 'English', 'ld': 'ltr'}])
+        write_json_file(os.path.join(self.cache_dir, 'langnames.json.meta'), {'time': time.time()})
+
+        self.archive = os.path.join(self.temp_dir, 'en.tar.gz')
+        with tarfile.open(self.archive, 'w:gz') as tar:
+            for i in range(20):
+                data = '====== Word {0} ======\n\nSee [[:en:obe:kt:god|God]].\n\n\n\n{{{{tag>kt}}}}\n'.format(i)
+                data = data.encode('utf-8')
+                info = tarfile.TarInfo('d43-en-master/obe/kt/word{0}.txt'.format(i))
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def convert(self, name, processes):
+        out_dir = os.path.join(self.temp_dir, name)
+        with TWConverter('en', 'https://github.com/Door43/d43-en', out_dir, True, cache_dir=self.cache_dir,
+                         source_archive=self.archive, processes=processes) as converter:
+            converter.run()
+
+        content_dir = os.path.join(out_dir, 'content', 'kt')
+        files = {}
+        for file_name in os.listdir(content_dir):
+            with io.open(os.path.join(content_dir, file_name), encoding='utf-8') as f:
+                files[file_name] = f.read()
+
+        return files
+
+    def test_tw_processes(self):
+        files = self.convert('threads', 0)
+        self.assertEqual(20, len(files))
+        self.assertEqual('# Word 3 #\n\nSee [God](../kt/god.md).\n\n', files['word3.md'])
+        self.assertEqual(files, self.convert('processes', 2))
+
+    def test_batches_on_threads(self):
+        """
+        This tests that without processes, the default, the articles are converted in batches by the batch entry
+        point of the converter
+        """
+        batches = []
+
+        def counting_batch(texts, rules=None):
+            batches.append(len(texts))
+            return dokuwiki_to_markdown_batch(texts, rules)
+
+        tw_converter.dokuwiki_to_markdown_batch = counting_batch
+        try:
+            files = self.convert('threads', 0)
+        finally:
+            tw_converter.dokuwiki_to_markdown_batch = dokuwiki_to_markdown_batch
+
+        self.assertEqual(20, sum(batches))
+        self.assertEqual('# Word 3 #\n\nSee [God](../kt/god.md).\n\n', files['word3.md'])
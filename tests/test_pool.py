@@ -0,0 +1,119 @@
+from __future__ import print_function, unicode_literals
+import random
+import threading
+import time
+from unittest import TestCase
+from converters.common import quiet_print, capture_output
+from converters.pool import WorkerPool
+
+
+class TestWorkerPool(TestCase):
+
+    def test_results_in_order(self):
+        """
+        This tests that the results are returned in the order of the items
+        """
+        def task(i):
+            time.sleep(random.random() / 100)
+            return i * 2
+
+        self.assertEqual([i * 2 for i in range(40)], WorkerPool(8).map(task, range(40)))
+
+    def test_output_in_order(self):
+        """
+        This tests that the messages printed by the tasks are written in the order of the items
+        """
+        def task(i):
+            time.sleep(random.random() / 100)
+            quiet_print(False, 'Task {0}...'.format(i), end=' ')
+            quiet_print(False, 'finished.')
+
+        with capture_output() as output:
+            WorkerPool(8).map(task, range(20))
+
+        expected = ''.join('Task {0}... finished.\n'.format(i) for i in range(20))
+        self.assertEqual(expected, ''.join(output))
+
+    def test_first_error_raised(self):
+        """
+        This tests that the error from the first failed item is raised after all the tasks are finished
+        """
+        finished = []
+
+        def task(i):
+            if i in (3, 7):
+                time.sleep(0.02 if i == 3 else 0)
+                raise ValueError('Failed {0}'.format(i))
+            finished.append(i)
+
+        with self.assertRaises(ValueError) as context:
+            WorkerPool(4).map(task, range(10))
+
+        self.assertEqual('Failed 3', str(context.exception))
+        self.assertEqual(8, len(finished))
+
+    def test_generator_items(self):
+        """
+        This tests that the tasks start while the items are still being produced
+        """
+        started = threading.Event()
+
+        def items():
+            yield 0
+            self.assertTrue(started.wait(5))
+            for i in range(1, 5):
+                yield i
+
+        def task(i):
+            started.set()
+            return i
+
+        self.assertEqual(list(range(5)), WorkerPool(2).map(task, items()))
+
+    def test_read_ahead_bounded(self):
+        """
+        This tests that the items are not read further ahead than the running tasks plus the queue
+        """
+        done = []
+
+        def items():
+            for i in range(30):
+                self.assertLessEqual(i - len(done), 4)
+                yield i
+
+        def task(i):
+            time.sleep(0.001)
+            done.append(i)
+
+        WorkerPool(2).map(task, items(), queue_size=2)
+        self.assertEqual(30, len(done))
+
+    def test_read_error(self):
+        """
+        This tests that an error reading the items is raised after the tasks already started have finished
+        """
+        finished = []
+
+        def items():
+            yield 1
+            yield 2
+            raise IOError('Listing failed')
+
+        def task(i):
+            time.sleep(0.01)
+            finished.append(i)
+
+        with self.assertRaises(IOError):
+            WorkerPool(4).map(task, items())
+
+        self.assertEqual([1, 2], sorted(finished))
+
+    def test_single_worker(self):
+        """
+        This tests that a pool with one worker runs the tasks on the calling thread
+        """
+        self.assertEqual([1, 2, 3], WorkerPool(1).map(lambda i: i + 1, [0, 1, 2]))
+
+    def test_invalid_max_workers(self):
+        with self.assertRaises(ValueError):
+            WorkerPool(0)
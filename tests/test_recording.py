@@ -0,0 +1,157 @@
+from __future__ import print_function, unicode_literals
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+from unittest import TestCase
+from requests.exceptions import ConnectionError
+from converters import metrics
+from converters.common import configure_recording, configure_http_cache, get_url, post_url
+from converters.metrics import Metrics
+from converters.recording import RecordingStore, strip_credentials
+from converters.sources import iter_archive_files
+from tests.stub_server import StubServer
+
+
+class TestRecording(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='testRecording_')
+        self.file_name = os.path.join(self.temp_dir, 'recording', 'http.sqlite')
+
+    def tearDown(self):
+        configure_recording(None)
+        configure_http_cache(None)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_record_and_replay(self):
+        routes = {'/page.txt': 'Pagé', '/ajax.php': lambda handler: (200, {}, b'ajax ' + handler.body)}
+
+        configure_recording(self.file_name, 'record')
+        with StubServer(routes) as server:
+            self.assertEqual('Pagé', get_url(server.url + '/page.txt'))
+            self.assertEqual('ajax call=one', post_url(server.url + '/ajax.php', {'call': 'one'}))
+            self.assertEqual('ajax call=two', post_url(server.url + '/ajax.php', {'call': 'two'}))
+            url = server.url
+
+        # the server is stopped, so every response comes from the recording
+        m = Metrics()
+        configure_recording(self.file_name, 'replay')
+        with metrics.activate(m):
+            self.assertEqual('Pagé', get_url(url + '/page.txt'))
+            self.assertEqual('ajax call=two', post_url(url + '/ajax.php', {'call': 'two'}))
+            self.assertEqual('ajax call=one', post_url(url + '/ajax.php', {'call': 'one'}))
+
+            with self.assertRaises(ConnectionError):
+                get_url(url + '/other.txt')
+
+        self.assertEqual(3, m.report()['counters']['recording.replayed'])
+
+    def test_credentials_not_recorded(self):
+        """
+        This tests that the access token of a request is not recorded, and that the request replays without it
+        """
+        configure_recording(self.file_name, 'record')
+        with StubServer({'/tree': '{"tree": []}'}) as server:
+            get_url(server.url + '/tree?recursive=1&access_token=secret')
+            url = server.url
+
+        connection = RecordingStore(self.file_name).connect()
+        for key, recorded_url in connection.execute('SELECT key, url FROM responses'):
+            self.assertNotIn('secret', key)
+            self.assertEqual(url + '/tree?recursive=1', recorded_url)
+
+        configure_recording(self.file_name, 'replay')
+        self.assertEqual('{"tree": []}', get_url(url + '/tree?recursive=1'))
+        self.assertEqual('{"tree": []}', get_url(url + '/tree?recursive=1&access_token=other'))
+
+    def test_conditional_headers_removed(self):
+        """
+        This tests that a response revalidated by the HTTP cache is recorded with its body
+        """
+        configure_http_cache(os.path.join(self.temp_dir, 'http'))
+        configure_recording(self.file_name, 'record')
+        with StubServer({'/page.txt': lambda handler: (200, {'ETag': '"v1"'}, b'Page')}) as server:
+            get_url(server.url + '/page.txt')
+            get_url(server.url + '/page.txt')
+            url = server.url
+
+        self.assertNotIn('If-None-Match', server.requests[1][2])
+
+        configure_http_cache(None)
+        configure_recording(self.file_name, 'replay')
+        self.assertEqual('Page', get_url(url + '/page.txt'))
+
+    def test_replay_archive(self):
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w:gz') as tar:
+            data = 'Word'.encode('utf-8')
+            info = tarfile.TarInfo('d43-en-master/obe/kt/word.txt')
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+        configure_recording(self.file_name, 'record')
+        with StubServer({'/en.tar.gz': buf.getvalue()}) as server:
+            url = server.url + '/en.tar.gz'
+            recorded = list(iter_archive_files(url, ['obe/kt']))
+
+        configure_recording(self.file_name, 'replay')
+        self.assertEqual([('obe/kt/word.txt', 'Word')], recorded)
+        self.assertEqual(recorded, list(iter_archive_files(url, ['obe/kt'])))
+
+
+class TestRecordingStore(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='testRecordingStore_')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_get_key(self):
+        self.assertEqual('GET http://a/b', RecordingStore.get_key('GET', 'http://a/b'))
+        self.assertNotEqual(RecordingStore.get_key('POST', 'http://a/b', 'x=1'),
+                            RecordingStore.get_key('POST', 'http://a/b', b'x=2'))
+
+    def test_strip_credentials(self):
+        self.assertEqual('http://a/b', strip_credentials('http://a/b?access_token=t'))
+        self.assertEqual('http://a/b?x=1', strip_credentials('http://a/b?access_token=t&x=1'))
+        self.assertEqual('http://a/b?x=1&y=2', strip_credentials('http://a/b?x=1&access_token=t&y=2'))
+        self.assertEqual('http://a/b?x=1#top', strip_credentials('http://a/b?x=1&access_token=t#top'))
+        self.assertEqual('http://a/b?my_access_token=t', strip_credentials('http://a/b?my_access_token=t'))
+
+    def test_evict_least_recently_used(self):
+        body = os.urandom(1000)
+        store = RecordingStore(os.path.join(self.temp_dir, 'http.sqlite'), max_bytes=2500)
+
+        store.set('a', 'GET', 'a', 200, {}, body)
+        store.set('b', 'GET', 'b', 200, {}, body)
+        self.assertEqual((200, {}, body), store.get('a'))
+
+        m = Metrics()
+        with metrics.activate(m):
+            store.set('c', 'GET', 'c', 200, {'ETag': '"c"'}, body)
+
+        self.assertIsNone(store.get('b'))
+        self.assertIsNotNone(store.get('a'))
+        self.assertEqual((200, {'ETag': '"c"'}, body), store.get('c'))
+        self.assertEqual(1, m.report()['counters']['recording.evicted'])
+
+    def test_total_kept(self):
+        """
+        This tests that the total size of the bodies is kept up to date as responses are replaced and evicted, and is
+        added up for a database recorded without it
+        """
+        file_name = os.path.join(self.temp_dir, 'http.sqlite')
+        store = RecordingStore(file_name, max_bytes=10000)
+        for i in range(30):
+            store.set(str(i % 12), 'GET', str(i), 200, {}, os.urandom(300 + i))
+
+        connection = store.connect()
+        total = connection.execute('SELECT size FROM totals').fetchone()[0]
+        self.assertEqual(connection.execute('SELECT SUM(size) FROM responses').fetchone()[0], total)
+        self.assertLessEqual(total, 10000)
+
+        connection.execute('DROP TABLE totals')
+        self.assertEqual(total, RecordingStore(file_name).connect().execute('SELECT size FROM totals').fetchone()[0])
@@ -0,0 +1,137 @@
+from __future__ import print_function, unicode_literals
+from unittest import TestCase
+from converters.rules import Rule, RuleSet, shift_template, split_first_literal, tag_rule, squiggly_rule, \
+    extra_blanks_rule
+from converters.tq_converter import TQConverter
+from converters.tw_converter import TWConverter
+
+
+class TestRuleSet(TestCase):
+
+    def test_combined_pass(self):
+        rules = RuleSet([Rule(r'(\w+)@(\w+)', r'\2 at \1', ['@']),
+                         Rule(r'#(\d+)', lambda m: 'number {0}'.format(int(m.group(1)) * 2), ['#']),
+                         tag_rule, squiggly_rule])
+
+        self.assertEqual('Mail example at joe, number 42 ',
+                         rules.apply('Mail joe@example, #21 {{tag>mail}}~~NOCACHE~~'))
+
+    def test_first_rule_wins(self):
+        rules = RuleSet([Rule(r'ab', r'1'), Rule(r'abc', r'2')])
+        self.assertEqual('1c', rules.apply('abc'))
+
+    def test_triggers(self):
+        calls = []
+
+        def replace(match):
+            calls.append(match.group(0))
+            return 'B'
+
+        rules = RuleSet([Rule(r'b', replace, ['a']), squiggly_rule])
+
+        self.assertEqual('b', rules.apply('b~~NOCACHE~~'))
+        self.assertEqual([], calls)
+        self.assertEqual('aB', rules.apply('ab'))
+        self.assertEqual(['b'], calls)
+
+        # each combination of rules is compiled once
+        rules.apply('ab~~NOCACHE~~')
+        rules.apply('ba~~DISCUSSION~~')
+        self.assertEqual(1, len(rules.combined))
+
+    def test_passes(self):
+        """
+        This tests that a later pass sees the blank lines that an earlier pass leaves behind
+        """
+        rules = RuleSet([tag_rule], [extra_blanks_rule])
+        self.assertEqual('a\n\nb', rules.apply('a\n\n{{tag>x}}\n\nb'))
+
+    def test_named_groups(self):
+        with self.assertRaises(ValueError):
+            Rule(r'(?P<name>a)', r'b')
+
+    def test_alternation(self):
+        rules = RuleSet([Rule(r'ab|cd', r'1'), Rule(r'x(y|z)', r'2\1')])
+        self.assertEqual('1 1 2y 2z', rules.apply('ab cd xy xz'))
+
+    def test_split_first_literal(self):
+        self.assertEqual((r'\[', r'\[.*?\]\]'), split_first_literal(r'\[\[.*?\]\]'))
+        self.assertEqual(('~', r'~(?:A|B)~~'), split_first_literal(r'~~(?:A|B)~~'))
+        self.assertEqual(('', r'\n{3,}'), split_first_literal(r'\n{3,}'))
+        self.assertEqual(('', r'a+b'), split_first_literal(r'a+b'))
+        self.assertEqual(('', r'(a)b'), split_first_literal(r'(a)b'))
+        self.assertEqual(('', r'ab|cd'), split_first_literal(r'ab|cd'))
+
+    def test_shift_template(self):
+        self.assertEqual(r'[\g<3>](\g<2>) \n \\1 \g<0>', shift_template(r'[\2](\g<1>) \n \\1 \0', 1))
+
+    def test_apply_batch(self):
+        """
+        This tests that a batch gives each text the same result as applying the rules to it alone, when the texts
+        have the triggers of different rules
+        """
+        texts = ['{{tag>kt}}\n\n\n\nSee [[:en:obe:kt:god|God]]', '[[:en:obs:notes:frames:01-02|01-02]]]\n~~NOCACHE~~',
+                 'Story #1\n    * [[:en:obs:notes:questions:01| Story 1 ]]\n__one__', 'plain text', '']
+
+        for rules in (TWConverter.markdown_rules, TQConverter.bible_rules, TQConverter.obs_rules):
+            self.assertEqual([rules.apply(text) for text in texts], rules.apply_batch(texts))
+            self.assertEqual([], rules.apply_batch([]))
+
+    def test_fingerprint(self):
+        def replace(match):
+            return match.group(0).upper()
+
+        def replace_lower(match):
+            return match.group(0).lower()
+
+        rules = RuleSet([Rule(r'a', replace, ['a']), tag_rule], [extra_blanks_rule])
+        fingerprint = rules.get_fingerprint()
+
+        self.assertEqual(fingerprint, RuleSet([Rule(r'a', replace, ['a']), tag_rule], [extra_blanks_rule])
+                         .get_fingerprint())
+        self.assertNotEqual(fingerprint, RuleSet([Rule(r'a', replace_lower, ['a']), tag_rule], [extra_blanks_rule])
+                            .get_fingerprint())
+        self.assertNotEqual(fingerprint, RuleSet([Rule(r'a', replace, ['b']), tag_rule], [extra_blanks_rule])
+                            .get_fingerprint())
+        self.assertNotEqual(fingerprint, RuleSet([Rule(r'a', replace, ['a']), tag_rule, extra_blanks_rule])
+                            .get_fingerprint())
+
+
+class TestConverterRules(TestCase):
+
+    def test_tq_obs_markdown(self):
+        md_text = '**[[:en:bible:questions:comprehension:1ch:home|Back to 1 Chronicles Chapter List]]**\n\n\n' \
+                  '{{tag>obs}}\n\n    * [[:en:obs:notes:questions:01| Story 1 ]]\n__Story #1__ ' \
+                  '[[en/obs/notes/questions/02|two]]\n~~DISCUSSION~~\n\n\n\n'
+
+        self.assertEqual('**[Back to 1 Chronicles Chapter List](./)**\n\n    * [Story 1](./01.md)\n\n__Story 1__ '
+                         '[two](./02.md)\n\n', TQConverter.obs_rules.apply(md_text))
+
+    def test_nested_matches(self):
+        """
+        This tests that a tag, a squiggly pattern or a story number inside a link is replaced the same as by applying
+        the rules one after the other
+        """
+        md_text = '[[:en:bible:questions:comprehension:1ch:home|Chapters {{tag>kt}}]] ' \
+                  '[[:en:obs:notes:questions:01|Story #1 ~~NOCACHE~~]] [[en/obs/notes/questions/02|two]]\n' \
+                  'See [[:en:obe:kt:god|God{{tag>kt}}]]~~DISCUSSION~~'
+
+        self.assertEqual('[Chapters ](./) [Story 1](./01.md) [two](./02.md)\nSee [[:en:obe:kt:god|God]]',
+                         TQConverter.obs_rules.apply(md_text))
+
+        for rules in (TWConverter.markdown_rules, TQConverter.bible_rules, TQConverter.obs_rules):
+            cascade = md_text
+            for rule in (rule for rules in rules.passes for rule in rules):
+                cascade = rule.regex.sub(rule.replacement, cascade)
+
+            self.assertEqual(cascade, rules.apply(md_text))
+            self.assertEqual([cascade, 'plain'], rules.apply_batch([md_text, 'plain']))
+
+    def test_tw_markdown(self):
+        md_text = '{{tag>kt}}\n\n\n\nSee [[:en:obe:kt:god|God]] and [[:en:obe:other:bread]], ' \
+                  '[[:en:obs:notes:frames:01-02|01-02]]]\n~~NOCACHE~~'
+
+        converter = TWConverter.__new__(TWConverter)
+        self.assertEqual('\n\nSee [God](../kt/god.md) and [bread](../other/bread.md), '
+                         '[01-02](https://door43.org/en/obs/notes/frames/01-02)\n',
+                         converter.fix_markdown(md_text))
@@ -0,0 +1,191 @@
+from __future__ import print_function, unicode_literals
+import codecs
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+from unittest import TestCase
+from benchmarks.corpus import write_obs_status
+from converters import metrics
+from converters.cache import write_json_file
+from converters.metrics import Metrics
+from converters.obs_converter import OBSConverter
+from converters.sources import iter_archive_files, get_archive_url, get_api_url, get_raw_url, list_repo_files, \
+    iter_source_files, iter_directory_files
+from converters.tw_converter import TWConverter
+from tests.stub_server import StubServer
+
+resources_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'resources')
+questions_dir = os.path.join(resources_dir, 'master', 'obs', 'notes', 'questions')
+
+
+class TestArchiveSource(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='testSources_')
+
+        # an archive laid out like the ones GitHub builds, with everything in a top-level directory
+        self.tar_file = os.path.join(self.temp_dir, 'master.tar.gz')
+        with tarfile.open(self.tar_file, 'w:gz') as tar:
+            tar.add(questions_dir, 'd43-en-master/obs/notes/questions')
+            tar.add(os.path.join(resources_dir, 'master', 'obs', '01.txt'), 'd43-en-master/obs/01.txt')
+
+        self.zip_file = os.path.join(self.temp_dir, 'master.zip')
+        with zipfile.ZipFile(self.zip_file, 'w') as zf:
+            for file_name in os.listdir(questions_dir):
+                zf.write(os.path.join(questions_dir, file_name), 'obs/notes/questions/' + file_name)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def assert_questions(self, files):
+        self.assertEqual(sorted('obs/notes/questions/' + f for f in os.listdir(questions_dir)),
+                         sorted(files.keys()))
+
+        with codecs.open(os.path.join(questions_dir, '01.txt'), 'r', 'utf-8') as in_file:
+            self.assertEqual(in_file.read(), files['obs/notes/questions/01.txt'])
+
+    def test_tar_file(self):
+        self.assert_questions(dict(iter_archive_files(self.tar_file, ['obs/notes/questions'])))
+
+    def test_zip_file(self):
+        self.assert_questions(dict(iter_archive_files(self.zip_file, ['obs/notes/questions/'])))
+
+    def test_remote_tar(self):
+        with io.open(self.tar_file, 'rb') as in_file:
+            routes = {'/Door43/d43-en/archive/master.tar.gz': in_file.read()}
+
+        with StubServer(routes) as server:
+            url = get_archive_url(server.url + '/Door43/d43-en.git')
+            self.assert_questions(dict(iter_archive_files(url, ['obs/notes/questions'])))
+
+    def test_other_prefix(self):
+        paths = [p for p, t in iter_archive_files(self.tar_file, ['obs'])]
+        self.assertIn('obs/01.txt', paths)
+        self.assertEqual(len(os.listdir(questions_dir)) + 1, len(paths))
+        self.assertEqual([], list(iter_archive_files(self.tar_file, ['obe/kt'])))
+
+    def test_archive_url(self):
+        self.assertEqual('https://github.com/Door43/d43-en/archive/master.tar.gz',
+                         get_archive_url('https://github.com/Door43/d43-en.git'))
+
+
+class TestTreeListing(TestCase):
+
+    tree = {'sha': 'abc',
+            'truncated': False,
+            'tree': [{'path': 'obe', 'type': 'tree', 'sha': '1'},
+                     {'path': 'obe/kt', 'type': 'tree', 'sha': '2'},
+                     {'path': 'obe/kt/god.txt', 'type': 'blob', 'sha': '3'},
+                     {'path': 'obe/other/bread.txt', 'type': 'blob', 'sha': '4'},
+                     {'path': 'obe/ktx/other.txt', 'type': 'blob', 'sha': '5'},
+                     {'path': 'obs/01.txt', 'type': 'blob', 'sha': '6'}]}
+
+    def test_urls(self):
+        self.assertEqual('https://api.github.com/repos/Door43/d43-en',
+                         get_api_url('https://github.com/Door43/d43-en.git'))
+        self.assertEqual('https://raw.githubusercontent.com/Door43/d43-en/master/obe/kt/god.txt',
+                         get_raw_url('https://github.com/Door43/d43-en/', 'obe/kt/god.txt'))
+        self.assertEqual('http://127.0.0.1:80/repos/Door43/d43-en', get_api_url('http://127.0.0.1:80/Door43/d43-en'))
+        self.assertEqual('http://127.0.0.1:80/Door43/d43-en/raw/master/obs/01.txt',
+                         get_raw_url('http://127.0.0.1:80/Door43/d43-en', 'obs/01.txt'))
+
+    def test_single_request(self):
+        routes = {'/repos/Door43/d43-en/git/trees/master': json.dumps(self.tree)}
+
+        with StubServer(routes) as server:
+            files = list_repo_files(server.url + '/Door43/d43-en', ['obe/kt', 'obe/other/'], 'token')
+
+            self.assertEqual(1, len(server.requests))
+            self.assertIn('recursive=1', server.requests[0][1])
+
+            # the token is sent in a header, the URL is written to the traces
+            self.assertNotIn('token', server.requests[0][1])
+            self.assertEqual('token token', server.requests[0][2]['Authorization'])
+
+        self.assertEqual(['obe/kt/god.txt', 'obe/other/bread.txt'], [f['path'] for f in files])
+        self.assertEqual({'name': 'god.txt', 'path': 'obe/kt/god.txt', 'sha': '3', 'type': 'file',
+                          'download_url': server.url + '/Door43/d43-en/raw/master/obe/kt/god.txt'}, files[0])
+
+    def test_truncated(self):
+        routes = {'/repos/Door43/d43-en/git/trees/master': json.dumps(dict(self.tree, truncated=True))}
+
+        with StubServer(routes) as server:
+            self.assertIsNone(list_repo_files(server.url + '/Door43/d43-en', ['obe/kt']))
+
+
+class TestDirectorySource(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='testDirectorySource_')
+        self.cache_dir = os.path.join(self.temp_dir, 'cache')
+        write_json_file(os.path.join(self.cache_dir, 'langnames.json'), [{'lc': 'en', 'ang': 'English', 'ld': 'ltr'}])
+        write_json_file(os.path.join(self.cache_dir, 'langnames.json.meta'), {'time': time.time()})
+
+        # a DokuWiki data directory, with the pages of each language in a namespace
+        self.data_dir = os.path.join(self.temp_dir, 'data')
+        self.write_page('pages/en/obe/kt/god.txt', '====== God ======\n\nSee [[:en:obe:other:bread|bread]].\n')
+        self.write_page('pages/en/obe/kt/grace.txt', '====== grace ======\n')
+        self.write_page('pages/en/obe/other/bread.txt', '====== bread ======\n')
+        self.write_page('pages/en/obe/kt/.god.txt.swp', 'hidden')
+        self.write_page('pages/en/obe/.git/config', 'hidden')
+        self.write_page('pages/fr/obe/kt/dieu.txt', '====== Dieu ======\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def write_page(self, path, dw_text):
+        file_name = os.path.join(self.data_dir, *path.split('/'))
+        if not os.path.isdir(os.path.dirname(file_name)):
+            os.makedirs(os.path.dirname(file_name))
+        with codecs.open(file_name, 'w', 'utf-8') as out_file:
+            out_file.write(dw_text)
+
+    def test_data_directory(self):
+        expected = ['obe/kt/god.txt', 'obe/kt/grace.txt', 'obe/other/bread.txt']
+        for directory in [self.data_dir, os.path.join(self.data_dir, 'pages')]:
+            files = list(iter_source_files(directory, ['obe/kt', 'obe/other'], 'en'))
+            self.assertEqual(expected, [path for path, _ in files])
+
+        self.assertEqual([('obe/kt/dieu.txt', '====== Dieu ======\n')],
+                         list(iter_source_files(self.data_dir, ['obe/kt'], 'fr')))
+
+    def test_checkout(self):
+        checkout_dir = os.path.join(self.data_dir, 'pages', 'en')
+        m = Metrics()
+        with metrics.activate(m):
+            files = dict(iter_directory_files(checkout_dir, ['obe/kt', 'obe/missing']))
+
+        self.assertEqual(['obe/kt/god.txt', 'obe/kt/grace.txt'], sorted(files.keys()))
+        self.assertEqual(2, m.report()['counters']['directory.files'])
+
+    def test_tw_run(self):
+        out_dir = os.path.join(self.temp_dir, 'tw')
+        with TWConverter('en', 'https://github.com/Door43/d43-en', out_dir, True, cache_dir=self.cache_dir,
+                         source_archive=self.data_dir) as converter:
+            converter.run()
+
+        self.assertTrue(os.path.isfile(os.path.join(out_dir, 'content', 'kt', 'grace.md')))
+        self.assertTrue(os.path.isfile(os.path.join(out_dir, 'content', 'other', 'bread.md')))
+        counters = converter.metrics.report()['counters']
+        self.assertEqual(3, counters['directory.files'])
+        self.assertNotIn('http.requests', counters)
+
+    def test_obs_run(self):
+        uwadmin_dir = os.path.join(self.temp_dir, 'uwadmin')
+        write_obs_status(uwadmin_dir)
+
+        # the stories are read from a checkout of a repository that is not on GitHub
+        out_dir = os.path.join(self.temp_dir, 'obs')
+        with OBSConverter('en', 'https://example.com/d43-en', out_dir, True, cache_dir=self.cache_dir,
+                          source_archive=os.path.join(resources_dir, 'master')) as converter:
+            converter.uwadmin_dir = 'file://' + uwadmin_dir
+            converter.run()
+
+        self.assertTrue(os.path.isfile(os.path.join(out_dir, 'content', '50.md')))
+        self.assertTrue(os.path.isfile(os.path.join(out_dir, 'content', '_back', 'back-matter.md')))
+        self.assertNotIn('http.requests', converter.metrics.report()['counters'])
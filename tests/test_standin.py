@@ -0,0 +1,121 @@
+from __future__ import print_function, unicode_literals
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+from benchmarks.standin import StandInServer, run_load_test, use_standin
+from benchmarks.synthetic import CorpusGenerator
+from converters.common import get_url, post_url
+from converters.languages import configure_language_catalog
+from converters.obs_converter import OBSConverter
+from converters.sources import get_api_url, list_repo_files
+from converters.tw_converter import TWConverter
+
+
+class TestCorpusGenerator(TestCase):
+
+    def test_pages(self):
+        pages = list(CorpusGenerator('en', seed=1).iter_pages(30))
+        paths = [p for p, _ in pages]
+
+        self.assertEqual(len(paths), len(set(paths)))
+        self.assertIn('obs/50.txt', paths)
+        self.assertIn('obs/notes/questions/01.txt', paths)
+        self.assertEqual(10, len([p for p in paths if p.startswith('obe/') and not p.endswith('/home.txt')]))
+        self.assertEqual(20, len([p for p in paths if p.startswith('bible/questions/comprehension/')]))
+
+        # the same seed generates the same corpus
+        self.assertEqual(pages, list(CorpusGenerator('en', seed=1).iter_pages(30)))
+        self.assertNotEqual(pages, list(CorpusGenerator('en', seed=2).iter_pages(30)))
+
+        articles = [t for p, t in pages if p.startswith('obe/kt/') and not p.endswith('/home.txt')]
+        self.assertTrue(all(t.startswith('====== ') and '[[:en:obe:' in t and '{{tag>kt ' in t for t in articles))
+
+
+class TestStandInServer(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='testStandIn_')
+        self.repos_dir = os.path.join(self.temp_dir, 'repos')
+        CorpusGenerator('en').write(os.path.join(self.repos_dir, 'd43-en'), 600)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        configure_language_catalog()
+        TWConverter.door43_url = 'https://door43.org'
+        OBSConverter.uwadmin_dir = 'https://raw.githubusercontent.com/Door43/d43-en/master/uwadmin'
+
+    def test_github_api(self):
+        with StandInServer(self.repos_dir, port=0, tree_limit=10, contents_limit=50) as server:
+            git_repo = server.get_repo_url('d43-en')
+
+            # the tree is too large, so the directories are listed
+            self.assertIsNone(list_repo_files(git_repo, ['obe/kt']))
+            listing = json.loads(get_url(get_api_url(git_repo) + '/contents/obe/kt'))
+            self.assertEqual(50, len(listing))
+            self.assertEqual('obe/kt/' + listing[0]['name'], listing[0]['path'])
+
+            file_name = os.path.join(self.repos_dir, 'd43-en', 'obe', 'kt', listing[0]['name'])
+            with io.open(file_name, encoding='utf-8') as f:
+                self.assertEqual(f.read(), get_url(listing[0]['download_url']))
+
+            results = json.loads(post_url(server.url + '/lib/exe/ajax.php',
+                                          {'call': 'get_door43pagequery2', 'data[requested_namespaces][]': ':en:obe',
+                                           'data[query][]': 'tag:kt'}))
+            self.assertIn('/en/obe/kt/god0', [r[0] for r in results])
+            self.assertTrue(all(r[0].startswith('/en/obe/kt/') for r in results))
+
+            self.assertEqual({'tree': 1, 'contents': 1, 'raw': 1, 'ajax': 1}, server.get_counts())
+
+    def test_rate_limit(self):
+        with StandInServer(self.repos_dir, port=0, rate_limit=2, rate_window=1) as server:
+            start = time.time()
+            for _ in range(3):
+                self.assertEqual([{'lc': 'en', 'ang': 'English', 'ld': 'ltr'}],
+                                 json.loads(get_url(server.url + '/exports/langnames.json')))
+
+            # the third request was retried once the window was over
+            self.assertGreater(time.time() - start, 0.5)
+            self.assertEqual({'catalog': 3, 'rate_limited': 1}, server.get_counts())
+
+    def test_load_test(self):
+        out_dir = os.path.join(self.temp_dir, 'out')
+        results, counts, seconds = run_load_test(self.repos_dir, ['en'], ['obs', 'tq', 'tw'], out_dir, latency=0.001)
+
+        self.assertEqual([None, None, None], [r.error for r in results])
+        # the stories, their questions, the Bible questions, and the articles with the home pages
+        self.assertEqual(52 + 50 + 400 + 202, counts['raw'])
+        self.assertEqual(1, counts['ajax'])
+        self.assertEqual(1, counts['status'])
+
+        with io.open(os.path.join(out_dir, 'en_tw', 'content', 'kt', 'home.md'), encoding='utf-8') as f:
+            self.assertIn('(https://door43.org/en/obe/kt/god0)', f.read())
+        self.assertTrue(os.path.isfile(os.path.join(out_dir, 'en_tq', 'content', 'gen', '01.md')))
+        self.assertTrue(os.path.isfile(os.path.join(out_dir, 'en_obs', 'content', '50.md')))
+
+    def test_stale_listing(self):
+        """
+        This tests that a home page that did not change is converted again when an article it lists is added
+        """
+        out_dir = os.path.join(self.temp_dir, 'out')
+        cache_dir = os.path.join(self.temp_dir, 'cache')
+
+        def convert():
+            # the stand-in builds the tree of a repository once, so each conversion gets a new server
+            with StandInServer(self.repos_dir, port=0) as server:
+                use_standin(server.url)
+                with TWConverter('en', server.get_repo_url('d43-en'), out_dir, True, cache_dir=cache_dir) as converter:
+                    converter.run()
+            return converter.metrics.report()['counters']
+
+        convert()
+        with io.open(os.path.join(self.repos_dir, 'd43-en', 'obe', 'kt', 'zeal.txt'), 'w', encoding='utf-8') as f:
+            f.write('====== zeal ======\n\n{{tag>kt}}\n')
+        counters = convert()
+
+        self.assertEqual(1, counters['page_queries.stale_listings'])
+        with io.open(os.path.join(out_dir, 'content', 'kt', 'home.md'), encoding='utf-8') as f:
+            self.assertIn('[zeal](https://door43.org/en/obe/kt/zeal)', f.read())
@@ -0,0 +1,106 @@
+from __future__ import print_function, unicode_literals
+import io
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from general_tools.file_utils import write_file
+from converters.output import DirectoryOutput
+from converters.state import ConversionState, git_blob_sha, STATE_FILE_NAME, JOURNAL_SUFFIX
+
+
+class TestConversionState(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(prefix='testState_')
+        self.kt_file = os.path.join(self.temp_dir, 'content', 'kt', 'god.md')
+        self.other_file = os.path.join(self.temp_dir, 'content', 'other', 'bread.md')
+        write_file(self.kt_file, 'God')
+        write_file(self.other_file, 'bread')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_git_blob_sha(self):
+        # the same as `git hash-object` returns
+        self.assertEqual('ce013625030ba8dba906f756967f9e9ca394464a', git_blob_sha('hello\n'))
+        self.assertEqual(git_blob_sha('é'), git_blob_sha('é'.encode('utf-8')))
+
+    def test_saved_between_runs(self):
+        state = ConversionState(DirectoryOutput(self.temp_dir), '1')
+        self.assertFalse(state.is_current('obe/kt/god.txt', 'abc'))
+        state.set('obe/kt/god.txt', 'abc', self.kt_file)
+        state.save()
+
+        self.assertTrue(os.path.isfile(os.path.join(self.temp_dir, STATE_FILE_NAME)))
+
+        state = ConversionState(DirectoryOutput(self.temp_dir), '1')
+        self.assertTrue(state.is_current('obe/kt/god.txt', 'abc'))
+        self.assertFalse(state.is_current('obe/kt/god.txt', 'def'))
+
+        # a new converter version converts everything again
+        self.assertFalse(ConversionState(DirectoryOutput(self.temp_dir), '2').is_current('obe/kt/god.txt', 'abc'))
+
+    def test_output_deleted(self):
+        state = ConversionState(DirectoryOutput(self.temp_dir), '1')
+        state.set('obe/kt/god.txt', 'abc', self.kt_file)
+        os.remove(self.kt_file)
+        self.assertFalse(state.is_current('obe/kt/god.txt', 'abc'))
+
+    def test_remove_missing(self):
+        state = ConversionState(DirectoryOutput(self.temp_dir), '1')
+        state.set('obe/kt/god.txt', 'abc', self.kt_file)
+        state.set('obe/other/bread.txt', 'def', self.other_file)
+
+        self.assertEqual(['obe/other/bread.txt'], state.remove_missing(['obe/kt/god.txt', 'obe/kt/new.txt']))
+        self.assertFalse(os.path.isfile(self.other_file))
+        self.assertTrue(os.path.isfile(self.kt_file))
+        self.assertEqual(['obe/kt/god.txt'], list(state.entries.keys()))
+
+    def test_damaged_file(self):
+        write_file(os.path.join(self.temp_dir, STATE_FILE_NAME), '{not json')
+        self.assertEqual({}, ConversionState(DirectoryOutput(self.temp_dir), '1').entries)
+
+    def test_journal_after_kill(self):
+        # the run is killed before it saves the state
+        state = ConversionState(DirectoryOutput(self.temp_dir), '1')
+        state.set('obe/kt/god.txt', 'abc', self.kt_file, data={'title': 'God'})
+        state.set('obe/other/bread.txt', 'def', self.other_file)
+        state.remove_missing(['obe/kt/god.txt'])
+
+        state = ConversionState(DirectoryOutput(self.temp_dir), '1')
+        self.assertTrue(state.is_current('obe/kt/god.txt', 'abc'))
+        self.assertEqual({'title': 'God'}, state.get_data('obe/kt/god.txt'))
+        self.assertEqual(['obe/kt/god.txt'], list(state.entries.keys()))
+
+        # the journal is in the state file once it is saved
+        journal_name = os.path.join(self.temp_dir, STATE_FILE_NAME + JOURNAL_SUFFIX)
+        self.assertTrue(os.path.isfile(journal_name))
+        state.save()
+        self.assertFalse(os.path.isfile(journal_name))
+        self.assertTrue(ConversionState(DirectoryOutput(self.temp_dir), '1').is_current('obe/kt/god.txt', 'abc'))
+
+    def test_journal_cut_short(self):
+        state = ConversionState(DirectoryOutput(self.temp_dir), '1')
+        state.set('obe/kt/god.txt', 'abc', self.kt_file)
+
+        journal_name = os.path.join(self.temp_dir, STATE_FILE_NAME + JOURNAL_SUFFIX)
+        with io.open(journal_name, 'ab') as journal:
+            journal.write(b'{"path": "obe/other/bread.txt", "ent')
+
+        # the record cut short is dropped, and the records of the next run are read
+        state = ConversionState(DirectoryOutput(self.temp_dir), '1')
+        self.assertEqual(['obe/kt/god.txt'], list(state.entries.keys()))
+        state.set('obe/other/bread.txt', 'def', self.other_file)
+
+        state = ConversionState(DirectoryOutput(self.temp_dir), '1')
+        self.assertTrue(state.is_current('obe/kt/god.txt', 'abc'))
+        self.assertTrue(state.is_current('obe/other/bread.txt', 'def'))
+
+    def test_atomic_write(self):
+        with DirectoryOutput(self.temp_dir) as output:
+            output.write_file(self.kt_file, 'God\n')
+
+        with io.open(self.kt_file, encoding='utf-8') as in_file:
+            self.assertEqual('God\n', in_file.read())
+        self.assertEqual(['god.md'], os.listdir(os.path.dirname(self.kt_file)))